@@ -0,0 +1,255 @@
+import os, re, threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# canonical street suffixes; abbreviations are expanded by normalize()
+SUFFIXES = {
+    "street": "street", "st": "street", "str": "street",
+    "avenue": "avenue", "ave": "avenue", "av": "avenue",
+    "road": "road", "rd": "road",
+    "lane": "lane", "ln": "lane",
+    "boulevard": "boulevard", "blvd": "boulevard",
+    "drive": "drive", "dr": "drive",
+    "court": "court", "ct": "court",
+    "place": "place", "pl": "place",
+    "way": "way", "platz": "platz", "strasse": "strasse",
+}
+SUFFIX_NAMES = tuple(sorted(set(SUFFIXES.values())))
+_HOUSE_NUMBER = re.compile(r"^\d+[a-z]?$")
+_PUNCT = re.compile(r"[^\w\s]")
+# words that end a street name when reading backwards from its suffix ("we live on maple street")
+_STOP = {"a", "an", "the", "on", "at", "in", "of", "to", "from", "and", "or", "near", "by", "is", "it", "its",
+         "we", "i", "im", "live", "lives", "my", "our", "their", "his", "her", "address", "corner", "number"}
+_UNIT = {"apt", "apartment", "unit", "flat", "floor", "suite", "building"}
+# everyday words one edit away from a suffix; never read as a misheard one ("the bus driver", "gas line")
+_NOT_SUFFIX = {"driver", "drives", "drove", "dive", "line", "lines", "late", "lake", "land", "lone", "lame",
+               "lanes", "plane", "plate", "places", "placed", "peace", "pace", "read", "load", "roar", "roam",
+               "roads", "broad", "count", "courts", "streets", "plat"}
+_END = ""  # trie key holding the canonical name of the street that ends at this node
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase words without punctuation, suffix abbreviations expanded ("42 Maple St." -> "42 maple street")."""
+    if not text:
+        return ""
+    t = text.lower().replace("ß", "ss").replace("'", "").replace("’", "")
+    t = re.sub(r"(\w)-(\w)", r"\1 \2", t)
+    tokens = _PUNCT.sub(" ", t).split()
+    out = []
+    for i, tok in enumerate(tokens):
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+        if tok == "number" and nxt is not None and _HOUSE_NUMBER.match(nxt):
+            continue
+        # "st johns road": st followed by more of a name is saint; parse() still reads "maple st 2nd floor"
+        if tok == "st" and nxt is not None and nxt not in _STOP and nxt not in _UNIT and not _HOUSE_NUMBER.match(nxt):
+            out.append(tok)
+            continue
+        out.append(SUFFIXES.get(tok, tok))
+    return " ".join(out)
+
+
+def _deletions(token: str) -> Set[str]:
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def one_edit(a: str, b: str) -> bool:
+    """a and b differ by at most one insertion, deletion, substitution or adjacent swap."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diff) == 1 or (len(diff) == 2 and diff[1] == diff[0] + 1
+                                  and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def _suffix(token: str, fuzzy: bool = True) -> Optional[str]:
+    """Canonical suffix for token; with fuzzy, also for a word one edit from one ("streat")."""
+    full = SUFFIXES.get(token)
+    if full is not None or not fuzzy or len(token) < 4 or token in _NOT_SUFFIX:
+        return full
+    return next((s for s in SUFFIX_NAMES if len(s) >= 4 and one_edit(token, s)), None)
+
+
+@dataclass(frozen=True)
+class Address:
+    street: str                   # canonical street with its suffix: "maple street"
+    number: Optional[str] = None
+    known: bool = False           # the street is in the gazetteer
+    fuzzy: bool = False           # matched through a misspelling or a missing suffix
+
+    @property
+    def text(self) -> str:
+        return f"{self.number} {self.street}" if self.number else self.street
+
+    @property
+    def confidence(self) -> float:
+        if self.known:
+            score = 0.95 if self.number else 0.7
+            return score - 0.05 if self.fuzzy else score
+        return 0.85 if self.number else 0.6
+
+
+class Gazetteer:
+    """
+    Street names as a token trie, plus a deletion index over their words so a word
+    one typo away is found with a few dict probes, whatever the size of the gazetteer.
+    """
+
+    def __init__(self, streets: Iterable[str] = ()):
+        self._root: Dict = {}
+        self._deletes: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        self.add_many(streets)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, street: str) -> bool:
+        node = self._root
+        for tok in normalize(street).split():
+            node = node.get(tok)
+            if node is None:
+                return False
+        return _END in node
+
+    def add(self, street: str) -> Optional[str]:
+        """Add a street (a leading house number is dropped); returns its canonical name."""
+        tokens = normalize(street).split()
+        while tokens and _HOUSE_NUMBER.match(tokens[0]):
+            tokens.pop(0)
+        if not tokens:
+            return None
+        name = " ".join(tokens)
+        with self._lock:
+            node = self._root
+            for tok in tokens:
+                node = node.setdefault(tok, {})
+                for key in _deletions(tok):
+                    self._deletes.setdefault(key, set()).add(tok)
+            if _END not in node:
+                node[_END] = name
+                self.size += 1
+        return name
+
+    def add_many(self, streets: Iterable[str]) -> int:
+        return sum(self.add(s) is not None for s in streets)
+
+    def learn(self, text: str) -> Optional[str]:
+        """Add the street of an address seen in the wild, if it reads as one ("<name> <suffix>")."""
+        found = parse(text)
+        return self.add(found.street) if found is not None else None
+
+    def load(self, path: str) -> int:
+        """One street per line; blank lines and # comments are skipped."""
+        with open(path, encoding="utf-8") as f:
+            return self.add_many(l.strip() for l in f if l.strip() and not l.lstrip().startswith("#"))
+
+    def similar(self, token: str) -> List[str]:
+        """Gazetteer words within one edit of token."""
+        cands: Set[str] = set()
+        for key in _deletions(token):
+            cands.update(self._deletes.get(key, ()))
+        return [c for c in cands if one_edit(token, c)]
+
+    def match(self, tokens: List[str], start: int) -> Optional[Tuple[int, str, bool]]:
+        """Longest street starting at tokens[start]: (end index, canonical name, fuzzy), or None."""
+        best = None
+        stack = [(self._root, start, False)]
+        while stack:
+            node, i, fuzzy = stack.pop()
+            name = node.get(_END)
+            if name is not None and i > start and (best is None or (i, not fuzzy) > (best[0], not best[2])):
+                best = (i, name, fuzzy)
+            if node is not self._root and (i == len(tokens) or _suffix(tokens[i]) is None):
+                # "on maple" for "maple street", when the gazetteer has only one maple
+                ends = [node[s][_END] for s in SUFFIX_NAMES if s in node and _END in node[s]]
+                if len(ends) == 1 and (best is None or i > best[0]):
+                    best = (i, ends[0], True)
+            if i >= len(tokens):
+                continue
+            tok = tokens[i]
+            child = node.get(tok)
+            if child is None and node is not self._root:
+                suffix = _suffix(tok)  # "streat", "avenu": a misheard suffix costs nothing
+                child = node.get(suffix) if suffix else None
+            if child is not None:
+                stack.append((child, i + 1, fuzzy))
+            if not fuzzy and len(tok) >= 4:
+                for cand in self.similar(tok):
+                    if cand != tok and cand in node:
+                        stack.append((node[cand], i + 1, True))
+        return best
+
+
+def _grammar(tokens: List[str], j: int) -> Optional[Address]:
+    """
+    An address whose suffix is tokens[j]: up to four name words before it, then an optional number.
+    A misheard suffix only counts after a house number ("42 maple streat", not "the power lane").
+    """
+    suffix = _suffix(tokens[j], fuzzy=False)
+    fuzzy = suffix is None
+    if fuzzy:
+        suffix = _suffix(tokens[j])
+    if suffix is None:
+        return None
+    i = j
+    while i > 0 and j - i < 4 and tokens[i - 1] not in _STOP and not _HOUSE_NUMBER.match(tokens[i - 1]):
+        i -= 1
+    if i == j:
+        return None
+    number = tokens[i - 1] if i > 0 and _HOUSE_NUMBER.match(tokens[i - 1]) else None
+    if fuzzy and number is None:
+        return None
+    return Address(" ".join(tokens[i:j] + [suffix]), number, fuzzy=fuzzy)
+
+
+def parse(text: str, gazetteer: Optional[Gazetteer] = None) -> Optional[Address]:
+    """The most confident address in text: a gazetteer street if one matches, else "<number> <name> <suffix>"."""
+    tokens = normalize(text).split()
+    best: Optional[Address] = None
+    for i in range(len(tokens)):
+        cands = []
+        if gazetteer is not None and gazetteer.size:
+            m = gazetteer.match(tokens, i)
+            if m is not None:
+                number = tokens[i - 1] if i > 0 and _HOUSE_NUMBER.match(tokens[i - 1]) else None
+                cands.append(Address(m[1], number, known=True, fuzzy=m[2]))
+        found = _grammar(tokens, i)
+        if found is not None:
+            cands.append(found)
+        for cand in cands:
+            if best is None or (cand.confidence, cand.known) > (best.confidence, best.known):
+                best = cand
+    return best
+
+
+def canonical(text: Optional[str], gazetteer: Optional[Gazetteer] = None) -> Optional[str]:
+    """Key under which an address is stored and looked up: the parsed address, else the normalized text."""
+    if not text:
+        return None
+    found = parse(text, gazetteer)
+    return found.text if found is not None else (normalize(text) or None)
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer() -> Gazetteer:
+    """The process-wide gazetteer, preloaded from $RESCUEHUB_STREETS (one street per line) if set."""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer()
+            path = os.getenv("RESCUEHUB_STREETS")
+            if path and os.path.exists(path):
+                _gazetteer.load(path)
+        return _gazetteer
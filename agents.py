@@ -1,12 +1,45 @@
 from dataclasses import dataclass
-from typing import Optional, Tuple
-import json
+from typing import Optional, Tuple, Iterator, List
+import asyncio
 from tools import dispatch_resources
 from memory import ConversationMemory
-from nlp import GPTClient
-from vector_memory import VectorMemory
+from nlp import GPTClient, TurnAnalysis
+from fast_nlu import FastNLU
+from address import Gazetteer, get_gazetteer, parse as parse_address
+from vector_memory import ShardedVectorMemory, get_vector_memory
+from tracing import traced
 import re
 
+# ====== Fixed prompts ======
+# Kept as constants so the TTS phrase cache can pre-render them (see STATIC_PHRASES).
+ASK_ADDRESS = "I’m sorry to hear that. Can you tell me your address?"
+ASK_INJURIES = "Thank you. Are there any injuries?"
+ESCALATING = "I'm escalating this to our medical team. Please hold."
+CONFIRM_INJURIES = "Could you please confirm — are there any injuries?"
+HOLD = "Understood. Please hold while I confirm the details."
+FIRE_STAY_SAFE = "Please stay safe until firefighters arrive."
+MEDICAL_INTRO = "I understand there’s an injury. Can you describe what happened?"
+ASK_EXACT_ADDRESS = "What is your exact address?"
+ASK_FULL_ADDRESS = "Please provide the full address (number + street)."
+MEDICAL_STAY_CALM = "Please stay calm and keep the patient safe until help arrives."
+RECALL_PROMPT = "Do you want to update it or add new information?"
+DEFAULT_QUESTION = "Can you describe the injury in more detail?"
+STATIC_PHRASES = (
+    ASK_ADDRESS,
+    ASK_INJURIES,
+    ESCALATING,
+    CONFIRM_INJURIES,
+    HOLD,
+    FIRE_STAY_SAFE,
+    MEDICAL_INTRO,
+    ASK_EXACT_ADDRESS,
+    ASK_FULL_ADDRESS,
+    MEDICAL_STAY_CALM,
+    RECALL_PROMPT,
+    DEFAULT_QUESTION,
+)
+
+
 # ====== Context ======
 @dataclass
 class Ctx:
@@ -29,21 +62,10 @@ class DynamicDispatcher:
     def __init__(self, gpt: GPTClient):
         self.gpt = gpt
 
-    def infer_incident_type(self, memory_text: str, latest_user: str) -> str:
-        reply = self.gpt.chat([
-            {"role": "system", "content": (
-                "You are RescueHub's incident classifier. "
-                "Decide the emergency type. Return only: fire, medical, or both."
-            )},
-            {"role": "user", "content": f"Context:\n{memory_text}\nCaller: {latest_user}"}
-        ])
-        r = reply.lower().strip()
-        if "both" in r:
-            return "both"
-        if "fire" in r:
-            return "fire"
-        if "medical" in r:
-            return "medical"
+    def infer_incident_type(self, analysis: TurnAnalysis) -> str:
+        """Incident type from the shared turn analysis (no extra LLM call)."""
+        if analysis.intent in ("fire", "medical", "both"):
+            return analysis.intent
         return "unknown"
 
 
@@ -55,41 +77,24 @@ class FireAgent:
         self.gpt = gpt
         self.dispatcher = dispatcher
 
-    def _analyze_injury(self, user_text: str, memory_text: str) -> Optional[bool]:
-        msg = [
-            {"role": "system", "content": (
-                "Check if the user clearly mentions any person being injured, burned, or hurt. "
-                "Reply only with one word: yes, no, or unknown.")},
-            {"role": "user", "content": f"Conversation:\n{memory_text}\nUser said: {user_text}"}
-        ]
-        try:
-            result = self.gpt.chat(msg).lower().strip()
-            if "yes" in result:
-                return True
-            if "no" in result:
-                return False
-            return None
-        except Exception:
-            return None
-
-    def handle(self, user: str, ctx: Ctx, memory: ConversationMemory) -> Tuple[str, Ctx]:
-        parsed = self.gpt.parse_user_turn(memory.get_summary(), user)
-        ctx.address = ctx.address or parsed.get("address")
+    @traced("fire.handle")
+    def handle(self, user: str, ctx: Ctx, memory: ConversationMemory, analysis: TurnAnalysis) -> Tuple[str, Ctx]:
+        ctx.address = ctx.address or analysis.address
 
         if not ctx.address:
-            return "I’m sorry to hear that. Can you tell me your address?", ctx
+            return ASK_ADDRESS, ctx
 
         ctx.had_fire = True
         if ctx.injuries is None and not ctx.escalation_done:
             ctx.escalation_done = True
-            return "Thank you. Are there any injuries?", ctx
+            return ASK_INJURIES, ctx
 
         if ctx.injuries is None and ctx.escalation_done:
-            guess = self._analyze_injury(user, memory.get_summary())
+            guess = analysis.injuries
             if guess is True:
                 ctx.injuries = True
                 ctx.active_agent = "medical"
-                return "I'm escalating this to our medical team. Please hold.", ctx
+                return ESCALATING, ctx
             elif guess is False:
                 ctx.injuries = False
                 ctx.incident_type = "fire"
@@ -97,14 +102,14 @@ class FireAgent:
                 ctx.done = True
                 return (
                     f"We’re dispatching {', '.join(res.resources)} to {ctx.address}. "
-                    "Please stay safe until firefighters arrive."
+                    + FIRE_STAY_SAFE
                 ), ctx
             else:
-                return "Could you please confirm — are there any injuries?", ctx
+                return CONFIRM_INJURIES, ctx
 
         if ctx.injuries is True:
             ctx.active_agent = "medical"
-            return "I'm escalating this to our medical team. Please hold.", ctx
+            return ESCALATING, ctx
 
         if ctx.injuries is False:
             ctx.incident_type = "fire"
@@ -112,10 +117,10 @@ class FireAgent:
             ctx.done = True
             return (
                 f"We’re dispatching {', '.join(res.resources)} to {ctx.address}. "
-                "Please stay safe until firefighters arrive."
+                + FIRE_STAY_SAFE
             ), ctx
 
-        return "Understood. Please hold while I confirm the details.", ctx
+        return HOLD, ctx
 
 
 
@@ -123,9 +128,12 @@ class FireAgent:
 class MedicalAgent:
     name = "Medical Agent"
 
-    def __init__(self, gpt: GPTClient, dispatcher: DynamicDispatcher):
+    DEFAULT_QUESTION = DEFAULT_QUESTION
+
+    def __init__(self, gpt: GPTClient, dispatcher: DynamicDispatcher, gazetteer: Optional[Gazetteer] = None):
         self.gpt = gpt
         self.dispatcher = dispatcher
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
 
     def _heuristic_check(self, text: str) -> bool:
         keywords = [
@@ -149,35 +157,12 @@ class MedicalAgent:
             return "head"
         return "other"
 
-    def _analyze_medical_context(self, memory_text: str, user_text: str) -> dict:
-        system_prompt = (
-            "You are RescueHub's medical triage AI.\n"
-            "Analyze the user's latest message about an injury.\n"
-            "Return structured JSON only like:\n"
-            "{"
-            "  \"injury_type\": \"burn | fracture | bleeding | head | other\","
-            "  \"has_enough_info\": true/false,"
-            "  \"next_question\": \"short medical question or null\""
-            "}\n\n"
-            "Rules:\n"
-            "- If user clearly describes something like 'second-degree burn', 'broken leg', or 'heavy bleeding', set has_enough_info=true.\n"
-            "- If vague ('he’s hurt', 'he’s in pain'), set has_enough_info=false and propose a follow-up.\n"
-            "- If has_enough_info=true, next_question must be null.\n"
-            "- NEVER repeat identical questions."
-        )
-        msg = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Conversation so far:\n{memory_text}\nUser said: {user_text}"}
-        ]
-        try:
-            raw = self.gpt.chat(msg)
-            data = json.loads(raw)
-        except Exception:
-            data = {
-                "injury_type": "unknown",
-                "has_enough_info": False,
-                "next_question": "Can you describe the injury in more detail?"
-            }
+    def _triage(self, analysis: TurnAnalysis, user_text: str) -> dict:
+        data = {
+            "injury_type": analysis.injury_type,
+            "has_enough_info": analysis.has_enough_info,
+            "next_question": analysis.next_question,
+        }
 
         # Heuristic override: if we detect concrete info, force enough_info
         if not data.get("has_enough_info") and self._heuristic_check(user_text):
@@ -191,51 +176,45 @@ class MedicalAgent:
 
         return data
 
-    def _extract_address_regex(self, text: str) -> Optional[str]:
-        t = text.strip()
-        street_words = r"(street|st\.?|ave(nue)?\.?|road|rd\.?|blvd\.?|lane|ln\.?|way|platz|straße|strasse)"
-        pat = rf"([A-Za-z0-9\-]+(?:\s+[A-Za-z0-9\-]+){{0,5}}\s+{street_words})\b"
-        m = re.search(pat, t, flags=re.IGNORECASE)
-        return m.group(1) if m else None
-
-    def _extract_address_llm_then_regex(self, memory_text: str, user_text: str) -> Optional[str]:
-        addr = None
-        try:
-            parsed = self.gpt.parse_user_turn(memory_text, user_text)
-            addr = (parsed or {}).get("address")
-        except Exception:
-            pass
-        if not addr:
-            addr = self._extract_address_regex(user_text)
-        return addr
-
-    def handle(self, user: str, ctx: Ctx, memory: ConversationMemory) -> Tuple[str, Ctx]:
+    def _extract_address(self, text: str) -> Optional[str]:
+        found = parse_address(text, self.gazetteer)
+        return found.text if found is not None else None
+
+    def handle(self, user: str, ctx: Ctx, memory: ConversationMemory, analysis: TurnAnalysis) -> Tuple[str, Ctx]:
+        return "".join(self.handle_stream(user, ctx, memory, analysis)), ctx
+
+    @traced("medical.handle")
+    def handle_stream(self, user: str, ctx: Ctx, memory: ConversationMemory, analysis: TurnAnalysis) -> Iterator[str]:
+        """Same flow as handle, yielding the reply in pieces as soon as they are known."""
         if isinstance(user, str) and user.strip().lower().startswith("system: follow up"):
-            return "I understand there’s an injury. Can you describe what happened?", ctx
+            yield MEDICAL_INTRO
+            return
 
         if not ctx.injury_desc and isinstance(user, str):
             ctx.injury_desc = user
 
         if not ctx.address:
-            extracted = self._extract_address_llm_then_regex(memory.get_summary(), user)
+            extracted = analysis.address or self._extract_address(user)
             if extracted:
                 ctx.address = extracted
 
         if not ctx.address:
             if not ctx.asked_address_once:
                 ctx.asked_address_once = True
-                return "What is your exact address?", ctx
+                yield ASK_EXACT_ADDRESS
             else:
-                return "Please provide the full address (number + street).", ctx
+                yield ASK_FULL_ADDRESS
+            return
 
-        analysis = self._analyze_medical_context(memory.get_summary(), user)
-        enough = analysis.get("has_enough_info", False)
-        injury_type = analysis.get("injury_type", "other")
-        next_q = analysis.get("next_question") or "Can you describe the injury in more detail?"
+        triage = self._triage(analysis, user)
+        enough = triage.get("has_enough_info", False)
+        injury_type = triage.get("injury_type", "other")
+        next_q = triage.get("next_question") or self.DEFAULT_QUESTION
 
         if not ctx.medical_probe_done:
             ctx.medical_probe_done = True
-            return next_q, ctx
+            yield next_q
+            return
 
         if enough:
             ctx.had_medical = True
@@ -243,92 +222,157 @@ class MedicalAgent:
                 ctx.incident_type = "both"
                 res = dispatch_resources(ctx.incident_type, ctx.address, injuries=True)
                 ctx.done = True
-                return (
+                yield (
                     f"Thank you. We’re dispatching {', '.join(res.resources)} to {ctx.address}. "
-                    "Please stay calm and keep the patient safe until help arrives."
-                ), ctx
+                    + MEDICAL_STAY_CALM
+                )
+                return
 
             else:
                 ctx.incident_type = "medical"
 
         if ctx.severity != "asked_followup":
             ctx.severity = "asked_followup"
-            return next_q, ctx
+            yield next_q
+            return
 
         ctx.incident_type = "medical" if ctx.active_agent == "medical" else "both"
         ctx.done = True
         res = dispatch_resources(ctx.incident_type, ctx.address, injuries=True)
-        return (
+        yield (
             f"Thank you. We’re dispatching {', '.join(res.resources)} to {ctx.address}. "
-            "Please stay calm and keep the patient safe until help arrives."
-        ), ctx
+            + MEDICAL_STAY_CALM
+        )
 
 
 # ====== Orchestrator ======
 class Orchestrator:
-    def __init__(self, gpt: GPTClient):
+    def __init__(self, gpt: GPTClient, memory_vec: Optional[ShardedVectorMemory] = None, nlu: Optional[FastNLU] = None,
+                 session: Optional[str] = None):
         self.dispatcher = DynamicDispatcher(gpt)
         self.fire = FireAgent(gpt, self.dispatcher)
         self.medical = MedicalAgent(gpt, self.dispatcher)
         self.memory = ConversationMemory()
-        self.memory_vec = VectorMemory()
+        self.memory_vec = memory_vec if memory_vec is not None else get_vector_memory()
         self.gpt = gpt
+        # local fast path; the LLM analyzes only the turns it is not confident about
+        self.nlu = nlu
+        self.call_intent: Optional[str] = None
+        # the call's storage key; its own turns are not "previous reports"
+        self.session = session
+
+    def _fast(self, summary: str, user_text: str) -> Optional[TurnAnalysis]:
+        if self.nlu is None:
+            return None
+        return self.nlu.resolve(summary, user_text, self.call_intent)
 
-    def detect_initial_agent(self, first_input: str) -> str:
-        try:
-            result = self.gpt.chat([
-                {"role": "system", "content": (
-                    "Classify this sentence as 'fire' or 'medical'. If both, choose 'fire'."
-                )},
-                {"role": "user", "content": first_input}
-            ])
-            r = result.lower()
-            if "medical" in r:
-                return "medical"
-            return "fire"
-        except Exception:
-            return "fire"
+    def _fallback(self, summary: str, user_text: str):
+        """What the agents get when the LLM is down: the local analysis, however unsure."""
+        if self.nlu is None:
+            return None
+        return lambda: self.nlu.fallback(summary, user_text, self.call_intent)
+
+    def analyze(self, user_text: str) -> TurnAnalysis:
+        """The single analysis of this turn, shared by every agent."""
+        summary = self.memory.get_summary()
+        return (self._fast(summary, user_text)
+                or self.gpt.analyze_turn(summary, user_text, fallback=self._fallback(summary, user_text)))
+
+    async def aanalyze(self, user_text: str) -> TurnAnalysis:
+        summary = self.memory.get_summary()
+        return (self._fast(summary, user_text)
+                or await self.gpt.aanalyze_turn(summary, user_text, fallback=self._fallback(summary, user_text)))
+
+    def recall_incident(self, user_text: str) -> Optional[str]:
+        """Incident type to route recall to before this turn is analysed: the call's, else a local guess."""
+        if self.call_intent is not None:
+            return self.call_intent
+        if self.nlu is not None:
+            label, _ = self.nlu.utterance_intent(user_text)
+            if label in ("fire", "medical", "both"):
+                return label
+        return None
+
+    @traced("detect_agent")
+    def detect_initial_agent(self, analysis: TurnAnalysis) -> str:
+        # a fire with injuries starts with the fire agent, which escalates to medical
+        if analysis.intent == "medical":
+            return "medical"
+        return "fire"
 
     def _is_explicit_recall_query(self, text: str) -> bool:
         t = text.lower()
         return any(k in t for k in ["remember", "previous", "last time", "earlier report"])
 
-    def step(self, user_text: str, ctx: Ctx) -> Tuple[str, Ctx]:
-        current_type = self.detect_initial_agent(user_text)
+    @staticmethod
+    def format_reply(parts: List[Tuple[str, str]]) -> str:
+        """Join streamed (speaker, piece) pairs into the "Speaker: text" lines of a turn."""
+        lines: List[List[str]] = []
+        for speaker, piece in parts:
+            if lines and lines[-1][0] == speaker:
+                lines[-1][1] += piece
+            else:
+                lines.append([speaker, piece])
+        return "\n".join(f"{speaker}: {text}" for speaker, text in lines)
+
+    def step(self, user_text: str, ctx: Ctx, analysis: Optional[TurnAnalysis] = None) -> Tuple[str, Ctx]:
+        return self.format_reply(list(self.step_stream(user_text, ctx, analysis))), ctx
+
+    def step_stream(self, user_text: str, ctx: Ctx, analysis: Optional[TurnAnalysis] = None) -> Iterator[Tuple[str, str]]:
+        """Yield (speaker, piece) as each part of the reply is ready; ctx is updated in place."""
+        # callers that already analyzed the turn (e.g. concurrently with recall) pass it in
+        if analysis is None:
+            analysis = self.analyze(user_text)
+        if analysis.intent in ("fire", "medical", "both"):
+            self.call_intent = analysis.intent
+        current_type = self.detect_initial_agent(analysis)
 
         if self._is_explicit_recall_query(user_text):
-            results, sims = self.memory_vec.search(user_text, top_k=3, return_distance=True)
             threshold = 0.80
+            results, sims = self.memory_vec.search(user_text, top_k=3, return_distance=True,
+                                                   incident=current_type, min_similarity=threshold)
             relevant = [
                 r for r, s in zip(results, sims)
                 if s > threshold and r.get("incident") == current_type
+                and (self.session is None or r.get("session") != self.session)
             ]
             if relevant:
                 reply = (
                     f"Yes, I remember your previous {current_type} report. "
-                    f"Do you want to update it or add new information?"
+                    + RECALL_PROMPT
                 )
                 self.memory.add("assistant", reply)
-                return f"RescueHub: {reply}", ctx
+                yield "RescueHub", reply
+                return
 
+        # the turn is stored once, with its reply, by whoever owns the call (CallSession.finish)
         self.memory.add("user", user_text)
-        self.memory_vec.add_memory(user_text, current_type)
 
         if ctx.active_agent is None:
             ctx.active_agent = current_type
 
         if ctx.active_agent == "fire":
-            reply, ctx = self.fire.handle(user_text, ctx, self.memory)
+            reply, ctx = self.fire.handle(user_text, ctx, self.memory, analysis)
             self.memory.add("assistant", f"Fire Agent: {reply}")
+            # the fire reply can be spoken while the medical hand-off is still being produced
+            yield self.fire.name, reply
 
             if ctx.escalation_done and ctx.active_agent == "medical":
-                med_reply, ctx = self.medical.handle("system: follow up", ctx, self.memory)
-                full = f"Fire Agent: {reply}\nMedical Agent: {med_reply}"
+                med_parts = []
+                for piece in self.medical.handle_stream("system: follow up", ctx, self.memory, analysis):
+                    med_parts.append(piece)
+                    yield self.medical.name, piece
+                full = f"Fire Agent: {reply}\nMedical Agent: {''.join(med_parts)}"
                 self.memory.add("assistant", full)
-                return full, ctx
 
         elif ctx.active_agent == "medical":
-            reply, ctx = self.medical.handle(user_text, ctx, self.memory)
-            self.memory.add("assistant", f"Medical Agent: {reply}")
-
-        return f"{ctx.active_agent.title()} Agent: {reply}", ctx
+            parts = []
+            for piece in self.medical.handle_stream(user_text, ctx, self.memory, analysis):
+                parts.append(piece)
+                yield self.medical.name, piece
+            self.memory.add("assistant", f"Medical Agent: {''.join(parts)}")
+
+    async def astep(self, user_text: str, ctx: Ctx, analysis: Optional[TurnAnalysis] = None) -> Tuple[str, Ctx]:
+        if analysis is None:
+            analysis = await self.aanalyze(user_text)
+        return await asyncio.to_thread(self.step, user_text, ctx, analysis)
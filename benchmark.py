@@ -0,0 +1,279 @@
+"""
+Offline replay benchmark: scripted transcripts (and optionally recorded WAV calls) run
+through the same CallSession pipeline as main.py, against the local mock LLM server,
+with a fresh memory store per run.
+
+    python benchmark.py --save benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json --tolerance 0.15
+    python benchmark.py --audio benchmarks/audio --latency-ms 0   # STT + local stages only
+
+Reports p50/p95/p99 per stage and per turn, LLM calls and tokens per turn, embedding
+work and memory-store I/O per turn. --compare exits non-zero on a regression.
+"""
+import os, sys, json, time, asyncio, argparse, functools, tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from mock_llm import MockConfig, start_mock_server, add_fault_args, fault_config
+
+ROOT = Path(__file__).resolve().parent
+TRANSCRIPTS = ROOT / "benchmarks" / "transcripts"
+STT_MODEL = ROOT / "models" / "vosk-model-small-en-us-0.15"
+STAGES = ("stt", "correct", "recall", "analyze", "first_reply", "respond", "persist", "turn")
+# compared against a baseline: every stage's p95 plus the whole-turn percentiles and per-turn work
+TIMING_KEYS = [f"{s}.p95_ms" for s in STAGES] + ["turn.p50_ms", "turn.p99_ms"]
+WORK_KEYS = ["llm_calls_per_turn", "tokens_per_turn", "prompt_tokens_per_call", "embedded_per_turn",
+             "store_bytes_per_turn"]
+
+
+# ====== Measurement ======
+class StageTimer:
+    """Wall-clock samples per pipeline stage, in milliseconds."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, stage: str, ms: float):
+        self.samples[stage].append(ms)
+
+    def wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, (time.perf_counter() - t0) * 1000)
+        return timed
+
+    def summary(self) -> Dict[str, dict]:
+        out = {}
+        for stage in STAGES:
+            values = self.samples.get(stage)
+            if values:
+                p50, p95, p99 = np.percentile(np.asarray(values), [50, 95, 99])
+                out[stage] = {"n": len(values), "p50_ms": round(float(p50), 2),
+                              "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2)}
+        return out
+
+
+def instrument(services, timer: StageTimer):
+    """Time the pipeline stages in place; CallSession reaches them through these attributes."""
+    services.corrector.correct = timer.wrap("correct", services.corrector.correct)
+    services.memory_mgr.recall_context = timer.wrap("recall", services.memory_mgr.recall_context)
+    services.gpt.analyze_turn = timer.wrap("analyze", services.gpt.analyze_turn)
+    services.memory_mgr.add_entry = timer.wrap("persist", services.memory_mgr.add_entry)
+
+
+def counters(services) -> Dict[str, int]:
+    llm = services.gpt.usage_report()
+    emb = services.embedder
+    vec = services.vector.io
+    inc = services.memory_mgr.incidents.io
+    return {
+        "llm_calls": llm["calls"],
+        "llm_cache_hits": llm["cache_hits"],
+        "tokens": llm["prompt_tokens"] + llm["completion_tokens"],
+        "prompts": llm["prompts"],
+        "prompt_tokens_local": llm["prompt_tokens_local"],
+        "local_analyses": services.nlu.stats["local"],
+        "hedges": llm["hedges"],
+        "llm_timeouts": llm["timeouts"],
+        "fallbacks": services.nlu.stats["fallback"] + services.corrector.stats["fallback"],
+        "summary_updates": services.memory_mgr.summaries.stats["updates"],
+        "embed_batches": emb.batches,
+        "embedded": emb.texts,
+        "vector_searches": vec["searches"],
+        "store_bytes": vec["bytes_written"],
+        "fsyncs": vec["fsyncs"],
+        "incident_lookups": inc["lookups"],
+        "incident_writes": inc["writes"],
+    }
+
+
+# ====== Replay ======
+def load_transcripts(directory: Path) -> Dict[str, List[str]]:
+    """One call per .txt file, one caller utterance per line; blank lines and # comments are skipped."""
+    calls = {}
+    for path in sorted(directory.glob("*.txt")):
+        lines = [l.strip() for l in path.read_text(encoding="utf-8").splitlines()]
+        calls[path.stem] = [l for l in lines if l and not l.startswith("#")]
+    return calls
+
+
+def audio_turns(path: Path, model_path: Path, timer: StageTimer) -> List[tuple]:
+    """Recognize a recorded call up front; each final becomes a turn. Decode time goes to the stt stage."""
+    from io_voice import VoiceListener, WavSource
+    source = WavSource(str(path))
+    listener = VoiceListener(str(model_path), source=source)
+    turns, t0 = [], time.perf_counter()
+    for hyp in listener.stream():
+        if hyp.final:
+            timer.add("stt", (time.perf_counter() - t0) * 1000)
+            turns.append((hyp.text, hyp.words))
+            t0 = time.perf_counter()
+    source.close()
+    return turns
+
+
+async def replay_call(call, turns: List[tuple], timer: StageTimer, typed: bool):
+    for user_raw, words in turns:
+        if call.done:
+            break
+        t0 = time.perf_counter()
+        turn = await call.prepare_final(user_raw, words, typed)
+
+        def respond():
+            parts, t_first = [], None
+            for part in call.reply_stream(turn):
+                if t_first is None:
+                    t_first = time.perf_counter()
+                parts.append(part)
+            return parts, t_first
+
+        t_respond = time.perf_counter()
+        parts, t_first = await asyncio.to_thread(respond)
+        timer.add("respond", (time.perf_counter() - t_respond) * 1000)
+        if t_first is not None:
+            timer.add("first_reply", (t_first - t0) * 1000)
+        await call.finish(turn, call.orch.format_reply(parts))
+        timer.add("turn", (time.perf_counter() - t0) * 1000)
+
+
+async def run(calls: Dict[str, List[tuple]], typed: bool, timer: StageTimer, persist_dir: str,
+              repeat: int = 1, concurrency: int = 1, llm: Optional[str] = None) -> dict:
+    from sessions import Services, CallSession
+    services = Services(persist_dir, llm=llm)
+    services.gpt.warm()  # a local model loads before the clock starts
+    instrument(services, timer)
+    before = counters(services)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(name: str, turns: List[tuple]):
+        async with gate:
+            await replay_call(CallSession(name, services), turns, timer, typed)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(f"{name}#{r}", turns) for r in range(repeat) for name, turns in calls.items()))
+    wall_s = time.perf_counter() - t0
+
+    services.memory_mgr.summaries.flush()  # count the summary calls this run queued
+    after = counters(services)
+    upstream = services.gpt.resilience_report()
+    services.vector.compact(background=False)
+    services.close()
+    totals = {k: after[k] - before[k] for k in after}
+    n = max(1, len(timer.samples.get("turn", [])))
+    return {
+        "calls": len(calls) * repeat,
+        "turns": n,
+        "wall_s": round(wall_s, 3),
+        "stages": timer.summary(),
+        "totals": totals,
+        "upstream": upstream,
+        "llm_calls_per_turn": round(totals["llm_calls"] / n, 3),
+        "tokens_per_turn": round(totals["tokens"] / n, 1),
+        "prompt_tokens_per_call": round(totals["prompt_tokens_local"] / max(1, totals["prompts"]), 1),
+        "embedded_per_turn": round(totals["embedded"] / n, 3),
+        "store_bytes_per_turn": round(totals["store_bytes"] / n, 1),
+    }
+
+
+# ====== Baseline ======
+def _lookup(report: dict, key: str) -> Optional[float]:
+    if "." in key:
+        stage, metric = key.split(".", 1)
+        return report["stages"].get(stage, {}).get(metric)
+    return report.get(key)
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.15, slack_ms: float = 2.0) -> List[str]:
+    """Regressions of report against baseline; timings get slack_ms of absolute headroom for noise."""
+    problems = []
+    for key in TIMING_KEYS + WORK_KEYS:
+        new, old = _lookup(report, key), _lookup(baseline, key)
+        if new is None or old is None:
+            continue
+        limit = old * (1 + tolerance) + (slack_ms if key in TIMING_KEYS else 0)
+        if new > limit:
+            problems.append(f"{key}: {old} -> {new} (limit {limit:.2f})")
+    return problems
+
+
+def print_report(report: dict):
+    print(f"{report['calls']} calls, {report['turns']} turns in {report['wall_s']}s")
+    print(f"{'stage':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<12}{row['n']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print("per turn: " + ", ".join(f"{k}={report[k]}" for k in WORK_KEYS))
+    print("totals:   " + json.dumps(report["totals"]))
+    print("upstream: " + json.dumps(report["upstream"]["breaker"]))
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Replay recorded calls through RescueHub against a mock LLM")
+    parser.add_argument("--transcripts", default=str(TRANSCRIPTS), help="directory of .txt call scripts")
+    parser.add_argument("--audio", help="directory of 16 kHz mono .wav calls (replaces --transcripts)")
+    parser.add_argument("--typed", action="store_true",
+                        help="treat transcripts as typed text (no STT correction) instead of recognizer output")
+    parser.add_argument("--stt-model", default=str(STT_MODEL))
+    parser.add_argument("--repeat", type=int, default=1, help="replay every call this many times")
+    parser.add_argument("--concurrency", type=int, default=1, help="calls replayed at once")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    add_fault_args(parser)
+    parser.add_argument("--llm-url", help="use this endpoint instead of starting the mock server")
+    parser.add_argument("--llm", choices=("remote", "local"), default="remote",
+                        help="local: run FLAN-T5 in-process instead of calling an endpoint (see local_llm.py)")
+    parser.add_argument("--persist-dir", help="memory store to use (default: a fresh temporary directory)")
+    parser.add_argument("--save", help="write the report as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", help="baseline JSON to check this run against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    server = None
+    if args.llm_url:
+        os.environ["GAPGPT_BASE_URL"] = args.llm_url
+    elif args.llm == "remote":
+        server = start_mock_server(config=MockConfig(args.latency_ms, args.jitter_ms, args.seed,
+                                                      **fault_config(args)))
+        os.environ["GAPGPT_BASE_URL"] = server.url
+        os.environ["GAPGPT_API_KEY"] = "mock"
+
+    timer = StageTimer()
+    if args.audio:
+        calls = {p.stem: audio_turns(p, Path(args.stt_model), timer) for p in sorted(Path(args.audio).glob("*.wav"))}
+        typed = False
+    else:
+        calls = {name: [(line, None) for line in lines]
+                 for name, lines in load_transcripts(Path(args.transcripts)).items()}
+        typed = args.typed
+    if not calls:
+        sys.exit("no calls to replay")
+
+    with tempfile.TemporaryDirectory(prefix="rescuehub-bench-") as tmp:
+        report = asyncio.run(run(calls, typed, timer, args.persist_dir or tmp, args.repeat, args.concurrency,
+                                 args.llm))
+    if server is not None:
+        report["mock"] = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, **server.stats}
+        server.stop()
+
+    print_report(report)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Saved {args.save}")
+    if args.compare:
+        problems = compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.tolerance)
+        for p in problems:
+            print("REGRESSION", p)
+        if problems:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    _cli()
@@ -0,0 +1,132 @@
+import base64, hashlib, queue, threading
+import numpy as np
+from concurrent.futures import Future
+from typing import List, Dict, Optional
+from cache import TieredCache, LRUCache, SqliteCache
+from tracing import span
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def normalize_text(text: str) -> str:
+    # MiniLM is uncased and whitespace-insensitive, so these variants embed identically
+    return " ".join(text.lower().split())
+
+class EmbeddingService:
+    """
+    One embedding model per process. Vectors are memoized by normalized-text hash,
+    and concurrent embed_query misses are queued so a single worker thread encodes
+    whatever has accumulated in one forward pass.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, max_batch: int = 32, max_wait_ms: float = 5.0,
+                 cache: Optional[TieredCache] = None):
+        self.model_name = model_name
+        # loaded by warm() or the first embedding that misses the cache
+        self.model = None
+        self._load_lock = threading.Lock()
+        self.cache = cache if cache is not None else TieredCache(LRUCache(max_entries=4096))
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.texts = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def warm(self) -> "EmbeddingService":
+        """Load the model now (idempotent); cached vectors never need it."""
+        with self._load_lock:
+            if self.model is None:
+                # imported here so index maintenance tools don't pull in langchain/torch
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                self.model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self
+
+    # ---------- cache ----------
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _cached(self, text: str) -> Optional[List[float]]:
+        raw = self.cache.get(self._key(text))
+        if raw is None:
+            return None
+        return np.frombuffer(base64.b64decode(raw), dtype="float32").tolist()
+
+    def _remember(self, text: str, vec: List[float]) -> List[float]:
+        # float32 either way, so a cached vector is bit-identical to a freshly computed one
+        arr = np.asarray(vec, dtype="float32")
+        self.cache.set(self._key(text), base64.b64encode(arr.tobytes()).decode("ascii"))
+        return arr.tolist()
+
+    # ---------- API ----------
+    def embed_query(self, text: str) -> List[float]:
+        with span("embed") as s:
+            vec = self._cached(text)
+            s.attrs["cached"] = vec is not None
+            if vec is not None:
+                return vec
+            fut: Future = Future()
+            self._queue.put((text, fut))
+            return fut.result()
+
+    def embed_documents(self, texts: List[str], cache: bool = True) -> List[List[float]]:
+        """
+        callers with a whole batch in hand skip the queue; only cache misses are encoded.
+        cache=False (bulk backfills) still dedupes but neither reads nor fills the cache.
+        """
+        out: List[Optional[List[float]]] = [self._cached(t) for t in texts] if cache else [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for i, vec in enumerate(out):
+            if vec is None:
+                missing.setdefault(normalize_text(texts[i]), []).append(i)
+        if missing:
+            firsts = [texts[idx[0]] for idx in missing.values()]
+            self.batches += 1
+            self.texts += len(firsts)
+            for text, idx, vec in zip(firsts, missing.values(), self.warm().model.embed_documents(firsts)):
+                vec = self._remember(text, vec) if cache else vec
+                for i in idx:
+                    out[i] = vec
+        return out
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "embedded": self.texts, "cache": self.cache.report()}
+
+    def close(self):
+        """Close the persistent cache tier; the model and the memory tier stay for later users."""
+        self.cache.close()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            try:
+                while len(pending) < self.max_batch:
+                    pending.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                vectors = self.embed_documents([text for text, _ in pending])
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(pending, vectors):
+                fut.set_result(vec)
+
+
+_services: Dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+def get_embedding_service(model_name: str = DEFAULT_MODEL, cache_path: Optional[str] = None) -> EmbeddingService:
+    """
+    The process-wide service for model_name (loaded on first use). cache_path adds a
+    persistent sqlite tier to the embedding cache when the service has none (the first call,
+    or after close()).
+    """
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name, cache=TieredCache(LRUCache(max_entries=4096)))
+        service = _services[model_name]
+        if cache_path and service.cache.disk is None:
+            service.cache.disk = SqliteCache(cache_path)
+        return service
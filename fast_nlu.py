@@ -0,0 +1,538 @@
+"""
+Local fast path for turn analysis: precompiled slot patterns plus a small naive Bayes
+intent classifier, trained at startup on a built-in seed corpus. Every slot comes with a
+confidence; the Orchestrator only calls the LLM analyzer when the weakest one is below
+the threshold. Most caller sentences are formulaic ("there's a fire in my kitchen",
+"42 Maple Street", "no one is hurt") and never need the round trip.
+
+    python fast_nlu.py benchmarks/nlu_labeled.jsonl              # accuracy + latency report
+    python fast_nlu.py benchmarks/nlu_labeled.jsonl --threshold 0.7
+"""
+import re, json, time, argparse, threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from nlp import TurnAnalysis
+from address import Gazetteer, get_gazetteer, parse as parse_address
+from tracing import span, NLU_TURNS, LLM_FALLBACKS
+
+LABELS = ("fire", "medical", "both", "other")
+KEYWORD_AGREEMENT = 0.6   # how much a matching fire/injury keyword adds to the classifier's confidence
+VAGUE_INJURY_QUESTION = "Where exactly is the injury, and is the person conscious and breathing?"
+
+# ====== Seed corpus ======
+# one caller utterance each, labeled by what that utterance alone reports
+SEED_CORPUS: Tuple[Tuple[str, str], ...] = (
+    ("there is a fire in my kitchen", "fire"),
+    ("the house is on fire", "fire"),
+    ("i see smoke coming out of the building", "fire"),
+    ("there are flames in the garage", "fire"),
+    ("my apartment is burning", "fire"),
+    ("the smoke alarm is going off and the room is full of smoke", "fire"),
+    ("a car is on fire in the street", "fire"),
+    ("the fire is spreading to the second floor", "fire"),
+    ("there was an explosion and now there is fire", "fire"),
+    ("i smell gas and there is a small fire", "fire"),
+    ("the building next door is burning", "fire"),
+    ("fire on the third floor of our building", "fire"),
+    ("the smoke is getting worse", "fire"),
+    ("the fire came back", "fire"),
+    ("there is a wildfire near our house", "fire"),
+    ("electrical fire in the basement", "fire"),
+    ("the roof is on fire", "fire"),
+    ("there is smoke everywhere", "fire"),
+    ("my neighbor's house is on fire", "fire"),
+    ("the office building is on fire", "fire"),
+    ("a pan caught fire on the stove", "fire"),
+    ("the trash bin is burning", "fire"),
+    ("black smoke is coming from the window", "fire"),
+    ("our barn is in flames", "fire"),
+    ("the fire is out of control", "fire"),
+    ("there's a fire in the bedroom", "fire"),
+    ("the curtains caught fire", "fire"),
+    ("something is burning in the hallway", "fire"),
+    ("the kitchen is full of smoke", "fire"),
+    ("fire", "fire"),
+    ("i think there is a fire upstairs", "fire"),
+    ("the fire is getting closer", "fire"),
+    ("the flames are reaching the roof", "fire"),
+    ("a gas explosion in the building", "fire"),
+    ("the forest behind our house is burning", "fire"),
+    ("the shed is on fire", "fire"),
+    ("there is a fire in the apartment below us", "fire"),
+    ("my friend fell and is hurt", "medical"),
+    ("my father collapsed", "medical"),
+    ("someone is bleeding badly", "medical"),
+    ("he broke his leg", "medical"),
+    ("she is unconscious", "medical"),
+    ("my mother has chest pain", "medical"),
+    ("he cut his hand and it won't stop bleeding", "medical"),
+    ("my son hit his head", "medical"),
+    ("she fainted", "medical"),
+    ("he is having trouble breathing", "medical"),
+    ("there was a car accident and people are injured", "medical"),
+    ("my wife is having a seizure", "medical"),
+    ("he fell off a ladder", "medical"),
+    ("she burned her hand on the stove", "medical"),
+    ("i think his arm is broken", "medical"),
+    ("he is not breathing", "medical"),
+    ("my grandmother fell down the stairs", "medical"),
+    ("someone got hurt at work", "medical"),
+    ("a child swallowed something and is choking", "medical"),
+    ("he has a deep wound on his leg", "medical"),
+    ("my husband passed out", "medical"),
+    ("there is blood everywhere", "medical"),
+    ("she twisted her ankle and can't walk", "medical"),
+    ("he was stabbed", "medical"),
+    ("i need an ambulance", "medical"),
+    ("my mom collapsed in the bathroom", "medical"),
+    ("my aunt just fainted", "medical"),
+    ("i think she broke her ankle", "medical"),
+    ("he is bleeding from his head", "medical"),
+    ("my baby is not breathing", "medical"),
+    ("someone was hit by a car", "medical"),
+    ("he won't wake up", "medical"),
+    ("she is in a lot of pain", "medical"),
+    ("my daughter cut her finger", "medical"),
+    ("an old man fell in the street", "medical"),
+    ("my husband is having a heart attack", "medical"),
+    ("he got hurt playing football", "medical"),
+    ("the house is on fire and my father is burned", "both"),
+    ("there's a fire and someone is injured", "both"),
+    ("fire in the kitchen and my wife got burned", "both"),
+    ("the building is burning and people are hurt", "both"),
+    ("smoke everywhere and my son can't breathe", "both"),
+    ("there was an explosion and several people are injured", "both"),
+    ("there is a fire and he is bleeding", "both"),
+    ("my neighbor got hurt in the fire", "both"),
+    ("a fire broke out and a man is unconscious", "both"),
+    ("the car caught fire and the driver is injured", "both"),
+    ("the apartment is on fire and my daughter has burns", "both"),
+    ("fire in the garage and my dad fell off the ladder", "both"),
+    ("there is a fire and my brother is hurt", "both"),
+    ("the kitchen is burning and my son burned his arm", "both"),
+    ("people are trapped in the fire and someone is bleeding", "both"),
+    ("there is smoke and my grandmother fainted", "both"),
+    ("fire at work and two people are injured", "both"),
+    ("it's at 42 maple street", "other"),
+    ("the address is 17 oak avenue", "other"),
+    ("yes", "other"),
+    ("no", "other"),
+    ("no one is hurt", "other"),
+    ("nobody is injured", "other"),
+    ("please hurry", "other"),
+    ("okay", "other"),
+    ("thank you", "other"),
+    ("we are outside now", "other"),
+    ("i don't know", "other"),
+    ("what should i do", "other"),
+    ("how long will it take", "other"),
+    ("we are at the corner of main and fifth", "other"),
+    ("hello", "other"),
+    ("can you hear me", "other"),
+    ("i already told you", "other"),
+    ("everyone is safe", "other"),
+    ("yes please", "other"),
+    ("i'm calling from my phone", "other"),
+    ("we all got out", "other"),
+    ("no injuries", "other"),
+    ("i live at 5 elm road", "other"),
+    ("my address is 230 river lane", "other"),
+    ("we're all fine", "other"),
+    ("nobody got hurt", "other"),
+    ("hurry up please", "other"),
+    ("is someone coming", "other"),
+    ("hello can anyone hear me", "other"),
+    ("please send help", "other"),
+    ("help me please", "other"),
+    ("the address is 9 hill drive", "other"),
+    ("25 high street", "other"),
+    ("it's on the corner near the bank", "other"),
+    ("what do i do now", "other"),
+    ("i'm scared", "other"),
+    ("they're on their way right", "other"),
+    ("we are waiting outside", "other"),
+    ("my dog ran away", "other"),
+    ("i locked myself out of my car", "other"),
+    ("everyone is out of the building", "other"),
+    ("no we are all fine", "other"),
+    ("yes there are", "other"),
+    ("i'm not sure", "other"),
+)
+
+
+# ====== Slot patterns ======
+_TOKEN = re.compile(r"[a-z0-9]+")
+_NEGATION = {"no", "not", "never", "nobody", "noone", "nothing", "without"}
+_CONTRACTION = re.compile(r"\b(can|won|ain)'t\b|n't\b|'(?:s|re|m|ve|ll|d)\b")
+_IRREGULAR = {"can": "can not", "won": "will not", "ain": "is not"}
+_CLAUSE_BREAK = {"and", "but", "so", "because"}
+_FIRE = re.compile(r"\b(fires?|smoke|smoky|flames?|burning|blaze|explosion|wildfire)\b")
+_NO_INJURY = re.compile(
+    r"\b(no ?(one|body)('s| is| was| got| has been)? (hurt|injured)|no (injur\w*|one injured)|"
+    r"(not|nobody|no one) (is |was )?(hurt|injured)|"
+    r"(everyone|everybody|we)('s| is| are|'re)? (all )?(fine|ok|okay|safe|out|alright)|we all got out)\b")
+_INJURY = re.compile(
+    r"\b(hurt|injur\w*|burn(ed|s|t)?|bleed\w*|blood|broken?|fractur\w*|unconscious|fainted|passed out|"
+    r"wound\w*|cut|can'?t breathe|not breathing|trouble breathing|collapsed|seizure|bruis\w*|swollen|"
+    r"concussion|pain|stabbed|choking|fell|hit (his|her|my|their) head|scratch\w*|won'?t wake)\b")
+_UNSURE = re.compile(r"\b(maybe|might|not sure|i think|probably|don'?t know|i guess)\b")
+_YES = re.compile(r"^(yes|yeah|yep|yup|correct|affirmative)\b")
+_NO = re.compile(r"^(no|nope|nah|negative)\b(?! (one|body))")
+_INJURY_TYPES = (
+    ("burn", re.compile(r"(first|second|third)[- ]?degree|\bburn(ed|s|t)?\b")),
+    ("fracture", re.compile(r"\b(broken?|fractur\w*)\b")),
+    ("bleeding", re.compile(r"\b(bleed\w*|blood|cut|wound\w*|laceration|stabbed)\b")),
+    ("head", re.compile(r"\b(head|concussion|unconscious|fainted|passed out)\b")),
+)
+_HIGH = re.compile(r"(second|third)[- ]?degree|\b(unconscious|not breathing|can'?t breathe|seizure|severe\w*|"
+                   r"a lot|badly|heavily|won'?t stop|broken|head|stabbed)\b")
+_LOW = re.compile(r"first[- ]?degree|\b(minor|small|little|scratch\w*|bruis\w*|slight\w*)\b")
+
+_ADDRESS_CUE = re.compile(r"\b(address|live[sd]? (at|on)|located at|corner of|house number)\b", re.I)
+_ASKED_ADDRESS = re.compile(r"\baddress\b", re.I)
+_ASKED_INJURIES = re.compile(r"\bany injuries\b", re.I)
+
+
+def _expand(m: re.Match) -> str:
+    if m.group(1):
+        return _IRREGULAR[m.group(1)]
+    return " not" if m.group(0) == "n't" else ""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; the three after a negation are marked ("not_hurt")."""
+    text = _CONTRACTION.sub(_expand, text.lower().replace("’", "'"))
+    out, negate = [], 0
+    for tok in _TOKEN.findall(text):
+        if tok in _CLAUSE_BREAK:
+            negate = 0
+        if tok in _NEGATION:
+            out.append(tok)
+            negate = 3
+            continue
+        out.append(f"not_{tok}" if negate else tok)
+        negate = max(0, negate - 1)
+    return out
+
+
+def features(text: str) -> List[str]:
+    toks = tokenize(text)
+    return toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]
+
+
+def split_dialogue(summary: str) -> List[Tuple[str, str]]:
+    """ConversationMemory.get_summary() back into (role, content) turns."""
+    turns: List[Tuple[str, str]] = []
+    for line in summary.splitlines():
+        role, sep, content = line.partition(": ")
+        if sep and role in ("user", "assistant"):
+            turns.append((role, content))
+        elif turns and line.strip():
+            turns[-1] = (turns[-1][0], f"{turns[-1][1]}\n{line}")
+    return [(role, content.strip()) for role, content in turns]
+
+
+# ====== Intent classifier ======
+class NaiveBayes:
+    """Multinomial naive Bayes over word and bigram features, with temperature-scaled posteriors."""
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self.labels: Tuple[str, ...] = ()
+        self.vocab: Dict[str, int] = {}
+        self.log_prior = np.zeros(0)
+        self.log_lik = np.zeros((0, 0))
+        self.unseen = np.zeros(0)
+        self.temperature = 1.0
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str]) -> "NaiveBayes":
+        self.labels = tuple(l for l in LABELS if l in set(labels))
+        feats = [features(t) for t in texts]
+        self.vocab = {f: i for i, f in enumerate(sorted({f for fs in feats for f in fs}))}
+        counts = np.zeros((len(self.labels), len(self.vocab)))
+        prior = np.zeros(len(self.labels))
+        for fs, label in zip(feats, labels):
+            row = self.labels.index(label)
+            prior[row] += 1
+            for f in fs:
+                counts[row, self.vocab[f]] += 1
+        totals = counts.sum(axis=1, keepdims=True) + self.alpha * (len(self.vocab) + 1)
+        self.log_prior = np.log(prior / prior.sum())
+        self.log_lik = np.log((counts + self.alpha) / totals)
+        self.unseen = np.log(self.alpha / totals[:, 0])
+        return self
+
+    def scores(self, text: str) -> Tuple[np.ndarray, float]:
+        """Unnormalized log posteriors, and the share of word tokens seen in training."""
+        feats = features(text)
+        out = self.log_prior.copy()
+        known = 0
+        words = 0
+        for f in feats:
+            idx = self.vocab.get(f)
+            if " " not in f:
+                words += 1
+                known += idx is not None
+            if idx is not None:
+                out += self.log_lik[:, idx]
+            elif " " not in f:
+                out += self.unseen
+        return out, (known / words if words else 0.0)
+
+    def proba(self, text: str) -> Tuple[Dict[str, float], float]:
+        logits, coverage = self.scores(text)
+        z = logits / self.temperature
+        p = np.exp(z - z.max())
+        p /= p.sum()
+        return dict(zip(self.labels, p.tolist())), coverage
+
+    def calibrate(self, texts: Sequence[str], labels: Sequence[str], folds: int = 5) -> float:
+        """Fit the softmax temperature on held-out folds so confidences match accuracy."""
+        held, truth = [], []
+        for k in range(folds):
+            train = [i for i in range(len(texts)) if i % folds != k]
+            test = [i for i in range(len(texts)) if i % folds == k]
+            model = NaiveBayes(self.alpha).fit([texts[i] for i in train], [labels[i] for i in train])
+            for i in test:
+                logits, _ = model.scores(texts[i])
+                row = np.full(len(self.labels), -1e9)
+                for j, label in enumerate(model.labels):
+                    row[self.labels.index(label)] = logits[j]
+                held.append(row)
+                truth.append(self.labels.index(labels[i]))
+        held_arr, truth_arr = np.asarray(held), np.asarray(truth)
+        best_t, best_nll = 1.0, float("inf")
+        for t in np.linspace(0.5, 12.0, 47):
+            z = held_arr / t
+            z -= z.max(axis=1, keepdims=True)
+            logp = z - np.log(np.exp(z).sum(axis=1, keepdims=True))
+            nll = -logp[np.arange(len(truth_arr)), truth_arr].mean()
+            if nll < best_nll:
+                best_t, best_nll = float(t), nll
+        self.temperature = best_t
+        return best_t
+
+
+# ====== Extractor ======
+@dataclass
+class FastResult:
+    analysis: TurnAnalysis
+    confidence: float                                       # the weakest slot
+    slots: Dict[str, float] = field(default_factory=dict)   # confidence per slot
+
+
+class FastNLU:
+    """
+    Resolves intent, injuries, injury type and address locally. resolve() returns the
+    analysis when every slot is at least `threshold` confident, else None (ask the LLM).
+    """
+
+    def __init__(self, threshold: float = 0.75, extra: Optional[Sequence[Tuple[str, str]]] = None,
+                 gazetteer: Optional[Gazetteer] = None):
+        self.threshold = threshold
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        corpus = list(SEED_CORPUS) + list(extra or ())
+        texts, labels = [t for t, _ in corpus], [l for _, l in corpus]
+        self.model = NaiveBayes().fit(texts, labels)
+        self.model.calibrate(texts, labels)
+        self._intent_cache: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "llm": 0, "fallback": 0}  # fallback: LLM turns answered locally anyway
+
+    # ---- slots ----
+    def utterance_intent(self, text: str) -> Tuple[str, float]:
+        key = text.strip().lower()
+        hit = self._intent_cache.get(key)
+        if hit is not None:
+            return hit
+        probs, coverage = self.model.proba(key)
+        label = max(probs, key=probs.get)
+        # mostly unfamiliar words: the posterior is little more than the prior
+        conf = probs[label] * (0.5 + 0.5 * coverage)
+        fire = bool(_FIRE.search(key))
+        medical = bool(_INJURY.search(key)) and not _NO_INJURY.search(key)
+        keyword = "both" if fire and medical else "fire" if fire else "medical" if medical else None
+        if keyword == label:
+            conf = 1 - (1 - conf) * (1 - KEYWORD_AGREEMENT)
+        with self._lock:
+            if len(self._intent_cache) > 4096:
+                self._intent_cache.clear()
+            self._intent_cache[key] = (label, conf)
+        return label, conf
+
+    def intent(self, history: Sequence[str], text: str, prior: Optional[str] = None) -> Tuple[str, float]:
+        """
+        Intent of the whole call so far: the union of what each caller utterance reported.
+        prior is the call's intent after the previous turn; given it, history is not re-read.
+        """
+        kinds, conf = set(), 1.0
+        if prior in ("fire", "medical", "both"):
+            kinds.update(("fire", "medical") if prior == "both" else (prior,))
+            history = ()
+        for i, utterance in enumerate(list(history) + [text]):
+            label, c = self.utterance_intent(utterance)
+            if i == len(history):
+                conf = min(conf, c)  # the new utterance always counts, even when it adds nothing
+            if label == "other":
+                continue
+            kinds.update(("fire", "medical") if label == "both" else (label,))
+            conf = min(conf, c)
+        if kinds == {"fire", "medical"}:
+            return "both", conf
+        return (kinds.pop() if kinds else "other"), conf
+
+    @staticmethod
+    def injuries(text: str, last_question: str) -> Tuple[Optional[bool], float]:
+        t = text.lower().strip()
+        if _NO_INJURY.search(t):
+            return False, 0.95
+        if _INJURY.search(t):
+            return True, 0.6 if _UNSURE.search(t) else 0.9
+        if _ASKED_INJURIES.search(last_question):
+            if _YES.search(t):
+                return True, 0.9
+            if _NO.search(t):
+                return False, 0.9
+            return None, 0.4  # an answer to the question we could not read
+        return None, 0.9
+
+    @staticmethod
+    def injury_detail(text: str) -> Tuple[Optional[str], Optional[str]]:
+        t = text.lower()
+        kind = next((name for name, pattern in _INJURY_TYPES if pattern.search(t)), None)
+        severity = "high" if _HIGH.search(t) else "low" if _LOW.search(t) else None
+        return kind, severity
+
+    def address(self, text: str, last_question: str) -> Tuple[Optional[str], float]:
+        found = parse_address(text, self.gazetteer)
+        if found is not None:
+            return found.text, found.confidence
+        if _ADDRESS_CUE.search(text) or _ASKED_ADDRESS.search(last_question):
+            return None, 0.4
+        return None, 0.9
+
+    # ---- turn ----
+    def analyze(self, context: str, text: str, prior_intent: Optional[str] = None) -> FastResult:
+        dialogue = split_dialogue(context)
+        history = [c for role, c in dialogue if role == "user" and c]
+        last_question = next((c for role, c in reversed(dialogue) if role == "assistant"), "")
+
+        intent, intent_conf = self.intent(history, text, prior_intent)
+        injuries, injuries_conf = self.injuries(text, last_question)
+        address, address_conf = self.address(text, last_question)
+        injury_type = severity = None
+        if injuries:
+            injury_type, severity = self.injury_detail(text)
+        enough = injury_type is not None
+        analysis = TurnAnalysis(
+            intent=intent, address=address, injuries=injuries, severity=severity,
+            injury_type=injury_type, has_enough_info=enough,
+            next_question=VAGUE_INJURY_QUESTION if injuries and not enough else None,
+        )
+        slots = {"intent": round(intent_conf, 3), "injuries": injuries_conf, "address": address_conf}
+        return FastResult(analysis, min(slots.values()), slots)
+
+    def resolve(self, context: str, text: str, prior_intent: Optional[str] = None) -> Optional[TurnAnalysis]:
+        with span("nlu") as s:
+            result = self.analyze(context, text, prior_intent)
+            local = result.confidence >= self.threshold
+            s.attrs.update(confidence=round(result.confidence, 3), local=local)
+        path = "local" if local else "llm"
+        with self._lock:
+            self.stats[path] += 1
+        NLU_TURNS.inc(path=path)
+        return result.analysis if local else None
+
+    def fallback(self, context: str, text: str, prior_intent: Optional[str] = None) -> TurnAnalysis:
+        """The local analysis whatever its confidence, for turns the LLM could not take."""
+        with self._lock:
+            self.stats["fallback"] += 1
+        LLM_FALLBACKS.inc(component="analyze")
+        return self.analyze(context, text, prior_intent).analysis
+
+    def report(self) -> dict:
+        total = self.stats["local"] + self.stats["llm"]
+        return {**self.stats, "llm_skipped_rate": round(self.stats["local"] / total, 4) if total else 0.0}
+
+
+# ====== Accuracy / latency report ======
+def _norm_address(value) -> Optional[str]:
+    if not value:
+        return None
+    return " ".join(re.sub(r"[^\w\s]", " ", str(value).lower()).split())
+
+
+def evaluate(nlu: FastNLU, rows: List[dict]) -> dict:
+    """Per-slot accuracy, coverage at the threshold, calibration and per-turn latency."""
+    slots = ("intent", "injuries", "injury_type", "address")
+    right = {s: 0 for s in slots}
+    seen = {s: 0 for s in slots}
+    covered = covered_right = 0
+    bins = np.zeros((10, 3))  # per confidence decile: n, sum of confidences, intents correct
+    latencies = []
+    for row in rows:
+        t0 = time.perf_counter()
+        result = nlu.analyze(row.get("context", ""), row["text"], row.get("prior_intent"))
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        got = result.analysis
+        ok = True
+        for s in slots:
+            if s not in row:
+                continue
+            want, have = row[s], getattr(got, s)
+            if s == "address":
+                want, have = _norm_address(want), _norm_address(have)
+            seen[s] += 1
+            right[s] += want == have
+            ok = ok and want == have
+        if "intent" in row:
+            b = min(9, int(result.slots["intent"] * 10))
+            bins[b] += (1, result.slots["intent"], got.intent == row["intent"])
+        if result.confidence >= nlu.threshold:
+            covered += 1
+            covered_right += ok
+    n = max(1, len(rows))
+    ece = float(sum(abs(b[1] - b[2]) for b in bins if b[0]) / max(1, bins[:, 0].sum()))
+    p50, p95, p99 = np.percentile(np.asarray(latencies), [50, 95, 99]) if latencies else (0, 0, 0)
+    return {
+        "rows": len(rows),
+        "threshold": nlu.threshold,
+        "temperature": round(nlu.model.temperature, 3),
+        "accuracy": {s: round(right[s] / seen[s], 3) for s in slots if seen[s]},
+        "coverage": round(covered / n, 3),                          # turns that skip the LLM
+        "accuracy_when_local": round(covered_right / covered, 3) if covered else None,
+        "intent_ece": round(ece, 3),
+        "latency_us": {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1)},
+    }
+
+
+def load_labeled(path: Path) -> List[dict]:
+    rows = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            rows.append(json.loads(line))
+    return rows
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Accuracy and latency of RescueHub's local turn analyzer")
+    parser.add_argument("labeled", help="JSONL rows: {context, prior_intent, text, intent, injuries, injury_type, address}")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--train", help="extra JSONL training rows {text, intent} added to the seed corpus")
+    args = parser.parse_args()
+
+    extra = [(r["text"], r["intent"]) for r in load_labeled(Path(args.train))] if args.train else None
+    t0 = time.perf_counter()
+    nlu = FastNLU(args.threshold, extra)
+    train_ms = (time.perf_counter() - t0) * 1000
+    report = evaluate(nlu, load_labeled(Path(args.labeled)))
+    report["train_ms"] = round(train_ms, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    _cli()
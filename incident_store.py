@@ -0,0 +1,280 @@
+import json, sqlite3, threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from tracing import traced
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def contains_words(haystack: str, needle: str) -> bool:
+    """needle occurs in haystack on word boundaries ("12 main" is not inside "112 main")."""
+    return bool(needle) and f" {needle} " in f" {haystack} "
+
+class IncidentStore:
+    """
+    Incidents in sqlite (WAL). Lookups go through an index on the normalized address
+    plus a trigram posting table, so find/upsert cost does not grow with the number
+    of incidents; history is append-only rows instead of an ever-growing JSON list.
+    Addresses passed in must already be normalized.
+    """
+
+    MAX_LOOKUP_WORDS = 12
+
+    def __init__(self, path: str = "memory_store/incidents.sqlite", legacy_json: Optional[str] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # lookup/write counters for reports and the replay benchmark
+        self.io = {"lookups": 0, "writes": 0}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS incidents (
+                seq INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                ts TEXT NOT NULL,
+                updated TEXT NOT NULL,
+                address TEXT NOT NULL,
+                incident_type TEXT,
+                injuries INTEGER,
+                injury_desc TEXT,
+                dispatched INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS incidents_address ON incidents(address);
+            CREATE INDEX IF NOT EXISTS incidents_type_ts ON incidents(incident_type, ts);
+            CREATE INDEX IF NOT EXISTS incidents_dispatched_ts ON incidents(dispatched, ts);
+            CREATE INDEX IF NOT EXISTS incidents_ts ON incidents(ts);
+
+            CREATE TABLE IF NOT EXISTS incident_history (
+                incident_seq INTEGER NOT NULL REFERENCES incidents(seq),
+                ts TEXT NOT NULL,
+                source TEXT,
+                ctx TEXT,
+                ref TEXT
+            );
+            CREATE INDEX IF NOT EXISTS history_incident ON incident_history(incident_seq);
+
+            CREATE TABLE IF NOT EXISTS address_trigrams (
+                trigram TEXT NOT NULL,
+                incident_seq INTEGER NOT NULL,
+                PRIMARY KEY (trigram, incident_seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS trigram_df (
+                trigram TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+        # stores created before history rows carried the id of what they record
+        if "ref" not in {r["name"] for r in self._conn.execute("PRAGMA table_info(incident_history)")}:
+            self._conn.execute("ALTER TABLE incident_history ADD COLUMN ref TEXT")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS history_ref ON incident_history(source, ref) "
+                           "WHERE ref IS NOT NULL")
+        self._conn.commit()
+        if legacy_json:
+            self._migrate_json(Path(legacy_json))
+
+    def _now(self) -> str:
+        return datetime.utcnow().isoformat()
+
+    # ---------- lookup ----------
+    def find(self, address: Optional[str]) -> Optional[Dict]:
+        """Most recent incident whose address contains, or is contained in, address."""
+        row = self._find_row(address)
+        return self._to_dict(row) if row is not None else None
+
+    def _find_row(self, address: Optional[str]):
+        if not address:
+            return None
+        with self._lock:
+            self.io["lookups"] += 1
+            # stored address inside the query: every word span of the query is an exact index probe
+            words = address.split()[:self.MAX_LOOKUP_WORDS]
+            spans = {" ".join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)}
+            marks = ",".join("?" * len(spans))
+            best = self._conn.execute(
+                f"SELECT * FROM incidents WHERE address IN ({marks}) ORDER BY seq DESC LIMIT 1", tuple(spans)
+            ).fetchone()
+
+            # query inside a longer stored address: probe the rarest trigram's posting list, then verify
+            grams = trigrams(address)
+            if grams:
+                marks = ",".join("?" * len(grams))
+                rare = self._conn.execute(
+                    f"SELECT trigram FROM trigram_df WHERE trigram IN ({marks}) ORDER BY df LIMIT 1", tuple(grams)
+                ).fetchone()
+                if rare is None or len(grams) > self._conn.execute(
+                        f"SELECT COUNT(*) FROM trigram_df WHERE trigram IN ({marks})", tuple(grams)).fetchone()[0]:
+                    return best  # some trigram was never stored, so no stored address contains the query
+                floor = best["seq"] if best is not None else 0
+                for row in self._conn.execute(
+                    "SELECT i.* FROM address_trigrams t JOIN incidents i ON i.seq = t.incident_seq "
+                    "WHERE t.trigram = ? AND i.seq > ? ORDER BY i.seq DESC", (rare[0], floor)
+                ):
+                    if contains_words(row["address"], address):
+                        return row
+            return best
+
+    def query(self, incident_type: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, dispatched: Optional[bool] = None, limit: int = 100) -> List[Dict]:
+        """Incidents filtered by type, ISO time window and dispatch state, newest first."""
+        where, args = [], []
+        if incident_type is not None:
+            where.append("incident_type = ?")
+            args.append(incident_type)
+        if dispatched is not None:
+            where.append("dispatched = ?")
+            args.append(int(dispatched))
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            args.append(until)
+        sql = "SELECT * FROM incidents"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, limit)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    def history(self, incident_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT h.ts, h.source, h.ctx FROM incident_history h JOIN incidents i ON i.seq = h.incident_seq "
+                "WHERE i.id = ? ORDER BY h.rowid", (incident_id,)
+            ).fetchall()
+        return [{"ts": r["ts"], "source": r["source"], "ctx": json.loads(r["ctx"] or "{}")} for r in rows]
+
+    def addresses(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT address FROM incidents WHERE address != ''")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+
+    # ---------- writes ----------
+    @traced("incident.upsert")
+    def upsert(self, address: str, incident_type: Optional[str] = None, injuries: Optional[bool] = None,
+               injury_desc: Optional[str] = None, dispatched: bool = False,
+               source: str = "agent", history_ctx: Optional[dict] = None, ref: Optional[str] = None) -> Dict:
+        """
+        Update the matching incident (or create one) and append a history row, in one transaction.
+        ref identifies what the row records (e.g. a call id): a (source, ref) already recorded is not applied again.
+        """
+        with self._lock, self._conn:
+            seq = self._recorded(source, ref)
+            if seq is None:
+                seq = self._upsert_row(self._now(), address, incident_type, injuries, injury_desc,
+                                       dispatched, source, history_ctx, ref)
+            return self._to_dict(self._conn.execute("SELECT * FROM incidents WHERE seq = ?", (seq,)).fetchone())
+
+    @traced("incident.upsert_many")
+    def upsert_many(self, items: Iterable[dict], source: str = "ingest") -> int:
+        """
+        upsert() for many incidents in a single transaction (bulk backfill). Each item has
+        upsert's keyword names plus an optional "ts" for when it happened. Returns the count
+        applied; items whose (source, ref) is already recorded are skipped, so a redone batch is a no-op.
+        """
+        n = 0
+        with self._lock, self._conn:
+            for item in items:
+                item_source = item.get("source", source)
+                if self._recorded(item_source, item.get("ref")) is not None:
+                    continue
+                self._upsert_row(item.get("ts") or self._now(), item["address"], item.get("incident_type"),
+                                 item.get("injuries"), item.get("injury_desc"), item.get("dispatched", False),
+                                 item_source, item.get("history_ctx"), item.get("ref"))
+                n += 1
+        return n
+
+    def _recorded(self, source: str, ref: Optional[str]) -> Optional[int]:
+        """seq of the incident a (source, ref) history row was already written for, if any."""
+        if ref is None:
+            return None
+        row = self._conn.execute("SELECT incident_seq FROM incident_history WHERE source = ? AND ref = ?",
+                                 (source, ref)).fetchone()
+        return row[0] if row is not None else None
+
+    def _upsert_row(self, now: str, address: str, incident_type: Optional[str], injuries: Optional[bool],
+                    injury_desc: Optional[str], dispatched: bool, source: str, history_ctx: Optional[dict],
+                    ref: Optional[str] = None) -> int:
+        # caller holds the lock and the transaction
+        self.io["writes"] += 1
+        row = self._find_row(address)
+        if row is not None:
+            sets, args = ["updated = ?"], [now]
+            if injuries is not None:
+                sets.append("injuries = ?")
+                args.append(int(bool(injuries)))
+            if injury_desc:
+                sets.append("injury_desc = ?")
+                args.append(injury_desc)
+            if incident_type and incident_type != "unknown":
+                sets.append("incident_type = ?")
+                args.append(incident_type)
+            if dispatched:
+                sets.append("dispatched = 1")
+            self._conn.execute(f"UPDATE incidents SET {', '.join(sets)} WHERE seq = ?", (*args, row["seq"]))
+            seq = row["seq"]
+        else:
+            seq = self._insert(now, address, incident_type, injuries, injury_desc or "", dispatched)
+        self._conn.execute(
+            "INSERT INTO incident_history (incident_seq, ts, source, ctx, ref) VALUES (?, ?, ?, ?, ?)",
+            (seq, now, source, json.dumps(history_ctx or {}, ensure_ascii=False), ref),
+        )
+        return seq
+
+    def _insert(self, ts: str, address: str, incident_type: Optional[str], injuries: Optional[bool],
+                injury_desc: str, dispatched: bool, incident_id: Optional[str] = None) -> int:
+        seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM incidents").fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO incidents (seq, id, ts, updated, address, incident_type, injuries, injury_desc, dispatched) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (seq, incident_id or f"inc_{seq}", ts, ts, address, incident_type,
+             None if injuries is None else int(bool(injuries)), injury_desc, int(bool(dispatched))),
+        )
+        grams = trigrams(address)
+        self._conn.executemany("INSERT OR IGNORE INTO address_trigrams (trigram, incident_seq) VALUES (?, ?)",
+                               [(g, seq) for g in grams])
+        self._conn.executemany(
+            "INSERT INTO trigram_df (trigram, df) VALUES (?, 1) ON CONFLICT(trigram) DO UPDATE SET df = df + 1",
+            [(g,) for g in grams])
+        return seq
+
+    def _migrate_json(self, legacy: Path):
+        """One-time import of the old incidents.json list."""
+        if not legacy.exists() or self.count():
+            return
+        records = json.loads(legacy.read_text(encoding="utf-8"))
+        with self._lock, self._conn:
+            for rec in records:
+                seq = self._insert(rec.get("ts") or self._now(), rec.get("address") or "", rec.get("incident_type"),
+                                   rec.get("injuries"), rec.get("injury_desc") or "", rec.get("dispatched", False),
+                                   incident_id=rec.get("id"))
+                self._conn.executemany(
+                    "INSERT INTO incident_history (incident_seq, ts, source, ctx) VALUES (?, ?, ?, ?)",
+                    [(seq, h.get("ts"), h.get("source"), json.dumps(h.get("ctx") or {}, ensure_ascii=False))
+                     for h in rec.get("history", [])],
+                )
+        legacy.rename(legacy.with_name(legacy.name + ".migrated"))
+
+    def _to_dict(self, row) -> Dict:
+        return {
+            "id": row["id"],
+            "ts": row["ts"],
+            "updated": row["updated"],
+            "address": row["address"],
+            "incident_type": row["incident_type"],
+            "injuries": None if row["injuries"] is None else bool(row["injuries"]),
+            "injury_desc": row["injury_desc"] or "",
+            "dispatched": bool(row["dispatched"]),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
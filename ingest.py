@@ -0,0 +1,264 @@
+"""
+Bulk backfill of archived call transcripts into the vector memory and the incident store.
+
+    python ingest.py archive/ --batch-size 4096 --llm-workers 8
+    python ingest.py archive/ --no-llm          # regex extraction only, no API calls
+    python ingest.py archive/ --resume          # continue from the last checkpoint
+
+Input files are *.txt (one call per file, one caller utterance per line) or *.jsonl (one
+utterance per row: {"call": id, "text": ..., "ts": optional ISO time}; consecutive rows
+with the same call id form one call). Lines are embedded in large batches without going
+through the embedding cache, incidents are extracted per call with bounded concurrency,
+and every batch is committed as one incident transaction plus one vector-log append.
+Calls whose lines are already in the vector store are never added twice, and incidents are
+recorded once per call. Lines older than the memory TTL are counted as "expired", not stored.
+"""
+import os, re, json, time, argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from address import get_gazetteer, parse as parse_address
+from fast_nlu import FastNLU
+
+INCIDENT_TYPES = ("fire", "medical", "both")
+_FIRE = re.compile(r"\b(fire|smoke|flames?|burning|explosion|gas leak)\b", re.I)
+_MEDICAL = re.compile(r"\b(hurt|injur\w*|burn(ed|s|t)?|bleed\w*|broken|fractur\w*|unconscious|wound\w*|ambulance)\b", re.I)
+_NO_INJURY = re.compile(r"\b(no ?(one|body) (is |was )?(hurt|injured)|no injur\w*)\b", re.I)
+
+
+@dataclass
+class Call:
+    path: str
+    call_id: str
+    lines: List[str] = field(default_factory=list)
+    ts: Optional[str] = None
+    end_offset: int = 0     # byte offset in path just past this call
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}#{self.call_id}"
+
+
+# ====== Reading ======
+def iter_calls(path: Path, offset: int = 0) -> Iterator[Call]:
+    """Calls of one archive file, starting at a byte offset left by a checkpoint."""
+    if path.suffix == ".txt":
+        if offset:
+            return
+        raw = path.read_bytes()
+        lines = [l.strip() for l in raw.decode("utf-8", errors="replace").splitlines()]
+        lines = [l for l in lines if l and not l.startswith("#")]
+        if lines:
+            yield Call(str(path), path.stem, lines, end_offset=len(raw))
+        return
+
+    call = None
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pos = offset
+        for raw in f:
+            pos += len(raw)
+            try:
+                row = json.loads(raw)
+            except json.JSONDecodeError:
+                continue  # a torn or corrupt line is skipped, not fatal
+            text = (row.get("text") or "").strip()
+            call_id = str(row.get("call", ""))
+            if call is not None and call.call_id != call_id:
+                yield call
+                call = None
+            if call is None:
+                call = Call(str(path), call_id, ts=row.get("ts"))
+            if text:
+                call.lines.append(text)
+            call.end_offset = pos
+    if call is not None:
+        yield call
+
+
+def archive_files(root: Path) -> List[Path]:
+    if root.is_file():
+        return [root]
+    return sorted(p for p in root.rglob("*") if p.suffix in (".txt", ".jsonl"))
+
+
+# ====== Checkpoints ======
+class Checkpoint:
+    """Per-file byte offset of the last committed call, written atomically after every batch."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.state = {"files": {}, "vector_seq": 0}
+        if path.exists():
+            self.state = json.loads(path.read_text(encoding="utf-8"))
+
+    def offset(self, file: Path) -> int:
+        entry = self.state["files"].get(str(file))
+        if entry is None:
+            return 0
+        st = file.stat()
+        if entry.get("size") is not None and st.st_size < entry["offset"]:
+            print(f"[Ingest] {file} shrank since the checkpoint; starting it over")
+            return 0
+        return entry["offset"]
+
+    def advance(self, calls: List[Call], vector_seq: int):
+        for call in calls:
+            self.state["files"][call.path] = {"offset": call.end_offset, "size": os.path.getsize(call.path)}
+        self.state["vector_seq"] = vector_seq
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+# ====== Extraction ======
+def local_extract(call: Call) -> Dict:
+    """Keyword/regex extraction, for archives too large (or too sensitive) for the API."""
+    text = "\n".join(call.lines)
+    fire, medical = bool(_FIRE.search(text)), bool(_MEDICAL.search(text))
+    address = parse_address(text, get_gazetteer())
+    injuries = False if _NO_INJURY.search(text) else (True if medical else None)
+    return {
+        "address": address.text if address else None,
+        "incident_type": "both" if fire and medical else "fire" if fire else "medical" if medical else "unknown",
+        "injuries": injuries,
+        "injury_type": FastNLU.injury_detail(text)[0] if injuries else None,
+    }
+
+
+def llm_extract(gpt, call: Call) -> Dict:
+    analysis = gpt.analyze_turn("", "\n".join(call.lines))
+    if analysis.intent is None and analysis.address is None:
+        return local_extract(call)  # the request failed; don't lose the call
+    return {
+        "address": analysis.address,
+        "incident_type": analysis.intent if analysis.intent in INCIDENT_TYPES else "unknown",
+        "injuries": analysis.injuries,
+        "injury_type": analysis.injury_type,
+    }
+
+
+# ====== Pipeline ======
+class Ingestor:
+    def __init__(self, memory_mgr, gpt=None, batch_size: int = 4096, llm_workers: int = 8,
+                 checkpoint: Optional[Checkpoint] = None):
+        self.memory_mgr = memory_mgr
+        self.gpt = gpt
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self._pool = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="ingest-llm") if gpt else None
+        self.stats = {"calls": 0, "lines": 0, "incidents": 0, "skipped": 0, "expired": 0,
+                      "embed_s": 0.0, "extract_s": 0.0, "commit_s": 0.0}
+
+    def _batches(self, files: List[Path], committed: set) -> Iterator[List[Call]]:
+        batch, lines = [], 0
+        for file in files:
+            offset = self.checkpoint.offset(file) if self.checkpoint else 0
+            for call in iter_calls(file, offset):
+                if call.key in committed:
+                    self.stats["skipped"] += 1
+                    continue
+                batch.append(call)
+                lines += len(call.lines)
+                if lines >= self.batch_size:
+                    yield batch
+                    batch, lines = [], 0
+        if batch:
+            yield batch
+
+    def _committed_after_checkpoint(self) -> set:
+        # rows appended by a batch whose checkpoint was never written (crash in between)
+        vector = self.memory_mgr.vector
+        start = self.checkpoint.state.get("vector_seq", 0) if self.checkpoint else vector.seq
+        return {r.get("source") for r in vector.records(start) if r.get("source")}
+
+    def run(self, files: List[Path]) -> Dict:
+        vector = self.memory_mgr.vector
+        t_start = time.perf_counter()
+        for calls in self._batches(files, self._committed_after_checkpoint()):
+            # LLM extraction runs on the pool while this thread embeds the batch
+            t0 = time.perf_counter()
+            extracted = self._pool.map(lambda c: llm_extract(self.gpt, c), calls) if self._pool else None
+            texts, meta = [], []
+            for call in calls:
+                for i, line in enumerate(call.lines):
+                    texts.append(line)
+                    meta.append({"source": call.key, "line": i, **({"ts": call.ts} if call.ts else {})})
+            vectors = vector.model.embed_documents(texts, cache=False)
+            t1 = time.perf_counter()
+            infos = list(extracted) if extracted is not None else [local_extract(c) for c in calls]
+            t2 = time.perf_counter()
+
+            # incidents first: if we die before the vector append, a resume redoes the whole batch;
+            # history rows are keyed by call, so incidents already upserted are not applied twice
+            items = [{**info, "ts": call.ts, "ref": call.key, "history_ctx": {"call": call.key, **info}}
+                     for call, info in zip(calls, infos) if info.get("address")]
+            self.stats["incidents"] += self.memory_mgr.upsert_incidents(items)
+            types = {call.key: info["incident_type"] for call, info in zip(calls, infos)}
+            stored = self.memory_mgr.add_entries(texts, [types[m["source"]] for m in meta], vectors=vectors, meta=meta)
+            if stored < len(texts):
+                print(f"[Ingest] {len(texts) - stored} lines older than the memory TTL were not stored "
+                      f"(set RESCUEHUB_MEMORY_TTL_DAYS to keep them)")
+                self.stats["expired"] += len(texts) - stored
+            if self.checkpoint:
+                self.checkpoint.advance(calls, vector.seq)
+            t3 = time.perf_counter()
+
+            self.stats["calls"] += len(calls)
+            self.stats["lines"] += len(texts)
+            self.stats["embed_s"] += t1 - t0
+            self.stats["extract_s"] += t2 - t1  # time still waiting on extraction after embedding
+            self.stats["commit_s"] += t3 - t2
+            rate = self.stats["lines"] / max(1e-9, time.perf_counter() - t_start)
+            print(f"[Ingest] {self.stats['calls']} calls, {self.stats['lines']} lines ({rate:,.0f} lines/s)")
+
+        vector.compact(background=False)
+        self.stats["seconds"] = round(time.perf_counter() - t_start, 3)
+        for k in ("embed_s", "extract_s", "commit_s"):
+            self.stats[k] = round(self.stats[k], 3)
+        return self.stats
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Backfill archived call transcripts into RescueHub's memory")
+    parser.add_argument("archive", help="a transcript file or a directory of .txt/.jsonl files")
+    parser.add_argument("--persist-dir", default="memory_store")
+    parser.add_argument("--batch-size", type=int, default=4096, help="lines embedded and committed together")
+    parser.add_argument("--llm-workers", type=int, default=8, help="concurrent extraction requests")
+    parser.add_argument("--no-llm", action="store_true", help="extract incidents with local regexes only")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <persist-dir>/ingest.checkpoint.json)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint instead of restarting")
+    args = parser.parse_args()
+
+    from nlp import GPTClient
+    from memory_manager import MemoryManager
+    from vector_memory import get_vector_memory
+
+    ckpt_path = Path(args.checkpoint or Path(args.persist_dir) / "ingest.checkpoint.json")
+    if ckpt_path.exists() and not args.resume:
+        ckpt_path.unlink()
+    checkpoint = Checkpoint(ckpt_path)
+
+    gpt = None if args.no_llm else GPTClient(pool_size=args.llm_workers)
+    vector = get_vector_memory(args.persist_dir)
+    vector.model.warm()
+    memory_mgr = MemoryManager(gpt, persist_dir=args.persist_dir, vector=vector)
+    ingestor = Ingestor(memory_mgr, gpt, args.batch_size, args.llm_workers, checkpoint)
+    try:
+        stats = ingestor.run(archive_files(Path(args.archive)))
+    finally:
+        ingestor.close()
+        memory_mgr.close()
+        vector.close()
+        if gpt is not None:
+            gpt.close()
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    _cli()
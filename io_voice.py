@@ -1,33 +1,459 @@
-import os, json, pyttsx3, pyaudio
-from vosk import Model, KaldiRecognizer
+import os, re, json, time, wave, queue, difflib, hashlib, itertools, threading
+import numpy as np
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+from tracing import traced, record_span, current_span
+from startup import LazyModule
 
-_engine = pyttsx3.init()
-_engine.setProperty("rate", 185)
+# native audio/speech libraries load on first use, not when this module is imported
+pyttsx3 = LazyModule("pyttsx3")
+pyaudio = LazyModule("pyaudio")
+vosk = LazyModule("vosk")
 
-def speak_tts(text):
+# sentence end: terminal punctuation (plus closing quotes/brackets) followed by whitespace, or a newline
+_SENTENCE_END = re.compile(r"[.!?]+[\"'”’)\]]*\s+|\n+")
+_WORD = re.compile(r"[a-z0-9']+")
+
+def iter_sentences(chunks: Iterable[str]) -> Iterator[str]:
+    """Re-cut a stream of text pieces into whole sentences, emitting each as soon as it ends."""
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            m = _SENTENCE_END.search(buf)
+            if not m:
+                break
+            sentence, buf = buf[:m.end()].strip(), buf[m.end():]
+            if sentence:
+                yield sentence
+    if buf.strip():
+        yield buf.strip()
+
+
+# ====== TTS worker ======
+class TTSWorker:
+    """
+    Speaks on a background thread so the caller can keep listening and processing.
+    Utterances are queued sentence by sentence; cancel() drops everything queued and
+    stops the current sentence (barge-in). Sentences rendered by prerender() are
+    played from cached WAV files instead of being synthesized again.
+    """
+
+    SPEAK, RENDER = 0, 1  # queue priorities: speech always goes before background rendering
+
+    def __init__(self, rate: int = 185, cache_dir: str = "memory_store/tts_cache", echo_tail: float = 0.5,
+                 echo_match: float = 0.8):
+        self.rate = rate
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # room echo outlasts playback a little; within that tail a capture still counts as "during"
+        self.echo_tail = echo_tail
+        self.echo_match = echo_match
+        self._jobs: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._cancel = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._recent: deque = deque(maxlen=8)  # (started, finished, words) of recently spoken sentences
+        self.current: Optional[str] = None
+        self._current_started = 0.0
+        self.stats = {"spoken": 0, "cached": 0, "cancelled": 0, "rendered": 0}
+        self.first_spoken: Optional[float] = None  # perf_counter() when the first sentence started
+        self._ready = threading.Event()
+        self._init_error: Optional[Exception] = None
+        threading.Thread(target=self._run, name="tts-worker", daemon=True).start()
+
+    def warm(self, timeout: Optional[float] = None) -> "TTSWorker":
+        """Block until the speech engine is up (it initializes on the worker thread)."""
+        if not self._ready.wait(timeout):
+            raise TimeoutError("TTS engine still initializing")
+        if self._init_error is not None:
+            raise self._init_error
+        return self
+
+    # ---------- API ----------
+    def say(self, text: str):
+        for sentence in iter_sentences([text]):
+            self._put(self.SPEAK, sentence)
+
+    def prerender(self, phrases: Iterable[str]):
+        """Render fixed prompts to WAV in the background (sentence by sentence, like playback)."""
+        for phrase in phrases:
+            for sentence in iter_sentences([phrase]):
+                if not self._wav_path(sentence).exists():
+                    self._put(self.RENDER, sentence)
+
+    def cancel(self):
+        """Barge-in: stop the current sentence and drop queued speech (rendering jobs are kept)."""
+        kept = []
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job[0] == self.RENDER:
+                kept.append(job)
+            else:
+                self._done_one()
+        for job in kept:
+            self._jobs.put(job)
+        if self.current is not None:
+            self._cancel.set()
+            self.stats["cancelled"] += 1
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until all queued speech has been played."""
+        return self._idle.wait(timeout)
+
+    @property
+    def speaking(self) -> bool:
+        return not self._idle.is_set()
+
+    def is_echo(self, heard: str, at: Optional[float] = None) -> bool:
+        """
+        True if heard text is the microphone picking up our own speech: it was captured (from
+        time.monotonic() `at`, default now) while a sentence was playing, and it repeats that
+        playback nearly word for word, in order. Answers that merely reuse the question's words
+        ("yes there are injuries" after "Are there any injuries?") are kept.
+        """
+        words = _WORD.findall(heard.lower())
+        if not words:
+            return False
+        at = time.monotonic() if at is None else at
+        played: List[str] = []
+        for started, finished, ws in list(self._recent):
+            if started <= at + self.echo_tail and at <= finished + self.echo_tail:
+                played += ws
+        current, started = self.current, self._current_started
+        if current is not None and started <= at + self.echo_tail:
+            played += _WORD.findall(current.lower())
+        if not played:
+            return False
+        matcher = difflib.SequenceMatcher(None, words, played, autojunk=False)
+        in_order = sum(block.size for block in matcher.get_matching_blocks())
+        return in_order / len(words) >= self.echo_match
+
+    # ---------- internals ----------
+    def _put(self, priority: int, sentence: str):
+        if self._init_error is not None:
+            return  # no speech engine on this machine; text output still works
+        if priority == self.SPEAK:
+            with self._pending_lock:
+                self._pending += 1
+                self._idle.clear()
+        # the caller's span goes along so playback shows up in the turn's trace
+        self._jobs.put((priority, next(self._seq), sentence, time.monotonic(), current_span()))
+
+    def _done_one(self):
+        with self._pending_lock:
+            self._pending = max(0, self._pending - 1)
+            if self._pending == 0:
+                self._idle.set()
+
+    def _wav_path(self, sentence: str) -> Path:
+        key = hashlib.sha1(f"{self.rate}\0{sentence}".encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.wav"
+
+    def _run(self):
+        # pyttsx3 engines are not thread-safe: create and use this one only on the worker thread
+        try:
+            self._engine = pyttsx3.init()
+            self._engine.setProperty("rate", self.rate)
+            self._engine.connect("started-word", self._on_word)
+        except Exception as e:
+            print(f"[TTS Error] {e}")
+            self._init_error = e
+            with self._pending_lock:  # nothing queued so far will ever be spoken
+                self._pending = 0
+                self._idle.set()
+            self._ready.set()
+            return
+        # cached phrases need an output stream; without one pyttsx3 still speaks them directly
+        try:
+            self._pa = pyaudio.PyAudio()
+        except Exception as e:
+            print(f"[TTS] no audio output for cached phrases, synthesizing instead: {e}")
+            self._pa = None
+        self._ready.set()
+        while True:
+            priority, _, sentence, queued, parent = self._jobs.get()
+            if priority == self.RENDER:
+                if self._pa is not None:
+                    self._render(sentence)
+                continue
+            self._cancel.clear()
+            started, cached = time.monotonic(), False
+            self._current_started = started
+            self.current = sentence
+            if self.first_spoken is None:
+                self.first_spoken = time.perf_counter()
+            try:
+                wav = self._wav_path(sentence)
+                cached = self._pa is not None and wav.exists() and self._play(wav)
+                if not cached:
+                    self._engine.say(sentence)
+                    self._engine.runAndWait()
+                self.stats["spoken"] += 1
+            except Exception as e:
+                print(f"[TTS Error] {e}")
+            finally:
+                now = time.monotonic()
+                record_span("tts", now - started, parent=parent, chars=len(sentence), cached=cached,
+                            cancelled=self._cancel.is_set(), queued_ms=round((started - queued) * 1000, 1))
+                self._recent.append((started, now, _WORD.findall(sentence.lower())))
+                self.current = None
+                self._done_one()
+
+    def _on_word(self, name, location, length):
+        if self._cancel.is_set():
+            self._engine.stop()
+
+    def _render(self, sentence: str):
+        wav = self._wav_path(sentence)
+        if wav.exists():
+            return
+        tmp = wav.with_suffix(".tmp.wav")
+        try:
+            self._engine.save_to_file(sentence, str(tmp))
+            self._engine.runAndWait()
+            with wave.open(str(tmp), "rb"):
+                pass  # some drivers write other formats; only keep real WAV files
+            os.replace(tmp, wav)
+            self.stats["rendered"] += 1
+        except Exception:
+            tmp.unlink(missing_ok=True)
+
+    def _play(self, wav: Path) -> bool:
+        try:
+            with wave.open(str(wav), "rb") as wf:
+                out = self._pa.open(format=self._pa.get_format_from_width(wf.getsampwidth()),
+                                    channels=wf.getnchannels(), rate=wf.getframerate(), output=True)
+                try:
+                    # small chunks so a barge-in stops playback within ~30 ms
+                    chunk = max(256, wf.getframerate() // 32)
+                    data = wf.readframes(chunk)
+                    while data and not self._cancel.is_set():
+                        out.write(data)
+                        data = wf.readframes(chunk)
+                finally:
+                    out.stop_stream()
+                    out.close()
+        except (wave.Error, OSError):
+            wav.unlink(missing_ok=True)
+            return False
+        self.stats["cached"] += 1
+        return True
+
+
+_tts: Optional[TTSWorker] = None
+_tts_lock = threading.Lock()
+
+def get_tts() -> TTSWorker:
+    global _tts
+    with _tts_lock:
+        if _tts is None:
+            _tts = TTSWorker()
+        return _tts
+
+@traced("speak_tts")
+def speak_tts(text, wait: bool = True):
     if not text.strip():
         return
-    _engine.say(text)
-    _engine.runAndWait()
+    tts = get_tts()
+    tts.say(text)
+    if wait:
+        tts.wait()
+
+def speak_tts_stream(chunks: Iterable[str], wait: bool = False) -> str:
+    """Queue a streamed reply sentence by sentence while the rest is still being produced."""
+    tts = get_tts()
+    spoken = []
+    for sentence in iter_sentences(chunks):
+        tts.say(sentence)
+        spoken.append(sentence)
+    if wait:
+        tts.wait()
+    return " ".join(spoken)
+
+
+# ====== STT ======
+@dataclass
+class Hypothesis:
+    text: str
+    final: bool
+    stable: bool = False  # partial unchanged for stable_ms: good enough to start work on speculatively
+    words: List[Tuple[str, float]] = field(default_factory=list)  # (word, confidence), finals only
+
+class WavSource:
+    """
+    A recorded 16 kHz mono 16-bit WAV that reads like the microphone stream, for offline replay.
+    With realtime, reads are paced to the audio clock; read() returns b"" once the file is done.
+    """
+
+    def __init__(self, path: str, realtime: bool = False):
+        self.path = path
+        self.realtime = realtime
+        self._wav = wave.open(path, "rb")
+        if (self._wav.getframerate(), self._wav.getnchannels(), self._wav.getsampwidth()) != (16000, 1, 2):
+            raise ValueError(f"{path}: expected 16 kHz mono 16-bit PCM")
+        self._t0 = None
+        self._sent = 0
+
+    def read(self, frames: int, exception_on_overflow: bool = False) -> bytes:
+        data = self._wav.readframes(frames)
+        if self.realtime and data:
+            if self._t0 is None:
+                self._t0 = time.monotonic()
+            self._sent += len(data) // 2
+            ahead = self._sent / 16000 - (time.monotonic() - self._t0)
+            if ahead > 0:
+                time.sleep(ahead)
+        return data
+
+    def close(self):
+        self._wav.close()
+
 
 class VoiceListener:
-    def __init__(self, model_path: str):
+    """
+    Streaming Vosk listener. stream() yields partial and final hypotheses; an utterance
+    is closed either by Kaldi's own endpointer or by silence_ms of audio below the
+    voice-activity threshold after speech was heard.
+    """
+
+    RATE = 16000
+
+    def __init__(self, model_path: str, chunk_ms: int = 100, silence_ms: int = 700,
+                 energy_threshold: float = 400.0, stable_ms: int = 300, max_utterance_s: float = 20.0,
+                 source=None):
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Vosk model not found: {model_path}")
         print("🎧 Using Vosk model:", model_path)
-        self.model = Model(model_path)
-        self.rec = KaldiRecognizer(self.model, 16000)
+        self.model_path = model_path
+        # the model is loaded by warm() (e.g. in the background while the greeting plays)
+        self.model = None
+        self.rec = None
+        self._load_lock = threading.Lock()
+        self.chunk_ms = chunk_ms
+        self.silence_ms = silence_ms
+        self.energy_threshold = energy_threshold
+        self.stable_ms = stable_ms
+        self.max_utterance_ms = max_utterance_s * 1000
+        self.last_words: List[Tuple[str, float]] = []
+        if source is not None:
+            # anything with read(frames, exception_on_overflow), e.g. a WavSource
+            self.stream_in = source
+            return
         self.pa = pyaudio.PyAudio()
-        self.stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=16000,
-                                   input=True, frames_per_buffer=8000)
-        self.stream.start_stream()
+        self.stream_in = self.pa.open(format=pyaudio.paInt16, channels=1, rate=self.RATE,
+                                      input=True, frames_per_buffer=8000)
+        self.stream_in.start_stream()
+
+    def warm(self) -> "VoiceListener":
+        """Load the Vosk model and recognizer; safe to call from several threads."""
+        with self._load_lock:
+            if self.rec is None:
+                self.model = vosk.Model(self.model_path)
+                rec = vosk.KaldiRecognizer(self.model, self.RATE)
+                rec.SetWords(True)  # per-word confidences on final results
+                self.rec = rec
+        return self
+
+    def _voiced(self, data: bytes, noise: float) -> Tuple[bool, float]:
+        """Energy VAD with a slowly adapting noise floor; returns (voiced, new_noise_floor)."""
+        samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+        voiced = rms >= max(self.energy_threshold, noise * 3.0)
+        if not voiced:
+            noise = 0.95 * noise + 0.05 * rms
+        return voiced, noise
+
+    def stream(self, tts: Optional[TTSWorker] = None, barge_in_words: int = 2) -> Iterator[Hypothesis]:
+        """
+        Endless hypotheses from the microphone (a finite source ends the stream once it
+        runs dry). With tts, speech that is not our own echo interrupts playback once a
+        partial has barge_in_words words, and finals that are an echo are dropped.
+        """
+        self.warm()
+        frames = self.RATE * self.chunk_ms // 1000
+        noise, heard, silence, elapsed = 0.0, False, 0, 0
+        partial, partial_ms, stable_sent = "", 0, False
+        # wall clock of the utterance's first and latest voiced chunk, for the stt span
+        t_start = t_voice = None
+
+        def reset():
+            nonlocal heard, silence, elapsed, partial, partial_ms, stable_sent, t_start, t_voice
+            heard, silence, elapsed, partial, partial_ms, stable_sent = False, 0, 0, "", 0, False
+            t_start = t_voice = None
+
+        def trace(text: str):
+            if t_start is not None:
+                now = time.monotonic()
+                record_span("stt", now - t_start, words=len(text.split()),
+                            endpoint_ms=round((now - t_voice) * 1000, 1))
 
-    def listen_once(self):
-        print("🎤 Speak now...")
         while True:
-            data = self.stream.read(4000, exception_on_overflow=False)
+            data = self.stream_in.read(frames, exception_on_overflow=False)
+            if not data:
+                result = json.loads(self.rec.FinalResult())
+                self.rec.Reset()
+                if result.get("text"):
+                    trace(result["text"])
+                    words = [(w.get("word", ""), float(w.get("conf", 1.0))) for w in result.get("result", [])]
+                    yield Hypothesis(result["text"], final=True, words=words)
+                return
+            voiced, noise = self._voiced(data, noise)
+            heard = heard or voiced
+            if voiced:
+                t_voice = time.monotonic()
+                t_start = t_start or t_voice
+            silence = 0 if voiced else silence + self.chunk_ms
+            elapsed += self.chunk_ms if heard else 0
+
+            result = None
             if self.rec.AcceptWaveform(data):
-                text = json.loads(self.rec.Result()).get("text", "")
+                result = json.loads(self.rec.Result())
+            elif heard and (silence >= self.silence_ms or elapsed >= self.max_utterance_ms):
+                # our own endpointing: don't wait for Kaldi's (longer) default trailing silence
+                result = json.loads(self.rec.FinalResult())
+                self.rec.Reset()
+
+            if result is not None:
+                text = result.get("text", "")
                 if text:
-                    print("🗣 You:", text)
-                    return text
+                    trace(text)
+                captured = t_start
+                reset()
+                if text and not (tts is not None and tts.is_echo(text, captured)):
+                    words = [(w.get("word", ""), float(w.get("conf", 1.0))) for w in result.get("result", [])]
+                    yield Hypothesis(text, final=True, words=words)
+                continue
+
+            current = json.loads(self.rec.PartialResult()).get("partial", "")
+            if not current:
+                continue
+            if current != partial:
+                partial, partial_ms, stable_sent = current, 0, False
+                if tts is not None and tts.speaking and len(current.split()) >= barge_in_words \
+                        and not tts.is_echo(current, t_start):
+                    tts.cancel()
+                yield Hypothesis(current, final=False)
+            else:
+                partial_ms += self.chunk_ms
+                if partial_ms >= self.stable_ms and not stable_sent:
+                    stable_sent = True
+                    yield Hypothesis(current, final=False, stable=True)
+
+    @traced("listen")
+    def listen_once(self, tts: Optional[TTSWorker] = None, barge_in_words: int = 2):
+        """Block until a final transcript; its word confidences are left in last_words."""
+        print("🎤 Speak now...")
+        for hyp in self.stream(tts, barge_in_words):
+            if hyp.final:
+                print("🗣 You:", hyp.text)
+                self.last_words = hyp.words
+                return hyp.text
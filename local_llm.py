@@ -0,0 +1,416 @@
+"""
+Local LLM backend: google/flan-t5-small on the CPU behind GPTClient's interface, so the stack
+runs without a network route to the API (air-gapped sites) and without its round trip.
+
+    python main.py --use-ai                                   # or RESCUEHUB_LLM=local
+    python local_llm.py bench --concurrency 1 4 16            # local vs remote (the mock server by default)
+    python local_llm.py bench --llm-url https://... --requests 128
+
+The model's Linear layers are quantized to int8 (dynamic quantization). One engine serves every
+session: requests from concurrent calls are queued and run as one padded generate() batch.
+"""
+import os, re, sys, json, time, queue, asyncio, argparse, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from nlp import GPTClient, TurnAnalysis, SEVERITIES, INJURY_TYPES
+from prompts import PromptBuilder
+from resilience import LatencyTracker, CircuitBreaker
+from startup import LazyModule
+from tracing import traced
+
+torch = LazyModule("torch")
+transformers = LazyModule("transformers")
+
+DEFAULT_MODEL = os.getenv("RESCUEHUB_LOCAL_MODEL", "google/flan-t5-small")
+MAX_INPUT_TOKENS = 512  # T5's training context; longer inputs lose their oldest context
+
+# FLAN-T5 cannot write JSON (its vocabulary has no braces), so analysis asks one short question
+# per field. Each question is a constant system prompt, tokenized once by the engine.
+FIELD_QUESTIONS = {
+    "intent": "Read the emergency call. Is it about a fire, a medical emergency, both, or something else? "
+              "Answer fire, medical, both or other.",
+    "address": "Read the emergency call. What is the street address of the emergency? "
+               "Answer with the address, or none.",
+    "injuries": "Read the emergency call. Is anyone injured, burned or hurt? Answer yes, no or unknown.",
+    "severity": "Read the emergency call. Is the injury severe? Answer high, low or unknown.",
+    "injury_type": "Read the emergency call. What kind of injury is it? "
+                   "Answer burn, fracture, bleeding, head, other or none.",
+}
+ANALYZE_FIELDS = ("intent", "address", "injuries", "severity", "injury_type")
+FIELD_BUDGET = 384
+FIELD_TOKENS = 16
+
+
+# ====== Engine ======
+@dataclass
+class _Request:
+    ids: List[int]
+    max_new_tokens: int
+    future: Future = field(default_factory=Future)
+
+
+class Seq2SeqEngine:
+    """
+    One quantized FLAN-T5 shared by every session. A single worker takes whatever is queued
+    (up to max_batch, waiting at most max_wait_ms for company), groups it by max_new_tokens and
+    runs one generate() per group. System prompts are tokenized once and their ids reused;
+    the encoder itself attends both ways, so only the tokenization of a prefix can be shared.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, max_batch: int = 16, max_wait_ms: float = 5.0,
+                 quantize: bool = True, threads: Optional[int] = None,
+                 max_input_tokens: int = MAX_INPUT_TOKENS, prefix_cache: int = 256):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.quantize = quantize
+        self.threads = threads
+        self.max_input_tokens = max_input_tokens
+        self.prefix_cache = prefix_cache
+        self._tokenizer = None
+        self._model = None
+        self._worker: Optional[threading.Thread] = None
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._prefixes: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0, "input_tokens": 0, "output_tokens": 0,
+                      "padding": 0, "prefix_hits": 0, "prefix_misses": 0, "generate_s": 0.0, "load_s": 0.0}
+
+    # ---------- loading ----------
+    def load(self):
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            t0 = time.perf_counter()
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name)
+            model = transformers.AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+            model.eval()
+            if self.quantize:
+                # int8 weights for every Linear; activations are quantized per batch at run time
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._tokenizer, self._model = tokenizer, model
+            self._worker = threading.Thread(target=self._run, name="local-llm", daemon=True)
+            self._worker.start()
+            self.stats["load_s"] = round(time.perf_counter() - t0, 3)
+
+    def warm(self):
+        """Load the model and run one tiny batch, so the first caller doesn't pay for either."""
+        self.load()
+        self.submit(self.encode("Answer yes or no.", "Is this a test?"), 2).result()
+
+    # ---------- encoding ----------
+    def _prefix(self, system: str) -> List[int]:
+        with self._lock:
+            ids = self._prefixes.get(system)
+            if ids is not None:
+                self._prefixes.move_to_end(system)
+                self.stats["prefix_hits"] += 1
+                return ids
+        ids = self._tokenizer(system + "\n\n", add_special_tokens=False)["input_ids"][:self.max_input_tokens // 2]
+        with self._lock:
+            self.stats["prefix_misses"] += 1
+            self._prefixes[system] = ids
+            if len(self._prefixes) > self.prefix_cache:
+                self._prefixes.popitem(last=False)
+        return ids
+
+    def encode(self, system: str, user: str) -> List[int]:
+        """Token ids of system + user; an overlong user part keeps its end (the newest context and the query)."""
+        self.load()
+        prefix = self._prefix(system) if system else []
+        ids = self._tokenizer(user, add_special_tokens=False)["input_ids"]
+        room = self.max_input_tokens - len(prefix) - 1
+        return prefix + ids[max(0, len(ids) - room):] + [self._tokenizer.eos_token_id]
+
+    # ---------- batching ----------
+    def submit(self, ids: List[int], max_new_tokens: int = 200) -> Future:
+        """Queue one request; the future resolves to (text, prompt tokens, completion tokens)."""
+        self.load()
+        request = _Request(ids, max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch, stop = [first], False
+        until = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(0.0, until - time.perf_counter()))
+            except queue.Empty:
+                break
+            if request is None:
+                stop = True
+                break
+            batch.append(request)
+        return batch, stop
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            # requests whose caller gave up (deadline) were cancelled while queued
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            groups: Dict[int, List[_Request]] = {}
+            for request in batch:
+                groups.setdefault(request.max_new_tokens, []).append(request)
+            for max_new_tokens in sorted(groups):  # short answers don't wait on long ones
+                group = groups[max_new_tokens]
+                try:
+                    results = self._generate([r.ids for r in group], max_new_tokens)
+                except Exception as e:
+                    for request in group:
+                        request.future.set_exception(e)
+                    continue
+                for request, result in zip(group, results):
+                    request.future.set_result(result)
+
+    def _generate(self, batch: List[List[int]], max_new_tokens: int) -> List[Tuple[str, int, int]]:
+        pad = self._tokenizer.pad_token_id
+        width = max(len(ids) for ids in batch)
+        input_ids = torch.full((len(batch), width), pad, dtype=torch.long)
+        attention = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, ids in enumerate(batch):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention[row, :len(ids)] = 1
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            out = self._model.generate(input_ids=input_ids, attention_mask=attention,
+                                       max_new_tokens=max_new_tokens, do_sample=False, num_beams=1)
+        texts = self._tokenizer.batch_decode(out, skip_special_tokens=True)
+        generated = [int((row != pad).sum()) for row in out]  # the decoder starts from pad
+        with self._lock:
+            self.stats["generate_s"] += time.perf_counter() - t0
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["input_tokens"] += sum(len(ids) for ids in batch)
+            self.stats["output_tokens"] += sum(generated)
+            self.stats["padding"] += width * len(batch) - sum(len(ids) for ids in batch)
+        return [(text.strip(), len(ids), n) for text, ids, n in zip(texts, batch, generated)]
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["generate_s"] = round(stats["generate_s"], 3)
+        stats["mean_batch"] = round(stats["requests"] / max(1, stats["batches"]), 2)
+        stats["quantized"] = self.quantize
+        return stats
+
+    def close(self):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+            self._worker = None
+
+
+# ====== Client ======
+def _word(answer: str) -> str:
+    m = re.match(r"\W*([a-z]+)", (answer or "").lower())
+    return m.group(1) if m else ""
+
+
+class LocalLLMClient(GPTClient):
+    """
+    GPTClient answered by a local Seq2SeqEngine instead of the API: the same chat
+    and analyze_turn (and async forms), cache, deadlines, breaker and usage.
+    Analysis sends its per-field questions at once so they share a batch.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, pool_size: int = 16, cache=None,
+                 prompts: Optional[PromptBuilder] = None, deadlines: Optional[Dict[str, float]] = None,
+                 latency: Optional[LatencyTracker] = None, breaker: Optional[CircuitBreaker] = None,
+                 engine: Optional[Seq2SeqEngine] = None):
+        self.engine = engine if engine is not None else Seq2SeqEngine(model)
+        # a hedge would only queue a second copy behind the first on the same CPU
+        super().__init__(model=model, pool_size=pool_size, cache=cache, prompts=prompts, deadlines=deadlines,
+                         hedge=False, latency=latency, breaker=breaker)
+        self._fields = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm-fields")
+
+    def _connect(self, pool_size: int):
+        self.api_key = None
+        self.base_url = f"local://{self.model}"  # keeps cached local answers apart from the API's
+        self.session = None
+
+    def warm(self):
+        self.engine.warm()
+
+    def _attempt(self, payload: dict, timeout: float, op: str) -> dict:
+        t0 = time.perf_counter()
+        messages = payload["messages"]
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        user = "\n\n".join(m["content"] for m in messages if m["role"] != "system")
+        future = self.engine.submit(self.engine.encode(system, user), payload.get("max_tokens") or 200)
+        try:
+            text, prompt_tokens, completion_tokens = future.result(timeout)
+        except Exception:
+            future.cancel()  # still queued: don't spend a batch slot on an answer nobody waits for
+            raise
+        self.latency.observe(op, time.perf_counter() - t0)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        self._count(op, usage)
+        return {"choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage}
+
+    def _ask(self, fields, memory_text: str, user_input: str, op: str) -> Dict[str, str]:
+        """One short answer per field; the questions are in flight together and batch with other calls."""
+        def ask(name: str) -> Tuple[str, Optional[str]]:
+            prompt = self.prompts.build(FIELD_QUESTIONS[name], f"Caller: {user_input}", history=memory_text,
+                                        budget=FIELD_BUDGET, history_label="Call so far")
+            payload = {"model": self.model, "messages": prompt.messages, "temperature": 0.0,
+                       "max_tokens": FIELD_TOKENS}
+            return self._complete(payload, op=op)
+        answers = list(self._fields.map(ask, fields))
+        # cached only once every question of the turn has been answered
+        for content, key in answers:
+            self._remember(key, content)
+        return {name: content for name, (content, _) in zip(fields, answers)}
+
+    @staticmethod
+    def _fields_to_dict(answers: Dict[str, str]) -> dict:
+        address = answers.get("address", "").strip().rstrip(".")
+        return {
+            "intent": _word(answers.get("intent", "")),
+            "address": None if _word(address) in ("none", "no", "yes", "unknown", "") else address,
+            "injuries": {"yes": True, "no": False}.get(_word(answers.get("injuries", ""))),
+            "severity": _word(answers.get("severity", "")),
+            "injury_type": _word(answers.get("injury_type", "")),
+        }
+
+    @traced("analyze")
+    def analyze_turn(self, memory_text: str, user_input: str, fallback=None) -> TurnAnalysis:
+        try:
+            data = self._fields_to_dict(self._ask(ANALYZE_FIELDS, memory_text, user_input, "analyze"))
+        except Exception as e:
+            if fallback is not None:
+                return fallback()
+            print("[Analysis Error]", e)
+            return TurnAnalysis()
+        # no free-text follow-up from this model; the medical agent writes its own question
+        data["has_enough_info"] = bool(data["injuries"] and data["severity"] in SEVERITIES
+                                       and data["injury_type"] in INJURY_TYPES and data["injury_type"] != "other")
+        return TurnAnalysis.from_dict(data)
+
+    def resilience_report(self) -> dict:
+        return {**super().resilience_report(), "engine": self.engine.report()}
+
+    def close(self):
+        self._fields.shutdown(wait=False, cancel_futures=True)
+        self._attempts.shutdown(wait=False, cancel_futures=True)
+        self.engine.close()
+
+
+# ====== Benchmark: local vs remote ======
+def _requests(limit: int) -> List[Tuple[str, str]]:
+    """(dialogue so far, caller line) pairs from the replay transcripts, repeated up to limit."""
+    from benchmark import TRANSCRIPTS, load_transcripts
+    pairs = []
+    for lines in load_transcripts(TRANSCRIPTS).values():
+        for i, line in enumerate(lines):
+            pairs.append(("\n".join(f"user: {l}" for l in lines[:i]), line))
+    if not pairs:
+        sys.exit(f"no transcripts in {TRANSCRIPTS}")
+    return [pairs[i % len(pairs)] for i in range(limit)]
+
+
+async def _load(client: GPTClient, work: List[Tuple[str, str]], concurrency: int, kind: str) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(history: str, line: str):
+        async with gate:
+            t0 = time.perf_counter()
+            if kind == "analyze":
+                await client.aanalyze_turn(history, line)
+            else:
+                await client.achat([{"role": "system", "content": "You are an emergency dispatcher. "
+                                     "Ask the caller one short follow-up question."},
+                                    {"role": "user", "content": f"{history}\nuser: {line}"}])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(h, l) for h, l in work))
+    wall = time.perf_counter() - t0
+    p50, p95, p99 = np.percentile(np.asarray(latencies), [50, 95, 99])
+    return {"requests": len(work), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1), "req_per_s": round(len(work) / wall, 2)}
+
+
+def bench(clients: Dict[str, GPTClient], work: List[Tuple[str, str]], concurrency: List[int],
+          kinds=("analyze", "chat")) -> List[dict]:
+    """Latency percentiles and throughput per backend, request kind and concurrency level."""
+    rows = []
+    for name, client in clients.items():
+        for kind in kinds:
+            for c in concurrency:
+                row = {"backend": name, "kind": kind, "concurrency": c,
+                       **asyncio.run(_load(client, work, c, kind))}
+                if isinstance(client, LocalLLMClient):
+                    row["mean_batch"] = client.engine.report()["mean_batch"]
+                rows.append(row)
+                print(json.dumps(row))
+    return rows
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Local FLAN-T5 backend: latency/throughput against the remote client")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    bm = sub.add_parser("bench", help="replay transcript turns through both backends at several concurrencies")
+    bm.add_argument("--requests", type=int, default=64, help="requests per backend, kind and concurrency")
+    bm.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    bm.add_argument("--kind", choices=("analyze", "chat"), nargs="+", default=["analyze", "chat"])
+    bm.add_argument("--model", default=DEFAULT_MODEL)
+    bm.add_argument("--max-batch", type=int, default=16)
+    bm.add_argument("--max-wait-ms", type=float, default=5.0)
+    bm.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    bm.add_argument("--no-quantize", action="store_true", help="run the float32 model")
+    bm.add_argument("--local-only", action="store_true", help="skip the remote client")
+    bm.add_argument("--llm-url", help="remote endpoint (default: start the mock server)")
+    bm.add_argument("--latency-ms", type=float, default=300.0, help="mock server latency")
+    bm.add_argument("--save", help="write the rows as JSON")
+    args = parser.parse_args()
+
+    work = _requests(args.requests)
+    engine = Seq2SeqEngine(args.model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+                           quantize=not args.no_quantize, threads=args.threads)
+    t0 = time.perf_counter()
+    engine.warm()
+    print(f"[Local] {args.model} loaded in {time.perf_counter() - t0:.2f}s (int8: {engine.quantize})")
+    # no response cache: every request is generated
+    clients: Dict[str, GPTClient] = {"local": LocalLLMClient(args.model, pool_size=max(args.concurrency) * 5,
+                                                             engine=engine)}
+    server = None
+    if not args.local_only:
+        if args.llm_url:
+            os.environ["GAPGPT_BASE_URL"] = args.llm_url
+        else:
+            from mock_llm import MockConfig, start_mock_server
+            server = start_mock_server(config=MockConfig(latency_ms=args.latency_ms))
+            os.environ["GAPGPT_BASE_URL"] = server.url
+            os.environ.setdefault("GAPGPT_API_KEY", "mock")
+        clients["remote"] = GPTClient(pool_size=max(args.concurrency))
+    try:
+        rows = bench(clients, work, args.concurrency, args.kind)
+    finally:
+        for client in clients.values():
+            client.close()
+        if server is not None:
+            server.stop()
+    print(json.dumps({"engine": engine.report()}))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Saved {args.save}")
+
+
+if __name__ == "__main__":
+    _cli()
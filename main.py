@@ -1,17 +1,58 @@
+import time
+_T0 = time.perf_counter()  # startup report baseline, before any of our imports
+
+import asyncio, argparse, threading
 from pathlib import Path
-from io_voice import VoiceListener, speak_tts
-from nlp import GPTClient
-from agents import Orchestrator, Ctx
-from speech_corrector import SpeechCorrector
-from memory_manager import MemoryManager
+from typing import Optional
+from io_voice import VoiceListener, get_tts, speak_tts, speak_tts_stream
+from sessions import Services, CallSession, serve, GREETING, GOODBYE, BUSY
+from agents import STATIC_PHRASES
+from startup import StartupReport, warm_up
+import tracing
+
+async def run_turn(call: CallSession, user_raw: str, words, typed: bool) -> "asyncio.Task":
+    """Prepare one final transcript, speak the reply as it streams, and start recording the turn."""
+    turn = await call.prepare_final(user_raw, words, typed)
+    print(f"LLM Text-Corrected: {turn.corrected}")
+    if turn.memory_context:
+        print(f"Memory recall: {turn.memory_context}")
+
+    # the first sentence is spoken as soon as it is complete, not after the whole reply
+    parts = []
+
+    def reply_text():
+        for speaker, piece in call.reply_stream(turn):
+            if parts and parts[-1][0] != speaker:
+                yield "\n"  # a new agent always starts a new sentence
+            parts.append((speaker, piece))
+            yield piece
+
+    try:
+        await asyncio.to_thread(speak_tts_stream, reply_text())
+    except Exception as e:
+        print(f"[Reply Error] {e}")
+    reply = call.orch.format_reply(parts)
+    print(reply)
+
+    # persist the turn while the reply is being spoken; awaited before the next turn
+    return asyncio.create_task(call.finish(turn, reply))
 
-def main():
+async def main(llm: Optional[str] = None):
+    report = StartupReport(_T0)
+    report.mark("imports")
     model_dir = Path(__file__).resolve().parent / "models" / "vosk-model-small-en-us-0.15"
-    gpt = GPTClient(model="gpt-4o-mini")
-    corrector = SpeechCorrector(gpt)
-    memory_mgr = MemoryManager(gpt)
-    orch = Orchestrator(gpt)
-    ctx = Ctx()
+
+    # the greeting goes first: it plays as soon as the engine is up, while everything else loads
+    tts = get_tts()
+    speak_tts(GREETING, wait=False)
+    # fixed prompts are rendered once in the background and then played from cache
+    tts.prerender((GOODBYE, BUSY) + STATIC_PHRASES)
+    report.mark("greeting_queued")
+
+    # one GPT pool, embedding model (with a persistent vector cache), index and incident store
+    services = Services("memory_store", llm=llm)
+    call = CallSession("local", services)
+    report.mark("services")
 
     try:
         listener = VoiceListener(str(model_dir))
@@ -20,41 +61,103 @@ def main():
         print("Voice input unavailable — switching to text mode.")
         listener = None
 
-    speak_tts("RescueHub is listening. Please describe your emergency.")
+    # the slow loads (embedding model, Vosk model, speech engine) run side by side in the background
+    steps = {"tts": tts.warm, "embeddings": services.embedder.warm, "llm": services.gpt.warm}
+    if listener:
+        steps["stt"] = listener.warm
+
+    def startup_done(r: StartupReport):
+        if tts.first_spoken is not None:
+            r.mark("greeting_started", tts.first_spoken)
+        print(f"[Startup]\n{r.format()}")
+
+    warm_up(steps, report, on_done=startup_done)
+    report.mark("listening")
     print("=== RescueHub Started ===")
 
+    # the microphone is read continuously; hypotheses arrive on a queue (None: the listener failed)
+    hyps: "asyncio.Queue" = asyncio.Queue()
+    if listener:
+        loop = asyncio.get_running_loop()
+
+        def pump():
+            try:
+                for hyp in listener.stream(tts):
+                    loop.call_soon_threadsafe(hyps.put_nowait, hyp)
+            except Exception as e:
+                print(f"[Audio Error] {e}")
+                loop.call_soon_threadsafe(hyps.put_nowait, None)
+
+        threading.Thread(target=pump, name="stt-stream", daemon=True).start()
+        print("🎤 Speak now...")
+
+    persist = None
     while True:
-        if ctx.done:
+        if call.done:
             print("Conversation complete — exiting gracefully.")
             break
 
+        # listening runs while the previous reply is still being spoken
         if listener:
-            user_raw = listener.listen_once()
+            hyp = await hyps.get()
+            if hyp is None:
+                print("Voice input unavailable — switching to text mode.")
+                listener = None
+                continue
+            if not hyp.final:
+                # start correction/recall/analysis on a stable partial; confirmed or dropped on the final
+                if hyp.stable:
+                    call.speculate(hyp.text)
+                continue
+            user_raw, words, typed = hyp.text, hyp.words, False
+            print("🗣 You:", user_raw)
         else:
-            user_raw = input("Type your message: ")
+            # typed text has no recognition errors to correct
+            user_raw, words, typed = await asyncio.to_thread(input, "Type your message: "), None, True
 
         if not user_raw.strip():
             continue
+        tts.cancel()  # the caller has moved on; don't keep talking over them
+        if persist is not None:
+            await persist
+        with tracing.span("turn", call=call.id, turn=call.turns, typed=typed):
+            persist = await run_turn(call, user_raw, words, typed)
 
-        user_text = corrector.correct(user_raw, orch.memory.get_summary())
-        print(f"LLM Text-Corrected: {user_text}")
-
-        memory_context = memory_mgr.recall_context(user_text)
-        if memory_context:
-            print(f"Memory recall: {memory_context}")
-            user_text = f"(Context: {memory_context})\n{user_text}"
-
-        reply, ctx = orch.step(user_text, ctx)
-        print(reply)
-
-        memory_mgr.add_entry(user_text, reply)
-
-        try:
-            speak_tts(reply.split(": ", 1)[1])
-        except Exception as e:
-            print(f"[TTS Error] {e}")
-
-    speak_tts("Help is on the way. Stay safe.")
+    if persist is not None:
+        await persist
+    tts.wait()
+    speak_tts(GOODBYE)
+    report = services.report()
+    print(f"[LLM cache] {report['llm_cache']}")
+    print(f"[Embeddings] {report['embeddings']}")
+    print(f"[Corrector] {report['corrector']}")
+    print(f"[Turn analysis] {report['nlu']}")
+    print(f"[Summaries] {report['summaries']}")
+    print(f"[Upstream] {report['upstream']}")
+    print(f"[TTS] {tts.stats}")
+    print(f"[Speculation] {call.speculation}")
+    services.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="RescueHub emergency assistant")
+    parser.add_argument("--serve", action="store_true", help="serve many concurrent text calls over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=64)
+    parser.add_argument("--max-active-turns", type=int, default=16)
+    parser.add_argument("--metrics-port", type=int, help="expose Prometheus /metrics on this port")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="address the /metrics endpoint binds to (0.0.0.0 for remote scrapers)")
+    parser.add_argument("--use-ai", action="store_true",
+                        help="run the LLM locally (FLAN-T5-small, CPU) instead of calling the API")
+    parser.add_argument("--trace-file", help="append every span as a JSON line (or set RESCUEHUB_TRACE_FILE)")
+    args = parser.parse_args()
+    if args.trace_file:
+        tracing.configure(args.trace_file)
+    if args.metrics_port:
+        tracing.serve_metrics(args.metrics_port, host=args.metrics_host)
+    llm = "local" if args.use_ai else None
+    if args.serve:
+        asyncio.run(serve(args.host, args.port, args.max_sessions, args.max_active_turns, llm=llm))
+    else:
+        asyncio.run(main(llm))
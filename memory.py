@@ -3,12 +3,20 @@ from collections import deque
 class ConversationMemory:
     def __init__(self, max_turns=8):
         self.history = deque(maxlen=max_turns)
+        self._summary = None  # joined history, rebuilt only after add()
 
     def add(self, role: str, content: str):
+        line = f"{role}: {content}"
+        if self._summary is not None and len(self.history) < self.history.maxlen:
+            self._summary = f"{self._summary}\n{line}" if self.history else line
+        else:
+            self._summary = None  # the oldest turn falls off the front
         self.history.append({"role": role, "content": content})
 
     def to_messages(self):
         return list(self.history)
 
     def get_summary(self):
-        return "\n".join([f"{m['role']}: {m['content']}" for m in self.history])
+        if self._summary is None:
+            self._summary = "\n".join([f"{m['role']}: {m['content']}" for m in self.history])
+        return self._summary
@@ -1,52 +1,72 @@
 from typing import List, Tuple, Optional, Dict
-from vector_memory import VectorMemory
-import json, re
-from datetime import datetime
+from vector_memory import ShardedVectorMemory, get_vector_memory
+from incident_store import IncidentStore
+from address import Gazetteer, get_gazetteer, parse, normalize
+from summaries import RollingSummaries, clip
+from tracing import traced
 from pathlib import Path
 
 class MemoryManager:
 
-    def __init__(self, gpt_client, persist_dir: str = "memory_store"):
-        self.vector = VectorMemory(persist_dir=persist_dir)
+    def __init__(self, gpt_client, persist_dir: str = "memory_store", vector: Optional[ShardedVectorMemory] = None,
+                 gazetteer: Optional[Gazetteer] = None):
+        self.vector = vector if vector is not None else get_vector_memory(persist_dir)
         self.gpt = gpt_client
 
         self.persist_dir = Path(persist_dir)
         self.persist_dir.mkdir(exist_ok=True)
-        self.incidents_path = self.persist_dir / "incidents.json"
-
-        if self.incidents_path.exists():
-            self.incidents: List[Dict] = json.loads(self.incidents_path.read_text(encoding="utf-8"))
-        else:
-            self.incidents = []
+        self.incidents = IncidentStore(
+            str(self.persist_dir / "incidents.sqlite"),
+            legacy_json=str(self.persist_dir / "incidents.json"),
+        )
+        # streets of past incidents, so repeat callers' addresses snap to the stored spelling
+        self.gazetteer = gazetteer if gazetteer is not None else get_gazetteer()
+        for addr in self.incidents.addresses():
+            self.gazetteer.learn(addr)
+        # running per-call and per-incident summaries, so recall is a lookup rather than an LLM call
+        self.summaries = RollingSummaries(gpt_client, str(self.persist_dir / "summaries.sqlite"))
+
+    def close(self):
+        """Fold queued summaries in, then close the summary and incident databases."""
+        self.summaries.close()
+        self.incidents.close()
 
     # ---------- vector snapshots ----------
-    def add_entry(self, user_text: str, assistant_reply: str = "", incident: str = "unknown"):
+    @traced("persist")
+    def add_entry(self, user_text: str, assistant_reply: str = "", incident: str = "unknown",
+                  session: Optional[str] = None, address: Optional[str] = None):
+        """Store the turn and fold it into its call's (and, once known, its address's) running summary."""
         chunk = f"User: {user_text}\nAssistant: {assistant_reply}"
-        self.vector.add_memory(chunk, incident=incident)
-
-    # ---------- persistence ----------
-    def _save_incidents(self):
-        self.incidents_path.write_text(json.dumps(self.incidents, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    def _now(self) -> str:
-        return datetime.utcnow().isoformat()
+        meta = {}
+        if session:
+            meta["session"] = session
+            self.summaries.add(f"session:{session}", chunk)
+        addr = self._normalize_address(address)
+        if addr:
+            meta["address"] = addr
+            self.summaries.add(f"incident:{addr}", chunk)
+        self.vector.add_memory(chunk, incident=incident, meta=meta)
+
+    def add_entries(self, texts: List[str], incidents: List[str], vectors=None,
+                    meta: Optional[List[dict]] = None) -> int:
+        """Bulk form of add_entry for backfills: texts are stored as given, in one append. Returns the rows stored."""
+        return self.vector.add_many(texts, incidents, vectors=vectors, meta=meta)
 
     # ---------- address helpers ----------
-    def _normalize_address(self, text: Optional[str]) -> Optional[str]:
+    def _normalize_address(self, text: Optional[str], learn: bool = False) -> Optional[str]:
+        """
+        Incident key: the parsed address, its street snapped to the gazetteer spelling.
+        learn adds a new street to the shared gazetteer, only for incidents being recorded and only
+        when it was read exactly with a house number, so one misparse does not become "known".
+        """
         if not text:
             return None
-        t = text.strip().lower()
-        t = t.replace("straße", "strasse")
-        t = re.sub(r"\bst\.?\b", "street", t)
-        t = re.sub(r"\brd\.?\b", "road", t)
-        t = re.sub(r"\save\.?\b", "avenue", t)
-        t = re.sub(r"\bln\.?\b", "lane", t)
-        t = re.sub(r"(\w)-(\w)", r"\1 \2", t)
-        t = re.sub(r"\s+", " ", t)
-        return t
-
-    def _similar_enough(self, a: str, b: str) -> bool:
-        return a and b and (a == b or a in b or b in a)
+        found = parse(text, self.gazetteer)
+        if found is None:
+            return normalize(text) or None
+        if learn and not found.known and found.number and not found.fuzzy:
+            self.gazetteer.add(found.street)
+        return found.text
 
     # ---------- incidents API ----------
     def find_by_address(self, raw_address: Optional[str]) -> Optional[Dict]:
@@ -55,115 +75,82 @@ class MemoryManager:
         naddr = self._normalize_address(raw_address)
         if not naddr:
             return None
-        for r in reversed(self.incidents):
-            if self._similar_enough(naddr, r.get("address", "")):
-                return r
-        return None
+        return self.incidents.find(naddr)
 
     def upsert_from_ctx(self, ctx, source: str = "agent") -> Dict:
-        addr = self._normalize_address(ctx.address) or ""
+        addr = self._normalize_address(ctx.address, learn=True) or ""
         inc_type = (ctx.incident_type or ctx.active_agent or "unknown").lower()
+        return self.incidents.upsert(
+            addr,
+            incident_type=inc_type,
+            injuries=ctx.injuries,
+            injury_desc=ctx.injury_desc,
+            dispatched=bool(getattr(ctx, "done", False) or getattr(ctx, "dispatched", False)),
+            source=source,
+            history_ctx={
+                "address": addr,
+                "incident_type": inc_type,
+                "injuries": ctx.injuries,
+                "injury_desc": ctx.injury_desc
+            },
+        )
 
-        target = None
-        for r in reversed(self.incidents):
-            if self._similar_enough(addr, r.get("address","")):
-                target = r
-                break
-
-        if target:
-            if ctx.injuries is not None:
-                target["injuries"] = bool(ctx.injuries)
-            if ctx.injury_desc:
-                target["injury_desc"] = ctx.injury_desc
-            if inc_type and inc_type != "unknown":
-                target["incident_type"] = inc_type
-            if getattr(ctx, "done", False) or getattr(ctx, "dispatched", False):
-                target["dispatched"] = True
-            target.setdefault("history", []).append({
-                "ts": self._now(),
-                "source": source,
-                "ctx": {
-                    "address": addr,
-                    "incident_type": inc_type,
-                    "injuries": ctx.injuries,
-                    "injury_desc": ctx.injury_desc
-                }
-            })
-            self._save_incidents()
-            return target
-
-        rec = {
-            "id": f"inc_{len(self.incidents)+1}",
-            "ts": self._now(),
-            "address": addr,
-            "incident_type": inc_type,
-            "injuries": bool(ctx.injuries) if ctx.injuries is not None else None,
-            "injury_desc": ctx.injury_desc or "",
-            "dispatched": bool(getattr(ctx, "done", False) or getattr(ctx, "dispatched", False)),
-            "history": [{
-                "ts": self._now(),
-                "source": source,
-                "ctx": {
-                    "address": addr,
-                    "incident_type": inc_type,
-                    "injuries": ctx.injuries,
-                    "injury_desc": ctx.injury_desc
-                }
-            }]
-        }
-        self.incidents.append(rec)
-        self._save_incidents()
-        return rec
-
+    def upsert_incidents(self, items: List[Dict], source: str = "ingest") -> int:
+        """
+        Bulk upsert (one transaction); items carry raw addresses, normalized here. An item's
+        injury_type (burn, fracture, ...) stands in for the description when it has none.
+        """
+        rows = []
+        for item in items:
+            addr = self._normalize_address(item.get("address"), learn=True)
+            if addr:
+                rows.append({**item, "address": addr,
+                             "injury_desc": item.get("injury_desc") or item.get("injury_type")})
+        return self.incidents.upsert_many(rows, source=source)
+
+    @traced("recall")
     def recall_context(self, user_text: str, current_incident: Optional[str] = None,
                        top_k: int = 3, min_similarity: float = 0.80,
-                       require_same_incident: bool = False, return_summary: bool = True) -> str:
-        try:
-            results, sims = self.vector.search(user_text, top_k=top_k, return_distance=True)
-        except TypeError:
-            results = self.vector.search(user_text, top_k=top_k)
-            sims = [1.0] * len(results)
+                       require_same_incident: bool = False, return_summary: bool = True,
+                       session: Optional[str] = None) -> str:
+        """
+        What past calls say about this query. Each hit stands for its incident's (else its call's)
+        running summary, already kept up to date by add_entry; chunks stored before summaries
+        existed are used as they are. Hits from the current session are skipped.
+        """
+        # routed to the turn's incident shards (and "both"); weak hits never take a top-k slot
+        results, sims = self.vector.search(user_text, top_k=top_k, return_distance=True,
+                                           incident=current_incident, min_similarity=min_similarity)
 
         if not results:
             return ""
 
-        norm: List[dict] = []
-        for r in results:
-            if isinstance(r, dict):
-                text = r.get("text", "")
-                incident = r.get("incident", "unknown")
-            else:
-                text = str(r)
-                incident = "unknown"
-            norm.append({"text": text, "incident": incident})
-
         filtered: List[str] = []
-        for item, score in zip(norm, sims):
+        for r, score in zip(results, sims):
             if score < min_similarity:
                 continue
+            item = r if isinstance(r, dict) else {"text": str(r)}
+            if session and item.get("session") == session:
+                continue
             if require_same_incident and current_incident:
                 inc = (item.get("incident") or "unknown").lower()
                 cur = current_incident.lower()
                 same = (inc == cur or inc == "both" or cur == "both")
                 if not same:
                     continue
-            text = (item.get("text") or "").strip()
-            if text:
+            text = None
+            if return_summary:
+                if item.get("address"):
+                    text = self.summaries.get(f"incident:{item['address']}")
+                if text is None and item.get("session"):
+                    text = self.summaries.get(f"session:{item['session']}")
+            if text is None:
+                text = (item.get("text") or "").strip()
+                if return_summary:
+                    text = clip(text)
+            if text and text not in filtered:
                 filtered.append(text)
 
-        if not filtered:
-            return ""
-
-        joined = "\n---\n".join(filtered)
-        prompt = (
-            "You are RescueHub's memory summarizer.\n"
-            "Summarize in 1–2 sentences:\n\n" + joined
-        )
-        try:
-            summary = self.gpt.chat([
-                {"role":"system","content":prompt},
-                {"role":"user","content":f"User's current query: {user_text}"}
-            ])
-            return summary.strip()
-        except Exception:
-            return ""
+        if not return_summary:
+            return "\n---\n".join(filtered)
+        return " ".join(filtered)
@@ -0,0 +1,225 @@
+"""
+Local stand-in for the OpenAI-compatible /chat/completions endpoint, for offline
+benchmarks. Replies are canned per RescueHub prompt (turn analysis, STT correction,
+memory summary), latency is configurable and faults can be injected. Point
+GAPGPT_BASE_URL at it:
+
+    python mock_llm.py --port 8600 --latency-ms 300 --jitter-ms 80
+    GAPGPT_BASE_URL=http://127.0.0.1:8600/v1 GAPGPT_API_KEY=mock python main.py
+"""
+import re, sys, json, time, random, argparse, threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+_FIRE = re.compile(r"\b(fire|smoke|flames?|burning|explosion)\b", re.I)
+_MEDICAL = re.compile(r"\b(hurt|injur\w*|burn(ed|s)?|bleed\w*|broken|fractur\w*|unconscious|pain|wound\w*)\b", re.I)
+_NO_INJURY = re.compile(r"\b(no(body|one| one)? (is |was )?(hurt|injured)|no injur\w*|everyone is (fine|ok|safe))\b", re.I)
+_ADDRESS = re.compile(r"\b\d+\s+(?:[A-Za-z]+\s+){1,3}(?:street|st|road|rd|avenue|ave|lane|ln|boulevard|blvd|drive|dr)\b", re.I)
+_SPECIFIC = [
+    (re.compile(r"(second|third|first)[- ]?degree|burn", re.I), "burn", "high"),
+    (re.compile(r"broken|fractur", re.I), "fracture", "high"),
+    (re.compile(r"heavy bleeding|bleeding (a lot|badly|heavily)", re.I), "bleeding", "high"),
+    (re.compile(r"unconscious|head", re.I), "head", "high"),
+]
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def analyze(context: str, caller: str) -> dict:
+    """Rule-based stand-in for the turn analyzer: good enough to drive every agent branch."""
+    whole = f"{context}\n{caller}"
+    fire, medical = bool(_FIRE.search(whole)), bool(_MEDICAL.search(whole))
+    intent = "both" if fire and medical else "fire" if fire else "medical" if medical else "other"
+    address = _ADDRESS.search(caller)
+    injuries = False if _NO_INJURY.search(caller) else True if _MEDICAL.search(caller) else None
+    injury_type = severity = None
+    if injuries:
+        for pattern, kind, level in _SPECIFIC:
+            if pattern.search(caller):
+                injury_type, severity = kind, level
+                break
+    enough = injury_type is not None
+    return {
+        "intent": intent,
+        "address": address.group(0) if address else None,
+        "injuries": injuries,
+        "severity": severity,
+        "injury_type": injury_type,
+        "has_enough_info": enough,
+        "next_question": None if enough or not injuries else "Where exactly is the injury, and is it bleeding?",
+    }
+
+
+def reply_for(messages: list) -> str:
+    """Canned reply chosen by which RescueHub prompt is asking."""
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if "turn analyzer" in system:
+        context, _, caller = user.rpartition("Caller:")
+        return json.dumps(analyze(context, caller.strip()))
+    if "speech-to-text corrector" in system:
+        return user.rpartition("User said (possibly wrong):")[2].strip()
+    if "memory summarizer" in system:
+        turns = user.partition("New turns:\n")[2].split("\n\n")[0]
+        first = (turns.splitlines() or [""])[0].strip()
+        return f"Earlier on this call: {first[:160]}"
+    return "Understood."
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 300.0   # mean time to first byte
+    jitter_ms: float = 50.0     # standard deviation around latency_ms
+    seed: Optional[int] = None
+    # fault injection, for exercising the client's timeouts, hedging and circuit breaker
+    error_rate: float = 0.0     # share of requests answered with a 503
+    slow_rate: float = 0.0      # share of requests delayed by slow_ms instead of latency_ms
+    slow_ms: float = 5000.0
+    outage: Optional[Tuple[float, float]] = None  # (start, end) seconds after start(): every request fails
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MockLLMServer"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API behind the client's pool
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": {"message": "invalid JSON"}})
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        fault, delay = self.server.fault()
+        if fault == "error":
+            time.sleep(delay)
+            return self._send_json(503, {"error": {"message": "injected upstream failure"}})
+
+        messages = payload.get("messages") or []
+        content = reply_for(messages)
+        usage = {
+            "prompt_tokens": sum(approx_tokens(m.get("content") or "") for m in messages),
+            "completion_tokens": approx_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.server.record(usage)
+        time.sleep(delay)
+
+        self._send_json(200, {
+            "id": "mock", "object": "chat.completion", "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[MockConfig] = None):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "injected_errors": 0, "injected_slow": 0}
+        self.started = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def delay(self) -> float:
+        with self._lock:
+            ms = self._rng.gauss(self.config.latency_ms, self.config.jitter_ms)
+        return max(0.0, ms) / 1000
+
+    def handle_error(self, request, client_address):
+        # clients drop timed-out attempts and losing hedges mid-reply; that is not a server error
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def fault(self) -> Tuple[Optional[str], float]:
+        """This request's injected fault ("error", "slow" or None) and how long to wait before answering."""
+        cfg = self.config
+        with self._lock:
+            t = time.monotonic() - self.started
+            in_outage = cfg.outage is not None and cfg.outage[0] <= t < cfg.outage[1]
+            if in_outage or self._rng.random() < cfg.error_rate:
+                self.stats["injected_errors"] += 1
+                return "error", 0.01
+            if self._rng.random() < cfg.slow_rate:
+                self.stats["injected_slow"] += 1
+                return "slow", cfg.slow_ms / 1000
+        return None, self.delay()
+
+    def record(self, usage: dict):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += usage["prompt_tokens"]
+            self.stats["completion_tokens"] += usage["completion_tokens"]
+
+    def start(self) -> "MockLLMServer":
+        self.started = time.monotonic()
+        threading.Thread(target=self.serve_forever, name="mock-llm", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, config: Optional[MockConfig] = None) -> MockLLMServer:
+    """Serve in a background thread; port 0 picks a free port (see .url)."""
+    return MockLLMServer(host, port, config).start()
+
+
+def add_fault_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failed with a 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=5000.0)
+    parser.add_argument("--outage", help="START:END seconds after start during which every request fails")
+
+
+def fault_config(args) -> dict:
+    outage = tuple(float(x) for x in args.outage.split(":")) if args.outage else None
+    return {"error_rate": args.error_rate, "slow_rate": args.slow_rate, "slow_ms": args.slow_ms, "outage": outage}
+
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat server for RescueHub benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=None)
+    add_fault_args(parser)
+    args = parser.parse_args()
+    server = MockLLMServer(args.host, args.port, MockConfig(args.latency_ms, args.jitter_ms, args.seed,
+                                                            **fault_config(args)))
+    print(f"Mock LLM serving on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    _cli()
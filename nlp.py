@@ -1,53 +1,362 @@
-import os, requests, json
+"""
+LLM client for RescueHub: the GapGPT (OpenAI-compatible) chat API behind one pooled requests
+session, with a response cache, per-kind deadlines, hedged attempts and a circuit breaker.
+
+The asyncio API (achat, aanalyze_turn) is the blocking client run on worker threads with
+asyncio.to_thread; there is no async HTTP client. The threads share the session's connection
+pool, so independent calls of one turn overlap; each awaiting call holds a thread of the event
+loop's default executor.
+"""
+import os, requests, json, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Optional, Tuple
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from cache import make_key
+from prompts import PromptBuilder, get_prompt_builder
+from resilience import LatencyTracker, CircuitBreaker, UpstreamError, DeadlineExceeded, CircuitOpenError
+from tracing import (span, traced, LLM_REQUESTS, LLM_CACHE_HITS, LLM_TOKENS, LLM_PROMPT_TOKENS,
+                     LLM_HEDGES, LLM_TIMEOUTS, LLM_FAILURES)
 load_dotenv()
 
+# prompt token budgets (system + context + query) per request kind
+ANALYZE_BUDGET = 768
+
+# longest a caller waits on one LLM call, hedges included; callers fall back to local heuristics after it
+DEADLINES = {"chat": 8.0, "analyze": 6.0}
+
+# ====== Turn analysis ======
+INTENTS = ("fire", "medical", "both", "other")
+SEVERITIES = ("high", "low")
+INJURY_TYPES = ("burn", "fracture", "bleeding", "head", "other")
+
+TURN_ANALYSIS_PROMPT = (
+    "You are RescueHub's turn analyzer for an emergency line.\n"
+    "Analyze the caller's latest message (it may contain STT errors) in the context of the dialogue.\n"
+    "Return only a JSON object with exactly these keys:\n"
+    "{"
+    "\"intent\": \"fire|medical|both|other\","
+    "\"address\": \"string or null\","
+    "\"injuries\": true/false/null,"
+    "\"severity\": \"high|low|null\","
+    "\"injury_type\": \"burn|fracture|bleeding|head|other|null\","
+    "\"has_enough_info\": true/false,"
+    "\"next_question\": \"short medical question or null\""
+    "}\n\n"
+    "Rules:\n"
+    "- intent is the emergency type of the whole call so far.\n"
+    "- injuries is true only if someone is clearly injured, burned or hurt; false if the caller says nobody is; otherwise null.\n"
+    "- has_enough_info is true when an injury is concretely described ('second-degree burn', 'broken leg', 'heavy bleeding').\n"
+    "- If the injury is vague ('he's hurt', 'he's in pain'), set has_enough_info=false and propose a follow-up in next_question.\n"
+    "- If has_enough_info=true, next_question must be null.\n"
+    "- NEVER repeat identical questions."
+)
+
+
+@dataclass
+class TurnAnalysis:
+    intent: Optional[str] = None
+    address: Optional[str] = None
+    injuries: Optional[bool] = None
+    severity: Optional[str] = None
+    injury_type: Optional[str] = None
+    has_enough_info: bool = False
+    next_question: Optional[str] = None
+
+    @staticmethod
+    def _enum(value, allowed) -> Optional[str]:
+        v = str(value).strip().lower() if value is not None else ""
+        return v if v in allowed else None
+
+    @staticmethod
+    def _bool(value) -> Optional[bool]:
+        if isinstance(value, bool):
+            return value
+        v = str(value).strip().lower() if value is not None else ""
+        if v in ("true", "yes"):
+            return True
+        if v in ("false", "no"):
+            return False
+        return None
+
+    @staticmethod
+    def _text(value) -> Optional[str]:
+        if not isinstance(value, str):
+            return None
+        v = value.strip()
+        return v if v and v.lower() not in ("null", "none", "unknown") else None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TurnAnalysis":
+        """Validate a raw model reply against the schema; bad fields fall back to unknown."""
+        if not isinstance(data, dict):
+            raise ValueError(f"turn analysis must be a JSON object, got {type(data).__name__}")
+        enough = cls._bool(data.get("has_enough_info")) or False
+        return cls(
+            intent=cls._enum(data.get("intent"), INTENTS),
+            address=cls._text(data.get("address")),
+            injuries=cls._bool(data.get("injuries")),
+            severity=cls._enum(data.get("severity"), SEVERITIES),
+            injury_type=cls._enum(data.get("injury_type"), INJURY_TYPES),
+            has_enough_info=enough,
+            next_question=None if enough else cls._text(data.get("next_question")),
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+def _retryable(exc: Exception) -> bool:
+    """Worth a second attempt: timeouts, connection errors, 429 and 5xx; not malformed requests or bodies."""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and (exc.response.status_code == 429 or exc.response.status_code >= 500)
+    return isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
 class GPTClient:
-    def __init__(self, model="gpt-4o-mini"):
+    def __init__(self, model="gpt-4o-mini", pool_size: int = 16, cache=None, prompts: Optional[PromptBuilder] = None,
+                 deadlines: Optional[Dict[str, float]] = None, hedge: bool = True,
+                 latency: Optional[LatencyTracker] = None, breaker: Optional[CircuitBreaker] = None):
         self.model = model
+        # any object with get(key)/set(key, value), e.g. cache.TieredCache
+        self.cache = cache
+        self.prompts = prompts if prompts is not None else get_prompt_builder()
+        self._connect(pool_size)
+
+        # tail latency: per-call deadlines, attempt timeouts from observed p99, a duplicate
+        # request once an attempt outlives p95, and a breaker that stops waiting on a sick upstream
+        self.deadlines = {**DEADLINES, **(deadlines or {})}
+        self.hedge = hedge
+        self.latency = latency if latency is not None else LatencyTracker()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._attempts = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm")
+
+        # request accounting for reports and the replay benchmark; token counts come
+        # from the response's usage block when the server sends one
+        self._usage_lock = threading.Lock()
+        self.usage = {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "prompt_tokens_local": 0,
+                      "prompts": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0}
+
+    def _connect(self, pool_size: int):
         self.api_key = os.getenv("GAPGPT_API_KEY")
         self.base_url = os.getenv("GAPGPT_BASE_URL", "https://api.gapgpt.com/v1")
         if not self.api_key:
             raise ValueError("Missing GAPGPT_API_KEY in .env")
 
-    def chat(self, messages):
+        # one keep-alive pool shared by every caller instead of a fresh connection per request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
+
+    def warm(self):
+        """Nothing to load for the API; the local backend loads its model here."""
+
+    @property
+    def degraded(self) -> bool:
+        """The breaker is not closed: callers should prefer their local heuristics."""
+        return self.breaker.degraded
+
+    def _measure(self, op: str, messages, s=None) -> int:
+        """Prompt size by the local tokenizer, for every request whether or not the server reports usage."""
+        n = self.prompts.tokenizer.count_messages(messages)
+        LLM_PROMPT_TOKENS.observe(n, op=op)
+        if s is not None:
+            s.attrs["prompt_tokens_local"] = n
+        with self._usage_lock:
+            self.usage["prompts"] += 1
+            self.usage["prompt_tokens_local"] += n
+        return n
+
+    def _count(self, op: str, usage: Optional[dict] = None, cache_hit: bool = False, s=None):
+        if cache_hit:
+            LLM_CACHE_HITS.inc(op=op)
+            with self._usage_lock:
+                self.usage["cache_hits"] += 1
+            return
+        prompt = int((usage or {}).get("prompt_tokens") or 0)
+        completion = int((usage or {}).get("completion_tokens") or 0)
+        LLM_REQUESTS.inc(op=op)
+        LLM_TOKENS.inc(prompt, op=op, kind="prompt")
+        LLM_TOKENS.inc(completion, op=op, kind="completion")
+        if s is not None:
+            s.attrs.update(prompt_tokens=prompt, completion_tokens=completion)
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += prompt
+            self.usage["completion_tokens"] += completion
+
+    def usage_report(self) -> dict:
+        with self._usage_lock:
+            return dict(self.usage)
+
+    def _tally(self, key: str):
+        with self._usage_lock:
+            self.usage[key] += 1
+
+    def resilience_report(self) -> dict:
+        return {"breaker": self.breaker.report(), "latency": self.latency.report()}
+
+    def _post(self, payload: dict, timeout: float):
         url = f"{self.base_url}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}"}
+        return self.session.post(url, json=payload, timeout=timeout)
+
+    def _attempt(self, payload: dict, timeout: float, op: str) -> dict:
+        t0 = time.perf_counter()
+        r = self._post(payload, timeout=timeout)
+        r.raise_for_status()
+        body = r.json()
+        body["choices"][0]["message"]["content"]  # a malformed body fails the attempt, not the caller
+        self.latency.observe(op, time.perf_counter() - t0)
+        self._count(op, body.get("usage"))  # hedge losers are billed too
+        return body
+
+    def _fail(self, op: str, reason: str, exc: UpstreamError) -> UpstreamError:
+        LLM_FAILURES.inc(op=op, reason=reason)
+        if reason == "deadline":
+            LLM_TIMEOUTS.inc(op=op)
+            self._tally("timeouts")
+        self._tally("failures")
+        return exc
+
+    def _send(self, payload: dict, op: str, s=None) -> dict:
+        """
+        One logical request within the op's deadline. A second, identical request goes out
+        when the first has run past the observed p95 (or failed fast with a retryable error);
+        the first answer wins. The breaker hears one result per call.
+        """
+        if not self.breaker.allow():
+            raise self._fail(op, "breaker", CircuitOpenError(f"{op}: upstream circuit open"))
+        deadline = time.monotonic() + self.deadlines.get(op, 10.0)
+        timeout = self.latency.timeout(op)
+        delay = self.latency.hedge_delay(op) if self.hedge else None
+        if s is not None:
+            s.attrs.update(timeout_s=round(timeout, 3), hedge_after_s=None if delay is None else round(delay, 3))
+
+        def submit():
+            left = max(0.05, deadline - time.monotonic())
+            return self._attempts.submit(self._attempt, payload, min(timeout, left), op)
+
+        first = submit()
+        pending, hedged, error = {first}, False, None
+        hedge_at = None if delay is None else time.monotonic() + delay
+        while time.monotonic() < deadline:
+            wake = deadline if hedged or hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    body = f.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if f is not first:
+                    LLM_HEDGES.inc(op=op, outcome="won")
+                    self._tally("hedge_wins")
+                self.breaker.record(True)
+                return body
+            slow = bool(pending) and hedge_at is not None and time.monotonic() >= hedge_at
+            failed_fast = not pending and error is not None and _retryable(error)
+            if not hedged and (slow or failed_fast) and time.monotonic() < deadline:
+                hedged = True
+                pending.add(submit())
+                LLM_HEDGES.inc(op=op, outcome="sent")
+                self._tally("hedges")
+            elif not pending:
+                break
+        self.breaker.record(False)
+        if pending:
+            raise self._fail(op, "deadline", DeadlineExceeded(f"{op}: no answer within {self.deadlines.get(op, 10.0)}s"))
+        raise self._fail(op, "error", UpstreamError(f"{op}: {error}")) from error
+
+    def _complete(self, payload: dict, op: str = "chat") -> Tuple[str, Optional[str]]:
+        """
+        Message content for a completion request, served from the cache when possible, and the key
+        to cache it under once the caller has validated it (None for cache hits or without a cache).
+        """
+        with span("llm", op=op) as s:
+            key = make_key(self.base_url, payload) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    s.attrs["cached"] = True
+                    self._count(op, cache_hit=True)
+                    return cached, None
+            self._measure(op, payload["messages"], s)
+            body = self._send(payload, op, s)
+            usage = body.get("usage") or {}
+            s.attrs.update(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+            return body["choices"][0]["message"]["content"], key
+
+    def _remember(self, key: Optional[str], content: str):
+        if key is not None:
+            self.cache.set(key, content)
+
+    def chat(self, messages):
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": 0.3,
             "max_tokens": 200
         }
-        r = requests.post(url, json=payload, headers=headers, timeout=30)
-        r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"].strip()
+        content, key = self._complete(payload, op="chat")
+        if content.strip():
+            self._remember(key, content)
+        return content.strip()
 
-    def parse_user_turn(self, memory_text: str, user_input: str) -> dict:
-        """Interpret intent & slots dynamically."""
-        url = f"{self.base_url}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        system = {
-            "role": "system",
-            "content": (
-                "You are the NLP parser for RescueHub.\n"
-                "Analyze the user's input (with possible STT errors) in context of previous dialogue.\n"
-                "Return only a compact JSON object:\n"
-                "{"
-                "\"intent\": \"fire|medical|other\","
-                "\"address\": \"string or null\","
-                "\"injury\": true/false/null,"
-                "\"severity\": \"high|low|null\","
-                "\"escalate_to_medical\": true/false"
-                "}"
-            )
+    @traced("analyze")
+    def analyze_turn(self, memory_text: str, user_input: str,
+                     fallback: Optional[Callable[[], TurnAnalysis]] = None) -> TurnAnalysis:
+        """
+        One structured call per turn; every agent reads from the returned analysis.
+        fallback supplies the analysis when the upstream fails or the breaker is open.
+        """
+        prompt = self.prompts.build(TURN_ANALYSIS_PROMPT, f"Caller: {user_input}", history=memory_text,
+                                    budget=ANALYZE_BUDGET)
+        data = {
+            "model": self.model,
+            "messages": prompt.messages,
+            "temperature": 0.1,
+            "max_tokens": 200,
+            "response_format": {"type": "json_object"},
         }
-        user = {"role": "user", "content": f"Context:\n{memory_text}\n\nCaller: {user_input}"}
-        data = {"model": self.model, "messages": [system, user], "temperature": 0.1}
-        r = requests.post(url, json=data, headers=headers, timeout=40)
         try:
-            content = r.json()["choices"][0]["message"]["content"]
-            return json.loads(content)
+            content, key = self._complete(data, op="analyze")
+            analysis = TurnAnalysis.from_dict(json.loads(content))
+            self._remember(key, content)
+            return analysis
         except Exception as e:
-            print("[Parse Error]", e)
-            return {"intent": None, "address": None, "injury": None, "severity": None, "escalate_to_medical": False}
+            if fallback is not None:
+                return fallback()
+            print("[Analysis Error]", e)
+            return TurnAnalysis()
+
+    # ---------- asyncio API ----------
+    # The blocking calls run on worker threads over the shared session pool, so
+    # independent requests of one turn overlap instead of queuing behind each other.
+    async def achat(self, messages):
+        return await asyncio.to_thread(self.chat, messages)
+
+    async def aanalyze_turn(self, memory_text: str, user_input: str,
+                            fallback: Optional[Callable[[], TurnAnalysis]] = None) -> TurnAnalysis:
+        return await asyncio.to_thread(self.analyze_turn, memory_text, user_input, fallback)
+
+    def close(self):
+        self._attempts.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+LLM_BACKENDS = ("remote", "local")
+
+def get_llm_client(backend: Optional[str] = None, **kwargs) -> GPTClient:
+    """
+    The LLM client for backend "remote" (the GapGPT API) or "local" (FLAN-T5 on this machine,
+    see local_llm.py); the default comes from RESCUEHUB_LLM.
+    """
+    backend = backend or os.getenv("RESCUEHUB_LLM", "remote")
+    if backend == "local":
+        from local_llm import LocalLLMClient
+        return LocalLLMClient(**kwargs)
+    if backend != "remote":
+        raise ValueError(f"Unknown LLM backend {backend!r}; choose one of {', '.join(LLM_BACKENDS)}")
+    return GPTClient(**kwargs)
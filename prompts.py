@@ -0,0 +1,166 @@
+import re, threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Union
+
+# Rough BPE stand-in when tiktoken is not installed: digits in threes, letters in fours,
+# each punctuation mark on its own. Counts land slightly above the real tokenizer's,
+# which is the safe side for a budget.
+_APPROX = re.compile(r"\d{1,3}|[^\W\d_]{1,4}|_|[^\w\s]")
+MESSAGE_OVERHEAD = 4  # role and separators per chat message
+REPLY_PRIMING = 2
+
+
+class Tokenizer:
+    """Local token counts for prompts; tiktoken's encoding for the model if available."""
+
+    def __init__(self, model: str = "gpt-4o-mini"):
+        self.model = model
+        self._enc = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        try:
+                            self._enc = tiktoken.encoding_for_model(self.model)
+                        except KeyError:
+                            self._enc = tiktoken.get_encoding("o200k_base")
+                    except Exception:
+                        self._enc = None  # not installed, or no encoding files offline
+                    self._loaded = True
+        return self._enc
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        enc = self.encoding
+        if enc is not None:
+            return len(enc.encode(text, disallowed_special=()))
+        return len(_APPROX.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The first max_tokens tokens of text."""
+        if max_tokens <= 0:
+            return ""
+        enc = self.encoding
+        if enc is not None:
+            ids = enc.encode(text, disallowed_special=())
+            return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens]).rstrip() + "…"
+        spans = list(_APPROX.finditer(text))
+        if len(spans) <= max_tokens:
+            return text
+        cut = text[:spans[max_tokens - 1].end()]
+        if text[len(cut)].isalnum() and " " in cut:
+            cut = cut.rsplit(" ", 1)[0]  # not mid-word
+        return cut.rstrip() + "…"
+
+    def count_messages(self, messages: Sequence[dict]) -> int:
+        return sum(self.count(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages) + REPLY_PRIMING
+
+
+@dataclass
+class Prompt:
+    messages: List[dict]
+    tokens: int
+    dropped: int = 0                      # context lines and recall snippets left out
+    truncated: int = 0                    # ones cut short to fit
+    sections: dict = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """
+    Assembles [system, user] messages under a token budget. The system message is the
+    caller's constant, never mixed with per-call text, so every request of a kind starts
+    with the same prefix and the provider can reuse its cached prefix. The user message
+    holds recalled snippets (best first), the newest dialogue lines that fit, then the query.
+    """
+
+    def __init__(self, tokenizer: Optional[Tokenizer] = None, budget: int = 1024,
+                 history_share: float = 0.7, min_snippet: int = 16):
+        self.tokenizer = tokenizer if tokenizer is not None else Tokenizer()
+        self.budget = budget
+        self.history_share = history_share
+        self.min_snippet = min_snippet
+
+    @staticmethod
+    def _lines(items: Union[str, Sequence[str], None]) -> List[str]:
+        if not items:
+            return []
+        if isinstance(items, str):
+            items = items.splitlines()
+        return [l.strip() for l in items if l and l.strip()]
+
+    def _fit(self, lines: List[str], room: int, newest_first: bool):
+        """Whole lines while they fit, then one cut-down line if enough room is left."""
+        count = self.tokenizer.count
+        order = list(reversed(lines)) if newest_first else lines
+        kept, used, truncated = [], 0, 0
+        for line in order:
+            n = count(line) + 1  # the newline
+            if used + n <= room:
+                kept.append(line)
+                used += n
+                continue
+            if room - used > self.min_snippet:
+                kept.append(self.tokenizer.truncate(line, room - used - 1))
+                used = room
+                truncated = 1
+            break
+        if newest_first:
+            kept.reverse()
+        return kept, used, len(lines) - len(kept), truncated
+
+    def build(self, system: str, query: str, history: Union[str, Sequence[str], None] = None,
+              recall: Union[str, Sequence[str], None] = None, budget: Optional[int] = None,
+              history_label: str = "Context", recall_label: str = "From earlier calls") -> Prompt:
+        """
+        history: the dialogue so far, oldest first (a joined string is split into lines);
+        recall: snippets ranked best first. system and query are always sent whole.
+        """
+        budget = budget or self.budget
+        count = self.tokenizer.count
+        fixed = self.tokenizer.count_messages([{"content": system}, {"content": query}])
+        room = max(0, budget - fixed - count(history_label) - count(recall_label) - 4)
+        history, recall = self._lines(history), self._lines(recall)
+
+        # newest dialogue first, up to its share; recall gets the rest; recall's slack goes back to history
+        h_room = room if not recall else int(room * self.history_share)
+        kept_h, used_h, _, _ = self._fit(history, h_room, newest_first=True)
+        kept_r, used_r, dropped_r, cut_r = self._fit(recall, room - used_h, newest_first=False)
+        kept_h, used_h, dropped_h, cut_h = self._fit(history, room - used_r, newest_first=True)
+
+        parts = []
+        if kept_r:
+            parts.append(f"{recall_label}:\n" + "\n".join(kept_r))
+        if kept_h:
+            parts.append(f"{history_label}:\n" + "\n".join(kept_h))
+        parts.append(query)
+        messages = [{"role": "system", "content": system}, {"role": "user", "content": "\n\n".join(parts)}]
+        return Prompt(messages, self.tokenizer.count_messages(messages), dropped_h + dropped_r, cut_h + cut_r,
+                      {"history": used_h, "recall": used_r, "fixed": fixed})
+
+
+_builder: Optional[PromptBuilder] = None
+
+def get_prompt_builder() -> PromptBuilder:
+    global _builder
+    if _builder is None:
+        _builder = PromptBuilder()
+    return _builder
+
+
+def count_tokens(text: str) -> int:
+    return get_prompt_builder().tokenizer.count(text)
+
+
+def count_messages(messages: Sequence[dict]) -> int:
+    return get_prompt_builder().tokenizer.count_messages(messages)
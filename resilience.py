@@ -0,0 +1,133 @@
+import time, threading
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+import numpy as np
+from tracing import LLM_BREAKER_TRANSITIONS
+
+
+class UpstreamError(RuntimeError):
+    """The LLM upstream did not answer in time, failed, or is being bypassed."""
+
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class LatencyTracker:
+    """
+    Recent successful latencies per request kind. Until min_samples are seen the fixed
+    defaults apply; after that the attempt timeout follows p99 (times a safety factor)
+    and a hedge is sent once an attempt has run for p95.
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 10, factor: float = 2.0,
+                 floor_s: float = 1.0, ceiling_s: float = 30.0, default_s: float = 10.0,
+                 default_hedge_s: float = 2.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.factor = factor
+        self.floor_s = floor_s
+        self.ceiling_s = ceiling_s
+        self.default_s = default_s
+        self.default_hedge_s = default_hedge_s
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, op: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(op, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, op: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(op, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, q))
+
+    def timeout(self, op: str) -> float:
+        p99 = self.quantile(op, 99)
+        if p99 is None:
+            return self.default_s
+        return min(self.ceiling_s, max(self.floor_s, p99 * self.factor))
+
+    def hedge_delay(self, op: str) -> float:
+        p95 = self.quantile(op, 95)
+        return self.default_hedge_s if p95 is None else p95
+
+    def report(self) -> dict:
+        with self._lock:
+            ops = list(self._samples)
+        out = {}
+        for op in ops:
+            p50, p95 = self.quantile(op, 50), self.quantile(op, 95)
+            out[op] = {"p50_s": None if p50 is None else round(p50, 3),
+                       "p95_s": None if p95 is None else round(p95, 3),
+                       "timeout_s": round(self.timeout(op), 3)}
+        return out
+
+
+class CircuitBreaker:
+    """
+    Opens when at least failure_rate of the last `window` calls (and at least min_calls)
+    failed; while open, calls are refused at once. After open_s one probe is let through
+    (half-open): its success closes the breaker, its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5, open_s: float = 15.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_s = open_s
+        self.clock = clock
+        self.state = self.CLOSED
+        self.stats = {"rejected": 0, "opened": 0}
+        self._results: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str):
+        if state != self.state:
+            self.state = state
+            LLM_BREAKER_TRANSITIONS.inc(state=state)
+            if state == self.OPEN:
+                self.stats["opened"] += 1
+                self._opened_at = self.clock()
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != self.CLOSED
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.open_s:
+                self._set(self.HALF_OPEN)
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probing):
+                self._probing = self.state == self.HALF_OPEN
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                self._results.clear()
+                self._set(self.CLOSED if ok else self.OPEN)
+                return
+            self._results.append(ok)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures >= self.failure_rate * len(self._results):
+                self._results.clear()
+                self._set(self.OPEN)
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"state": self.state, **self.stats}
@@ -0,0 +1,269 @@
+import asyncio, itertools, uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+from nlp import TurnAnalysis, get_llm_client
+from agents import Orchestrator, Ctx
+from speech_corrector import SpeechCorrector
+from fast_nlu import FastNLU
+from memory_manager import MemoryManager
+from cache import TieredCache, LRUCache, SqliteCache
+from vector_memory import get_vector_memory
+from embeddings import get_embedding_service, normalize_text
+from tracing import span
+from startup import warm_up
+
+GREETING = "RescueHub is listening. Please describe your emergency."
+GOODBYE = "Help is on the way. Stay safe."
+BUSY = "All our lines are busy right now. Please stay on the line and repeat your message."
+
+class SessionLimitError(RuntimeError):
+    pass
+
+
+@dataclass
+class PreparedTurn:
+    corrected: str          # transcript after STT correction; what the agents see and what is stored
+    analysis: TurnAnalysis
+    memory_context: str = ""  # recalled summaries, shown beside the text, never mixed into it
+
+
+# ====== Shared services ======
+class Services:
+    """What every call shares: one GPT connection pool, embedding model, sharded vector store and incident store."""
+
+    def __init__(self, persist_dir: str = "memory_store", pool_size: int = 16, llm: Optional[str] = None):
+        self.llm_cache = TieredCache(
+            LRUCache(max_entries=2048, ttl=60 * 60),
+            SqliteCache(f"{persist_dir}/llm_cache.sqlite", ttl=7 * 24 * 60 * 60),
+        )
+        # llm: "remote" (the API) or "local" (FLAN-T5 on this machine); default from RESCUEHUB_LLM
+        self.gpt = get_llm_client(llm, pool_size=pool_size, cache=self.llm_cache)
+        self.corrector = SpeechCorrector(self.gpt)
+        self.nlu = FastNLU()
+        self.embedder = get_embedding_service(cache_path=f"{persist_dir}/embeddings.sqlite")
+        self.vector = get_vector_memory(persist_dir)
+        self.memory_mgr = MemoryManager(self.gpt, persist_dir=persist_dir, vector=self.vector)
+
+    def report(self) -> dict:
+        return {"llm_cache": self.llm_cache.report(), "embeddings": self.embedder.stats(),
+                "corrector": self.corrector.report(), "nlu": self.nlu.report(),
+                "summaries": self.memory_mgr.summaries.report(), "upstream": self.gpt.resilience_report(),
+                "vector": self.vector.report()}
+
+    def close(self):
+        self.memory_mgr.close()
+        self.vector.close()
+        self.embedder.close()
+        self.gpt.close()
+        self.llm_cache.close()
+
+
+# ====== One call ======
+class CallSession:
+    """A single caller: its own Ctx and conversation memory on top of the shared services."""
+
+    def __init__(self, session_id: str, services: Services):
+        self.id = session_id
+        # ids repeat across restarts ("call_1"); stored turns and summaries need a key that doesn't
+        self.key = f"{session_id}-{uuid.uuid4().hex[:12]}"
+        self.services = services
+        self.orch = Orchestrator(services.gpt, memory_vec=services.vector, nlu=services.nlu, session=self.key)
+        self.ctx = Ctx()
+        self.turns = 0
+        self._lock = asyncio.Lock()
+        # speculative prepare() started on a stable partial transcript: (key, task)
+        self._spec: Optional[Tuple[tuple, asyncio.Task]] = None
+        self.speculation = {"started": 0, "used": 0, "discarded": 0}
+
+    @property
+    def done(self) -> bool:
+        return self.ctx.done
+
+    async def correct(self, user_raw: str, words: Optional[List[Tuple[str, float]]] = None,
+                      typed: bool = False) -> str:
+        return await asyncio.to_thread(self.services.corrector.correct, user_raw,
+                                       self.orch.memory.get_summary(), words, typed)
+
+    async def prepare(self, user_raw: str, words: Optional[List[Tuple[str, float]]] = None,
+                      typed: bool = False) -> PreparedTurn:
+        """Correct the transcript, then recall and analyze it concurrently."""
+        return await self._prepare_corrected(await self.correct(user_raw, words, typed))
+
+    async def _prepare_corrected(self, corrected: str) -> PreparedTurn:
+        svc = self.services
+        # recall and turn analysis only depend on the corrected text — run them side by side
+        memory_context, analysis = await asyncio.gather(
+            asyncio.to_thread(svc.memory_mgr.recall_context, corrected, self.orch.recall_incident(corrected),
+                              session=self.key),
+            self.orch.aanalyze(corrected),
+        )
+        return PreparedTurn(corrected, analysis, memory_context)
+
+    # ---------- speculation ----------
+    def _spec_key(self, text: str) -> tuple:
+        # a prepared turn is only valid for the same words and the same conversation state
+        return normalize_text(text), self.turns
+
+    def speculate(self, partial: str):
+        """
+        Start recall and analysis on a stable partial transcript before the final arrives.
+        It is assumed clean; the work is reused only if correcting the final leaves the same words.
+        """
+        key = self._spec_key(partial)
+        if self._spec is not None and self._spec[0] == key:
+            return
+        self.discard_speculation()
+        self._spec = (key, asyncio.ensure_future(self._prepare_corrected(partial)))
+        self.speculation["started"] += 1
+
+    def discard_speculation(self):
+        if self._spec is not None:
+            self._spec[1].cancel()
+            self._spec = None
+            self.speculation["discarded"] += 1
+
+    async def prepare_final(self, final: str, words: Optional[List[Tuple[str, float]]] = None,
+                            typed: bool = False) -> PreparedTurn:
+        """prepare() for the final transcript, reusing speculative work when the words match."""
+        corrected = await self.correct(final, words, typed)
+        if self._spec is not None and self._spec[0] == self._spec_key(corrected):
+            task = self._spec[1]
+            self._spec = None
+            try:
+                turn = await task
+                self.speculation["used"] += 1
+                return turn
+            except Exception:
+                self.speculation["discarded"] += 1
+        self.discard_speculation()
+        return await self._prepare_corrected(corrected)
+
+    def reply_stream(self, turn: PreparedTurn) -> Iterator[Tuple[str, str]]:
+        return self.orch.step_stream(turn.corrected, self.ctx, turn.analysis)
+
+    async def finish(self, turn: PreparedTurn, reply: str):
+        self.turns += 1
+        # filed under the turn's analysed type, which is what explicit recall searches by;
+        # ctx.incident_type stays unset until something is dispatched
+        await asyncio.to_thread(self.services.memory_mgr.add_entry, turn.corrected, reply,
+                                incident=self.orch.detect_initial_agent(turn.analysis), session=self.key,
+                                address=self.ctx.address)
+
+    async def turn(self, user_raw: str, typed: bool = True) -> str:
+        """One full turn without streaming; returns the formatted reply."""
+        with span("turn", call=self.id, turn=self.turns):
+            prepared = await self.prepare(user_raw, typed=typed)
+            parts = await asyncio.to_thread(lambda: list(self.reply_stream(prepared)))
+            reply = self.orch.format_reply(parts)
+            await self.finish(prepared, reply)
+            return reply
+
+
+# ====== Many calls ======
+class SessionManager:
+    """
+    Runs many calls in one process. Backpressure: at most max_sessions open calls,
+    at most max_active_turns turns in flight (others queue), and one turn per call at a time.
+    """
+
+    def __init__(self, services: Services, max_sessions: int = 64, max_active_turns: int = 16,
+                 queue_timeout: float = 30.0):
+        self.services = services
+        self.max_sessions = max_sessions
+        self.queue_timeout = queue_timeout
+        self.sessions: Dict[str, CallSession] = {}
+        self._turns = asyncio.Semaphore(max_active_turns)
+        self._ids = itertools.count(1)
+        self.completed = 0
+        self.rejected = 0
+
+    def open(self) -> CallSession:
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected += 1
+            raise SessionLimitError(f"{len(self.sessions)} calls already open")
+        session = CallSession(f"call_{next(self._ids)}", self.services)
+        self.sessions[session.id] = session
+        return session
+
+    def close(self, session: CallSession):
+        if self.sessions.pop(session.id, None) is not None and session.done:
+            self.completed += 1
+
+    async def run_turn(self, session: CallSession, user_raw: str) -> str:
+        async with session._lock:
+            try:
+                await asyncio.wait_for(self._turns.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                return f"RescueHub: {BUSY}"
+            try:
+                return await session.turn(user_raw)
+            finally:
+                self._turns.release()
+
+    def stats(self) -> dict:
+        return {"open": len(self.sessions), "completed": self.completed, "rejected": self.rejected,
+                **self.services.report()}
+
+
+# ====== Text front end ======
+async def _handle_client(manager: SessionManager, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    def send(line: str):
+        writer.write((line + "\n").encode("utf-8"))
+
+    try:
+        session = manager.open()
+    except SessionLimitError:
+        send(f"RescueHub: {BUSY}")
+        await writer.drain()
+        writer.close()
+        return
+
+    peer = writer.get_extra_info("peername")
+    print(f"[{session.id}] connected from {peer}")
+    try:
+        send(f"RescueHub: {GREETING}")
+        await writer.drain()
+        while not session.done:
+            line = await reader.readline()
+            if not line:
+                break
+            text = line.decode("utf-8", errors="replace").strip()
+            if not text:
+                continue
+            try:
+                reply = await manager.run_turn(session, text)
+            except Exception as e:
+                print(f"[{session.id}] turn failed: {e}")
+                reply = "RescueHub: Sorry, I didn't catch that. Please repeat."
+            send(reply)
+            await writer.drain()
+        if session.done:
+            send(f"RescueHub: {GOODBYE}")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        manager.close(session)
+        print(f"[{session.id}] closed after {session.turns} turns")
+        writer.close()
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, max_sessions: int = 64,
+                max_active_turns: int = 16, persist_dir: str = "memory_store", llm: Optional[str] = None):
+    """Line-based text server: one TCP connection is one call (try it with `nc 127.0.0.1 8765`)."""
+    loop = asyncio.get_running_loop()
+    # blocking HTTP/embedding work runs on threads; size the pool for the turns we admit
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_active_turns * 4))
+    services = Services(persist_dir=persist_dir, pool_size=max_active_turns * 2, llm=llm)
+    # start listening right away; the embedding model (and a local LLM) load in the background
+    warm_up({"embeddings": services.embedder.warm, "llm": services.gpt.warm},
+            on_done=lambda r: print(f"[Startup]\n{r.format()}"))
+    manager = SessionManager(services, max_sessions=max_sessions, max_active_turns=max_active_turns)
+    server = await asyncio.start_server(lambda r, w: _handle_client(manager, r, w), host, port)
+    print(f"=== RescueHub serving on {host}:{port} (max {max_sessions} calls, {max_active_turns} active turns) ===")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"[Sessions] {manager.stats()}")
+        services.close()
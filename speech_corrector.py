@@ -1,21 +1,156 @@
+from typing import List, Optional, Sequence, Tuple
 from nlp import GPTClient
+from prompts import PromptBuilder, get_prompt_builder
+from resilience import UpstreamError
+from tracing import traced, LLM_FALLBACKS
+
+# words the emergency line actually needs to get right; low-confidence STT words are snapped to these
+EMERGENCY_LEXICON = (
+    "fire", "fires", "smoke", "smoking", "flames", "burning", "burn", "burns", "burned", "burnt",
+    "explosion", "gas", "leak", "kitchen", "house", "building", "apartment", "flat", "floor", "garage",
+    "injury", "injuries", "injured", "hurt", "pain", "bleeding", "blood", "wound", "cut",
+    "broken", "fracture", "bone", "leg", "arm", "head", "chest", "unconscious", "fainted",
+    "breathing", "breathe", "conscious", "degree", "second", "third", "ambulance", "doctor",
+    "firefighters", "emergency", "help", "trapped", "stuck", "children", "child", "baby",
+    "address", "street", "avenue", "road", "lane", "boulevard", "way", "number",
+)
+
+# everyday words a lexicon entry is one or two edits away from ("fine"/"fire", "would"/"wound");
+# a low-confidence word found here is left to the LLM rather than snapped
+COMMON_WORDS = (
+    "about", "after", "again", "also", "army", "arms", "babe", "back", "because", "been", "billing", "blonde",
+    "bloody", "bond", "born", "breath", "broke", "brother", "burned", "call", "called", "calling", "chill",
+    "chile", "come", "coming", "could", "cute", "daughter", "does", "done", "door", "down", "even", "fine",
+    "fired", "first", "five", "flame", "float", "flour", "four", "frames", "from", "garbage", "give", "going",
+    "gone", "good", "have", "hear", "heard", "heat", "held", "hell", "helm", "here", "hire", "home", "hope",
+    "hose", "hurts", "injured", "just", "kitten", "know", "lake", "land", "late", "lean", "like", "line",
+    "look", "made", "make", "many", "more", "much", "name", "need", "next", "only", "other", "over", "paid",
+    "paint", "pains", "place", "please", "read", "right", "said", "same", "send", "some", "sorry", "still",
+    "stick", "stock", "stoking", "struck", "such", "sure", "take", "tapped", "tell", "than", "thank", "that",
+    "their", "them", "then", "there", "these", "they", "thing", "think", "thirty", "this", "tire", "tired",
+    "very", "want", "well", "went", "were", "what", "when", "where", "which", "while", "will", "wire", "with",
+    "would", "yeah", "your",
+)
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
 
 class SpeechCorrector:
-    """Fixes STT errors using GPT contextual understanding."""
-    def __init__(self, gpt: GPTClient):
+    """
+    Fixes STT errors. Typed input and confidently recognized transcripts pass through;
+    low-confidence words are first snapped to the emergency lexicon, and only spans
+    the lexicon cannot resolve are sent to GPT with the surrounding context.
+    """
+
+    # constant system prefix; the transcript and its context go in the user message
+    PROMPT = (
+        "You are a speech-to-text corrector for an emergency assistant (RescueHub).\n"
+        "Fix grammar and recognition errors in the user's voice transcript without changing meaning.\n"
+        "Prefer emergency-related words (fire, burn, injury, ambulance, address).\n"
+        "If some words are listed as low confidence, keep every other word.\n"
+        "Return only the corrected sentence."
+    )
+    BUDGET = 384
+
+    def __init__(self, gpt: GPTClient, min_confidence: float = 0.80,
+                 lexicon: Sequence[str] = EMERGENCY_LEXICON, prompts: Optional[PromptBuilder] = None,
+                 common_words: Sequence[str] = COMMON_WORDS):
         self.gpt = gpt
+        self.prompts = prompts if prompts is not None else get_prompt_builder()
+        self.min_confidence = min_confidence
+        self.lexicon = tuple(dict.fromkeys(w.lower() for w in lexicon))
+        self._lexicon_set = set(self.lexicon)
+        self._common = {w.lower() for w in common_words} - self._lexicon_set
+        self.stats = {"typed": 0, "clean": 0, "lexicon": 0, "llm": 0, "fallback": 0}
 
-    def correct(self, raw_text: str, memory_summary: str = "") -> str:
+    def _lexicon_fix(self, word: str) -> Optional[str]:
+        """
+        The single closest lexicon word within a length-scaled edit distance, if any. Only unfamiliar
+        words of four letters or more are snapped, and only to entries with the same first letter;
+        the rest ("fine", "hire") are left to the LLM.
+        """
+        w = word.lower()
+        if w in self._lexicon_set:
+            return w
+        if len(w) < 4 or w in self._common:
+            return None
+        limit = 1 if len(w) <= 5 else 2
+        best_d, best = limit + 1, []
+        for cand in self.lexicon:
+            if cand[0] != w[0]:
+                continue
+            d = edit_distance(w, cand, limit)
+            if d < best_d:
+                best_d, best = d, [cand]
+            elif d == best_d:
+                best.append(cand)
+        if not best or best_d > limit:
+            return None
+        # ties between inflections of one word ("fire"/"fires") resolve to the base form
+        if len({c[:3] for c in best}) == 1:
+            return min(best, key=len)
+        return None
+
+    @traced("correct")
+    def correct(self, raw_text: str, memory_summary: str = "",
+                words: Optional[List[Tuple[str, float]]] = None, typed: bool = False) -> str:
+        """
+        words: (word, confidence) pairs from the recognizer for raw_text. Without them
+        (and not typed) the whole transcript goes to GPT as before.
+        """
         if not raw_text.strip():
             return raw_text
-        prompt = (
-            "You are a speech-to-text corrector for an emergency assistant (RescueHub).\n"
-            "Fix grammar and recognition errors in the user's voice transcript without changing meaning.\n"
-            "Prefer emergency-related words (fire, burn, injury, ambulance, address).\n"
-            "Return only the corrected sentence.\n"
-            f"Context:\n{memory_summary}\nUser said (possibly wrong): {raw_text}"
-        )
-        response = self.gpt.chat([
-            {"role": "system", "content": prompt}
-        ])
+        if typed:
+            self.stats["typed"] += 1
+            return raw_text
+        if words:
+            tokens = [w for w, _ in words]
+            unsure = [i for i, (_, conf) in enumerate(words) if conf < self.min_confidence]
+            if not unsure:
+                self.stats["clean"] += 1
+                return raw_text
+            unresolved = []
+            for i in unsure:
+                if len(tokens[i]) <= 2:
+                    continue  # "a", "is", "at": not worth a round trip
+                fixed = self._lexicon_fix(tokens[i])
+                if fixed is None:
+                    unresolved.append(i)
+                else:
+                    tokens[i] = fixed
+            if not unresolved:
+                self.stats["lexicon"] += 1
+                return " ".join(tokens)
+            return self._llm_correct(" ".join(tokens), memory_summary, [tokens[i] for i in unresolved])
+        return self._llm_correct(raw_text, memory_summary)
+
+    def _llm_correct(self, text: str, memory_summary: str, unsure: Optional[List[str]] = None) -> str:
+        self.stats["llm"] += 1
+        query = f"User said (possibly wrong): {text}"
+        if unsure:
+            query = "Low-confidence words: " + ", ".join(unsure) + "\n" + query
+        prompt = self.prompts.build(self.PROMPT, query, history=memory_summary, budget=self.BUDGET)
+        try:
+            response = self.gpt.chat(prompt.messages)
+        except UpstreamError:
+            # upstream slow or down: the transcript as the lexicon left it beats a stalled caller
+            self.stats["fallback"] += 1
+            LLM_FALLBACKS.inc(component="correct")
+            return text
         return response.strip()
+
+    def report(self) -> dict:
+        total = sum(self.stats.values()) - self.stats["fallback"]  # fallbacks are LLM turns that failed
+        skipped = total - self.stats["llm"]
+        return {**self.stats, "llm_skipped_rate": round(skipped / total, 4) if total else 0.0}
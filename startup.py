@@ -0,0 +1,99 @@
+import time, importlib, threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Optional
+from tracing import record_span
+
+
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+class StartupReport:
+    """Milestones since process start plus how long each warm-up step took."""
+
+    def __init__(self, t0: Optional[float] = None):
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        self.steps: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name: str, at: Optional[float] = None):
+        """Record a milestone now, or at a perf_counter() timestamp taken elsewhere."""
+        with self._lock:
+            self.marks[name] = (at if at is not None else time.perf_counter()) - self.t0
+
+    def step(self, name: str, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            self.steps[name] = {"seconds": round(seconds, 3),
+                                "ready_at": round(time.perf_counter() - self.t0, 3), "error": error}
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"marks": {k: round(v, 3) for k, v in self.marks.items()}, "warm_up": dict(self.steps)}
+
+    def format(self) -> str:
+        data = self.as_dict()
+        lines = [f"  {name:<18} at {t:6.3f}s" for name, t in data["marks"].items()]
+        for name, row in data["warm_up"].items():
+            status = f"failed: {row['error']}" if row["error"] else "ok"
+            lines.append(f"  warm {name:<13} {row['seconds']:6.3f}s (ready at {row['ready_at']:.3f}s) {status}")
+        return "\n".join(lines)
+
+
+def warm_up(steps: Dict[str, Callable[[], object]], report: Optional[StartupReport] = None,
+            on_done: Optional[Callable[[StartupReport], None]] = None) -> Dict[str, Future]:
+    """
+    Run the loaders side by side on background threads and return their futures at once.
+    Model loads spend most of their time in native code, so they genuinely overlap.
+    """
+    report = report or StartupReport()
+    pool = ThreadPoolExecutor(max_workers=max(1, len(steps)), thread_name_prefix="warm-up")
+
+    def run(name: str, fn: Callable[[], object]):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            return fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - t0
+            report.step(name, seconds, error)
+            record_span(f"startup.{name}", seconds)
+
+    futures = {name: pool.submit(run, name, fn) for name, fn in steps.items()}
+    pool.shutdown(wait=False)
+    if on_done is not None:
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                on_done(report)
+
+        for fut in futures.values():
+            fut.add_done_callback(finished)
+    return futures
@@ -0,0 +1,149 @@
+import time, threading
+from typing import Dict, List, Optional
+from cache import TieredCache, LRUCache, SqliteCache
+from prompts import get_prompt_builder
+from tracing import span, LLM_FALLBACKS
+
+SUMMARY_PROMPT = (
+    "You are RescueHub's memory summarizer.\n"
+    "Update the running summary of an emergency call with its newest turns. "
+    "Keep what still matters (address, incident type, injuries, what was dispatched) in 1–2 sentences. "
+    "Return only the summary."
+)
+SUMMARY_BUDGET = 768
+SUMMARY_CHARS = 480     # extractive fallback: running summary length
+
+
+def clip(text: str, limit: int = 240) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+class RollingSummaries:
+    """
+    One running summary per key ("session:<id>", "incident:<address>"), folded forward as
+    turns arrive instead of re-summarizing recalled chunks on every lookup. Updates run on
+    a background thread; turns that arrive within `delay` of each other share one LLM call.
+    get() never touches the network: it returns the latest summary, or None before the first.
+    """
+
+    def __init__(self, gpt=None, path: Optional[str] = None, delay: float = 2.0):
+        self.gpt = gpt
+        self.delay = delay
+        self.cache = TieredCache(LRUCache(max_entries=4096), SqliteCache(path) if path else None)
+        self.stats = {"turns": 0, "updates": 0, "llm": 0, "lookups": 0, "hits": 0}
+        self._pending: Dict[str, List[str]] = {}
+        self._due: Dict[str, float] = {}
+        self._busy = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="summaries", daemon=True)
+        self._worker.start()
+
+    def get(self, key: str) -> Optional[str]:
+        self.stats["lookups"] += 1
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        self.stats["hits"] += 1
+        return entry["summary"]
+
+    def add(self, key: str, turn: str):
+        """Queue a turn for key's summary; the summary changes only when turns are added."""
+        if not turn.strip():
+            return
+        with self._cond:
+            self.stats["turns"] += 1
+            self._pending.setdefault(key, []).append(turn)
+            self._due.setdefault(key, time.monotonic() + self.delay)
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Fold every queued turn in now; True once nothing is pending."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for key in self._due:
+                self._due[key] = 0.0
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def close(self, timeout: float = 30.0):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        self.cache.close()
+
+    def report(self) -> dict:
+        return dict(self.stats)
+
+    # ---------- worker ----------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [k for k, t in self._due.items() if t <= now]
+                    if due:
+                        break
+                    wait = min(self._due.values()) - now if self._due else None
+                    self._cond.wait(wait)
+                if self._closed:
+                    return
+                batch = {k: self._pending.pop(k) for k in due}
+                for k in due:
+                    del self._due[k]
+                self._busy += 1
+            try:
+                for key, turns in batch.items():
+                    self._update(key, turns)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _update(self, key: str, turns: List[str]):
+        entry = self.cache.get(key) or {"summary": "", "turns": 0}
+        with span("summary.update", key=key, turns=len(turns)):
+            summary = self._fold(entry["summary"], turns)
+        self.cache.set(key, {"summary": summary, "turns": entry["turns"] + len(turns)})
+        self.stats["updates"] += 1
+
+    def _fold(self, previous: str, turns: List[str]) -> str:
+        if self.gpt is not None:
+            self.stats["llm"] += 1
+            try:
+                # newest turns win when a burst is larger than the budget
+                prompt = get_prompt_builder().build(SUMMARY_PROMPT, f"Summary so far: {previous or '(none)'}",
+                                                    history=turns, budget=SUMMARY_BUDGET, history_label="New turns")
+                summary = self.gpt.chat(prompt.messages).strip()
+                if summary:
+                    return summary
+            except Exception:
+                LLM_FALLBACKS.inc(component="summary")
+        # no model (or it failed): keep the summary so far and append the newest turns, clipped
+        return extend(previous, turns)
+
+
+def extend(previous: str, turns: List[str], limit: int = SUMMARY_CHARS) -> str:
+    """
+    Extractive fold: the start of the previous summary (up to half of limit, where the address
+    and incident usually are) followed by as many of the newest turns as fit in the rest.
+    """
+    kept = clip(previous, limit // 2) if previous.strip() else ""
+    room = limit - len(kept)
+    fresh: List[str] = []
+    for turn in reversed(turns):
+        room -= 1
+        if room < 16:
+            break
+        turn = clip(turn, min(room, limit // 2))
+        fresh.insert(0, turn)
+        room -= len(turn)
+    return " ".join(p for p in [kept, *fresh] if p)
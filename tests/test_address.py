@@ -0,0 +1,62 @@
+import pytest
+
+from address import Gazetteer, canonical, parse
+from memory_manager import MemoryManager
+
+
+@pytest.fixture
+def gazetteer():
+    return Gazetteer(["maple street", "oak avenue"])
+
+
+@pytest.mark.parametrize("text", [
+    "the bus driver is hurt",
+    "we got here too late",
+    "the gas line is leaking",
+    "a power line fell on the car",
+    "she fell down the stairs",
+    "the car hit a lamp post on the road",
+])
+def test_ordinary_sentences_are_not_addresses(text, gazetteer):
+    assert parse(text) is None
+    assert parse(text, gazetteer) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("42 Maple Street", "42 maple street"),
+    ("there is a fire at 42 maple street near the school", "42 maple street"),
+    ("12 Elm Rd", "12 elm road"),
+    ("7 Pine Lane", "7 pine lane"),
+])
+def test_grammar_reads_number_name_suffix(text, expected):
+    found = parse(text)
+    assert found is not None and found.text == expected and not found.fuzzy
+
+
+def test_misheard_suffix_needs_a_house_number():
+    found = parse("42 maple streat")
+    assert found is not None and found.text == "42 maple street" and found.fuzzy
+    assert parse("the maple streat") is None
+
+
+def test_misspelled_street_snaps_to_gazetteer(gazetteer):
+    found = parse("42 mapel st", gazetteer)
+    assert found.text == "42 maple street"
+    assert found.known and found.fuzzy
+    assert canonical("42 Mapel St", gazetteer) == canonical("42 maple street", gazetteer)
+
+
+def test_lookups_do_not_teach_the_gazetteer(tmp_path, gazetteer):
+    mgr = MemoryManager(None, persist_dir=str(tmp_path), vector=object(), gazetteer=gazetteer)
+    try:
+        assert mgr._normalize_address("12 elm road") == "12 elm road"
+        assert mgr.find_by_address("9 birch lane") is None
+        assert "elm road" not in gazetteer and "birch lane" not in gazetteer
+
+        # recording an incident does, but only for an exact read with a house number
+        mgr._normalize_address("42 pine streat", learn=True)
+        mgr._normalize_address("12 elm road", learn=True)
+        assert "pine street" not in gazetteer
+        assert "elm road" in gazetteer
+    finally:
+        mgr.close()
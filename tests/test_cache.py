@@ -0,0 +1,66 @@
+from cache import LRUCache, SqliteCache, TieredCache, make_key
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats.evictions == 1
+
+
+def test_lru_ttl_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("k", "v")
+    now[0] += 11
+    assert cache.get("k") is None
+    assert cache.stats.expirations == 1
+
+
+def test_tiered_promotes_disk_hits(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = TieredCache(LRUCache(), SqliteCache(str(path)))
+    cache.set("k", {"answer": 42})
+    cache.close()
+
+    # a new process: empty memory tier, same file
+    memory = LRUCache()
+    cache = TieredCache(memory, SqliteCache(str(path)))
+    assert cache.get("k") == {"answer": 42}
+    assert memory.get("k") == {"answer": 42}
+    assert cache.report()["disk"]["hits"] == 1
+    cache.close()
+
+
+def test_tiered_counts_hits_and_misses():
+    cache = TieredCache()
+    key = make_key("model", [{"role": "user", "content": "hi"}])
+    assert cache.get(key) is None
+    cache.set(key, "hello")
+    assert cache.get(key) == "hello"
+    assert cache.report()["total"]["hits"] == 1
+    assert cache.report()["total"]["misses"] == 1
+
+
+def test_tiered_close_keeps_memory_tier(tmp_path):
+    cache = TieredCache(LRUCache(), SqliteCache(str(tmp_path / "cache.sqlite")))
+    cache.set("k", "v")
+    cache.close()
+    assert cache.disk is None
+    assert cache.get("k") == "v"
+    cache.set("k2", "v2")  # no write to the closed database
+    assert cache.get("k2") == "v2"
+    cache.close()
+
+
+def test_none_is_not_stored(tmp_path):
+    cache = TieredCache(LRUCache(), SqliteCache(str(tmp_path / "cache.sqlite")))
+    cache.set("k", None)
+    assert cache.get("k") is None
+    assert cache.report()["disk"]["sets"] == 0
+    cache.close()
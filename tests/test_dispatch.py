@@ -0,0 +1,80 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from dispatch import DispatchEngine, Geocoder
+
+
+def make_engine(**kwargs):
+    engine = DispatchEngine(**kwargs)
+    engine.add_station("north", (0.0, 10.0), {"firetruck": 3, "ambulance": 2})
+    engine.add_station("south", (0.0, -10.0), {"firetruck": 3, "ambulance": 2})
+    return engine
+
+
+def test_concurrent_incidents_never_share_a_unit():
+    engine = DispatchEngine()
+    rng = random.Random(7)
+    for s in range(20):
+        engine.add_station(f"s{s}", (rng.uniform(0, 30), rng.uniform(0, 30)), {"firetruck": 5, "ambulance": 5})
+    incidents = [(f"inc-{i}", (rng.uniform(0, 30), rng.uniform(0, 30)), {"firetruck": 1, "ambulance": 1})
+                 for i in range(150)]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        assignments = list(pool.map(lambda item: engine.assign(*item), incidents))
+
+    booked = [u.id for a in assignments for u in a.units]
+    assert len(booked) == len(set(booked))
+    # 100 units of each kind for 150 incidents: every unit is out, the rest are shortfalls
+    assert len(booked) == 200
+    assert engine.available() == 0
+    assert sum(a.missing.get("firetruck", 0) for a in assignments) == 50
+    assert all(u.incident == a.incident_id for a in assignments for u in a.units)
+
+
+def test_nearest_free_unit_is_reserved():
+    engine = make_engine()
+    a = engine.assign("a", (0.0, 9.0), {"firetruck": 1})
+    assert [u.station for u in a.units] == ["north"]
+    assert engine.available("firetruck") == 5
+
+
+def test_repeat_call_reuses_the_assignment():
+    engine = make_engine()
+    first = engine.assign("a", (0.0, 9.0), {"firetruck": 1})
+    again = engine.assign("a", (0.0, 9.0), {"firetruck": 1})
+    assert again is first and len(again.units) == 1
+    assert engine.stats["repeats"] == 1
+    # a later call reporting injuries only adds what is missing
+    topped = engine.assign("a", (0.0, 9.0), {"firetruck": 1, "ambulance": 1})
+    assert sorted(u.kind for u in topped.units) == ["ambulance", "firetruck"]
+    assert engine.available() == 8
+
+
+def test_shortfall_is_reported_not_double_booked():
+    engine = make_engine()
+    a = engine.assign("a", (0.0, 0.0), {"ambulance": 3})
+    b = engine.assign("b", (0.0, 0.0), {"ambulance": 3})
+    assert len(a.units) == 3 and not a.missing
+    assert len(b.units) == 1 and b.missing == {"ambulance": 2}
+    assert not {u.id for u in a.units} & {u.id for u in b.units}
+
+
+def test_release_and_expiry_return_units():
+    engine = make_engine(on_scene_min=10)
+    engine.assign("a", (0.0, 9.0), {"firetruck": 2}, now=0.0)
+    engine.assign("b", (0.0, -9.0), {"firetruck": 2}, now=0.0)
+    assert engine.release("a") == 2
+    assert engine.release("a") == 0
+    assert engine.available("firetruck") == 4
+    # b was never released: its reservation lapses after the on-scene time
+    engine.assign("c", (0.0, 0.0), {"ambulance": 1}, now=10 * 60.0)
+    assert engine.available("firetruck") == 6
+    assert engine.stats["expired"] == 1
+
+
+def test_dispatch_keys_incidents_by_canonical_address():
+    engine = make_engine(geocoder=Geocoder(table={"42 maple street": (0.0, 9.0)}))
+    first = engine.dispatch("fire", "42 Maple Street")
+    again = engine.dispatch("fire", "42 maple st", injuries=True)
+    assert again is first
+    assert sorted(u.kind for u in again.units) == ["ambulance", "firetruck"]
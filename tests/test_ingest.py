@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from address import Gazetteer
+from ingest import Call, Checkpoint, Ingestor, local_extract
+from memory_manager import MemoryManager
+from vector_memory import RetentionPolicy, ShardedVectorMemory
+
+CALLS = 6
+DIM = 8
+
+
+class ConstantEmbedder:
+    def embed_query(self, text):
+        return np.ones(DIM, dtype="float32")
+
+    def embed_documents(self, texts, cache=True):
+        return np.ones((len(texts), DIM), dtype="float32")
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "archive.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(CALLS):
+            for text in (f"there is a fire at {n + 1} maple street", "my neighbour has a second degree burn"):
+                f.write(json.dumps({"call": f"c{n}", "text": text}) + "\n")
+    return path
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    opened = []
+
+    def open_():
+        vector = ShardedVectorMemory(str(tmp_path / "store"), policy=RetentionPolicy(ttl_days=None), dim=DIM,
+                                     embedder=ConstantEmbedder(), maintain_every=0, sync=False)
+        mgr = MemoryManager(None, persist_dir=str(tmp_path / "store"), vector=vector, gazetteer=Gazetteer())
+        opened.append(mgr)
+        return mgr
+
+    yield open_
+    for mgr in opened:
+        mgr.close()
+        mgr.vector.close()
+
+
+def ingest(mgr, archive, checkpoint_path):
+    # two calls (four lines) per batch
+    ingestor = Ingestor(mgr, batch_size=4, checkpoint=Checkpoint(checkpoint_path))
+    try:
+        return ingestor.run([archive])
+    finally:
+        ingestor.close()
+
+
+def assert_stored_once(mgr):
+    sources = [r["source"] for r in mgr.vector.records()]
+    assert len(sources) == 2 * CALLS
+    assert all(sources.count(s) == 2 for s in set(sources))
+    assert mgr.incidents.count() == CALLS
+    for n in range(CALLS):
+        incident = mgr.incidents.find(f"{n + 1} maple street")
+        assert len(mgr.incidents.history(incident["id"])) == 1
+
+
+def test_resume_after_a_complete_run_adds_nothing(archive, open_store, tmp_path):
+    ckpt = tmp_path / "ckpt.json"
+    mgr = open_store()
+    assert ingest(mgr, archive, ckpt)["calls"] == CALLS
+    stats = ingest(mgr, archive, ckpt)
+    assert stats["calls"] == 0 and stats["incidents"] == 0
+    assert_stored_once(mgr)
+
+
+def test_crash_before_checkpoint_does_not_duplicate_rows(archive, open_store, tmp_path, monkeypatch):
+    ckpt = tmp_path / "ckpt.json"
+    mgr = open_store()
+    advance = Checkpoint.advance
+    batches = []
+
+    def crash_on_second(self, calls, vector_seq):
+        batches.append(calls)
+        if len(batches) == 2:
+            raise RuntimeError("killed")
+        advance(self, calls, vector_seq)
+
+    monkeypatch.setattr(Checkpoint, "advance", crash_on_second)
+    with pytest.raises(RuntimeError):
+        ingest(mgr, archive, ckpt)
+    monkeypatch.setattr(Checkpoint, "advance", advance)
+
+    # the second batch is stored but not checkpointed: the resume skips its calls
+    stats = ingest(mgr, archive, ckpt)
+    assert stats["skipped"] == 2
+    assert stats["calls"] == CALLS - 4
+    assert_stored_once(mgr)
+
+
+def test_crash_between_incidents_and_vectors_redoes_the_batch_once(archive, open_store, tmp_path, monkeypatch):
+    ckpt = tmp_path / "ckpt.json"
+    mgr = open_store()
+    add_entries = MemoryManager.add_entries
+    appends = []
+
+    def crash_on_second(self, *args, **kwargs):
+        appends.append(args)
+        if len(appends) == 2:
+            raise RuntimeError("killed")
+        return add_entries(self, *args, **kwargs)
+
+    monkeypatch.setattr(MemoryManager, "add_entries", crash_on_second)
+    with pytest.raises(RuntimeError):
+        ingest(mgr, archive, ckpt)
+    monkeypatch.setattr(MemoryManager, "add_entries", add_entries)
+
+    # the second batch's incidents were committed; redoing it must not record them again
+    stats = ingest(mgr, archive, ckpt)
+    assert stats["calls"] == CALLS - 2
+    assert stats["incidents"] == CALLS - 4
+    assert_stored_once(mgr)
+
+
+def test_local_extract_reads_injury_type():
+    call = Call("a.jsonl", "c1", ["fire at 4 maple street", "he has a second degree burn on his arm"])
+    info = local_extract(call)
+    assert info["incident_type"] == "both"
+    assert info["injuries"] is True
+    assert info["injury_type"] == "burn"
+    assert info["address"] == "4 maple street"
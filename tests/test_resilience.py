@@ -0,0 +1,82 @@
+from resilience import CircuitBreaker, LatencyTracker
+
+
+def make_breaker(**kwargs):
+    now = [0.0]
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, open_s=15.0, clock=lambda: now[0], **kwargs)
+    return breaker, now
+
+
+def test_stays_closed_below_min_calls():
+    breaker, _ = make_breaker()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_at_failure_rate_and_rejects():
+    breaker, _ = make_breaker()
+    for ok in (True, False, True, False):
+        breaker.record(ok)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.degraded
+    assert not breaker.allow()
+    assert breaker.report() == {"state": "open", "rejected": 1, "opened": 1}
+
+
+def test_mostly_successful_calls_keep_it_closed():
+    breaker, _ = make_breaker()
+    for ok in (True, True, True, False, True, True, False, True):
+        breaker.record(ok)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker, now = make_breaker()
+    for _ in range(4):
+        breaker.record(False)
+    now[0] += 14.9
+    assert not breaker.allow()
+    now[0] += 0.1
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # the probe is still out
+
+
+def test_probe_success_closes():
+    breaker, now = make_breaker()
+    for _ in range(4):
+        breaker.record(False)
+    now[0] += 15
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    # the failures from before the outage do not count against the closed breaker
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_failure_reopens_for_another_period():
+    breaker, now = make_breaker()
+    for _ in range(4):
+        breaker.record(False)
+    now[0] += 15
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.report()["opened"] == 2
+    now[0] += 10
+    assert not breaker.allow()
+    now[0] += 5
+    assert breaker.allow()
+
+
+def test_latency_tracker_follows_observed_tail():
+    tracker = LatencyTracker(min_samples=3, factor=2.0, floor_s=0.5, default_s=10.0, default_hedge_s=2.0)
+    tracker.observe("chat", 1.0)
+    assert tracker.timeout("chat") == 10.0 and tracker.hedge_delay("chat") == 2.0
+    for s in (1.0, 1.0, 3.0):
+        tracker.observe("chat", s)
+    assert 1.0 < tracker.hedge_delay("chat") < 3.0
+    assert tracker.timeout("chat") == 2.0 * tracker.quantile("chat", 99)
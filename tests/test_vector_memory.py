@@ -0,0 +1,144 @@
+import hashlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from vector_memory import DAY, RetentionPolicy, ShardedVectorMemory
+
+NOW = 1_800_000_000.0
+DIM = 16
+
+
+class HashEmbedder:
+    """Deterministic stand-in for the embedding model: one random vector per text."""
+
+    def embed_query(self, text):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(DIM).astype("float32")
+
+    def embed_documents(self, texts, cache=True):
+        return np.stack([self.embed_query(t) for t in texts])
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(policy=None, **kwargs):
+        kwargs.setdefault("maintain_every", 0)
+        vm = ShardedVectorMemory(str(tmp_path / "store"), policy=policy or RetentionPolicy(ttl_days=None),
+                                 dim=DIM, embedder=HashEmbedder(), sync=False, clock=lambda: NOW, **kwargs)
+        stores.append(vm)
+        return vm
+
+    yield make
+    for vm in stores:
+        vm.close()
+
+
+def add_weeks(vm, incident, weeks, per_week=2):
+    """per_week rows in each of the last `weeks` weekly shards of incident; returns the texts."""
+    texts, meta = [], []
+    for w in range(weeks):
+        for i in range(per_week):
+            texts.append(f"{incident} week {w} row {i}")
+            meta.append({"t": NOW - w * 7 * DAY})
+    vm.add_many(texts, [incident] * len(texts), meta=meta)
+    return texts
+
+
+def test_search_is_routed_to_related_incidents(make_store):
+    vm = make_store()
+    for incident in ("fire", "medical", "both"):
+        add_weeks(vm, incident, 1, per_week=3)
+    results = vm.search("fire week 0 row 1", top_k=10, incident="fire")
+    assert {r["incident"] for r in results} == {"fire", "both"}
+    assert vm.stats["shard_searches"] == 2
+
+
+def test_search_reads_at_most_max_shards(make_store):
+    vm = make_store(max_shards=3)
+    add_weeks(vm, "fire", 10)
+    results = vm.search("fire week 9 row 0", top_k=20, incident="fire")
+    assert vm.stats["shard_searches"] == 3
+    assert vm.stats["shards_skipped"] == 7
+    # the newest shards are the ones read
+    assert all(int(r["text"].split()[2]) < 3 for r in results)
+
+
+def test_older_shards_are_skipped_once_they_cannot_make_top_k(make_store):
+    vm = make_store()
+    add_weeks(vm, "fire", 6)
+    results, sims = vm.search("fire week 0 row 1", top_k=1, return_distance=True, incident="fire")
+    assert results[0]["text"] == "fire week 0 row 1"
+    assert sims[0] == pytest.approx(1.0, abs=1e-5)
+    # an exact match in the newest shard outscores any older shard's best possible hit
+    assert vm.stats["shard_searches"] == 1
+    assert vm.stats["shards_skipped"] == 5
+
+
+def test_min_similarity_drops_weak_hits(make_store):
+    vm = make_store()
+    add_weeks(vm, "fire", 1, per_week=5)
+    results, sims = vm.search("fire week 0 row 2", top_k=5, return_distance=True, min_similarity=0.99)
+    assert [r["text"] for r in results] == ["fire week 0 row 2"]
+
+
+def test_routed_searches_keep_their_shards_open(make_store):
+    vm = make_store(max_open=4)
+    for incident in ("fire", "medical", "both"):
+        add_weeks(vm, incident, 2)
+    vm.search("fire week 1 row 0", top_k=10, incident="fire")
+    loads = vm.stats["shard_loads"]
+    for _ in range(5):
+        vm.search("fire week 1 row 0", top_k=10, incident="fire")
+    assert vm.stats["shard_loads"] == loads
+
+
+def test_wide_scan_does_not_evict_hot_shards(make_store):
+    vm = make_store(max_open=2, max_shards=8)
+    add_weeks(vm, "fire", 1)
+    add_weeks(vm, "medical", 6)
+    vm.search("fire week 0 row 0", top_k=2, incident="fire")
+    hot = set(vm._open)
+    vm.search("medical week 5 row 0", top_k=20, incident="medical")
+    assert set(vm._open) == hot
+
+
+def test_maintain_drops_expired_shards(make_store):
+    vm = make_store(policy=RetentionPolicy(ttl_days=30))
+    add_weeks(vm, "fire", 3)
+    # rows written while they were still inside the TTL, now expired
+    vm.add_many(["old fire"], ["fire"], meta=[{"t": NOW - 20 * DAY}])
+    vm.policy.ttl_days = 10
+    kept = {vm._shard_key("fire", NOW), vm._shard_key("fire", NOW - 7 * DAY)}
+    expired = {vm._shard_key("fire", NOW - 14 * DAY), vm._shard_key("fire", NOW - 20 * DAY)} - kept
+    done = vm.maintain()
+    assert done["shards_dropped"] == len(expired)
+    assert set(vm.shards) == kept
+    assert not any((vm.shards_dir / key).exists() for key in expired)
+    # expired rows in a kept shard are deleted row by row
+    assert sorted(r["text"] for r in vm.records()) == [f"fire week {w} row {i}" for w in (0, 1) for i in (0, 1)]
+
+
+def test_maintain_deletes_oldest_rows_beyond_max_rows(make_store):
+    vm = make_store(policy=RetentionPolicy(ttl_days=None, max_rows=3))
+    texts = [f"row {i}" for i in range(5)]
+    vm.add_many(texts, ["fire"] * 5, meta=[{"t": NOW - (5 - i) * 3600} for i in range(5)])
+    done = vm.maintain()
+    assert done["deleted"] == 2
+    assert sorted(r["text"] for r in vm.records()) == ["row 2", "row 3", "row 4"]
+
+
+def test_maintain_leaves_a_shard_in_use(make_store):
+    vm = make_store(policy=RetentionPolicy(ttl_days=30))
+    vm.add_many(["old fire"], ["fire"], meta=[{"t": NOW - 20 * DAY}])
+    key = next(iter(vm.shards))
+    vm.policy.ttl_days = 10
+    with vm._use(key):
+        assert vm.maintain()["shards_dropped"] == 0
+        assert key in vm.shards
+    assert vm.maintain()["shards_dropped"] == 1
+    assert key not in vm.shards
@@ -1,11 +1,17 @@
-from dataclasses import dataclass
-from random import randint
+from dataclasses import dataclass, field
+from typing import List, Optional
+from dispatch import get_dispatch_engine
+from tracing import traced
 
 @dataclass
 class DispatchResult:
     resources: list
-    eta_min: int
+    eta_min: Optional[int]
+    units: List[str] = field(default_factory=list)      # reserved unit ids
+    incident_id: Optional[str] = None
+    missing: List[str] = field(default_factory=list)    # needed kinds with no free unit left
 
+@traced("dispatch")
 def dispatch_resources(kind: str, location: str, injuries: bool) -> DispatchResult:
     if kind == "fire":
         resources = ["firetruck", "firefighter"]
@@ -17,4 +23,6 @@ def dispatch_resources(kind: str, location: str, injuries: bool) -> DispatchResu
         resources = ["emergency unit"]
 
     base = ["dispatcher", "communication center"]
-    return DispatchResult(resources=base + resources, eta_min=randint(3, 8))
+    a = get_dispatch_engine().dispatch(kind, location, injuries)
+    return DispatchResult(resources=base + resources, eta_min=a.eta_min, units=[u.id for u in a.units],
+                          incident_id=a.incident_id, missing=sorted(a.missing))
@@ -0,0 +1,300 @@
+import os, json, time, uuid, inspect, functools, threading, contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# ====== Metrics ======
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labels), 0.0)
+
+    def exposition(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labels, k)} {v:g}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def exposition(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            for bound, n in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, format(bound, 'g'))} {n}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, '+Inf')} {row[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {row[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels, **kw):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, help, labels, **kw)
+            return self._metrics[name]
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def prometheus_text(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.exposition())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("rescuehub_stage_seconds", "Wall time of each pipeline stage.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter("rescuehub_stage_errors_total", "Stages that raised.", ("stage",))
+LLM_REQUESTS = REGISTRY.counter("rescuehub_llm_requests_total", "Completion requests sent.", ("op",))
+LLM_CACHE_HITS = REGISTRY.counter("rescuehub_llm_cache_hits_total", "Completions served from the cache.", ("op",))
+LLM_TOKENS = REGISTRY.counter("rescuehub_llm_tokens_total", "Tokens reported by the API.", ("op", "kind"))
+LLM_PROMPT_TOKENS = REGISTRY.histogram("rescuehub_llm_prompt_tokens", "Prompt size of each request, counted locally.",
+                                       ("op",), buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+LLM_HEDGES = REGISTRY.counter("rescuehub_llm_hedges_total", "Duplicate requests sent after the hedge delay, and how many won.",
+                              ("op", "outcome"))
+LLM_TIMEOUTS = REGISTRY.counter("rescuehub_llm_timeouts_total", "Calls cut off by their deadline.", ("op",))
+LLM_FAILURES = REGISTRY.counter("rescuehub_llm_failures_total", "Calls that got no answer, by reason.", ("op", "reason"))
+LLM_BREAKER_TRANSITIONS = REGISTRY.counter("rescuehub_llm_breaker_transitions_total",
+                                           "Circuit breaker state changes, by the state entered.", ("state",))
+LLM_FALLBACKS = REGISTRY.counter("rescuehub_llm_fallbacks_total", "LLM answers replaced by local heuristics.",
+                                 ("component",))
+NLU_TURNS = REGISTRY.counter("rescuehub_nlu_turns_total", "Turn analyses by where they were resolved.", ("path",))
+
+
+# ====== Spans ======
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start: float = 0.0          # epoch seconds
+    duration_ms: float = 0.0
+    attrs: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": round(self.start, 6),
+                "duration_ms": round(self.duration_ms, 3), "attrs": self.attrs, "error": self.error}
+
+
+# asyncio tasks and asyncio.to_thread carry this along, so child spans find their parent
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("rescuehub_span", default=None)
+
+
+class TraceFile:
+    """Finished spans appended as JSON lines."""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._fh.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+_trace_file: Optional[TraceFile] = None
+
+def configure(trace_path: Optional[str] = None):
+    """Send finished spans to a JSON-lines file (default: $RESCUEHUB_TRACE_FILE; None disables)."""
+    global _trace_file
+    if _trace_file is not None:
+        _trace_file.close()
+    _trace_file = TraceFile(trace_path) if trace_path else None
+
+configure(os.getenv("RESCUEHUB_TRACE_FILE"))
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def _finish(span: Span):
+    STAGE_SECONDS.observe(span.duration_ms / 1000, stage=span.name)
+    if span.error is not None:
+        STAGE_ERRORS.inc(stage=span.name)
+    if _trace_file is not None:
+        _trace_file.write(span)
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _child(name: str, parent: Optional[Span], attrs: dict) -> Span:
+    return Span(name, parent.trace_id if parent else _new_id(), _new_id(),
+                parent.span_id if parent else None, time.time(), attrs=attrs)
+
+def _error(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a stage; nested spans share the trace id of the outermost one."""
+    s = _child(name, _current.get(), attrs)
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = _error(e)
+        raise
+    finally:
+        s.duration_ms = (time.perf_counter() - t0) * 1000
+        _current.reset(token)
+        _finish(s)
+
+
+def record_span(name: str, duration_s: float, parent: Optional[Span] = None, **attrs):
+    """A stage timed elsewhere (a worker thread, a stream generator) that just ended."""
+    s = _child(name, parent or _current.get(), attrs)
+    s.start -= duration_s
+    s.duration_ms = duration_s * 1000
+    _finish(s)
+
+
+def _traced_generator(name: str, gen: Iterator) -> Iterator:
+    # the span is current only while the generator runs, not while the consumer holds a piece
+    s = _child(name, _current.get(), {})
+    t0 = time.perf_counter()
+    try:
+        while True:
+            token = _current.set(s)
+            try:
+                item = next(gen)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield item
+    except GeneratorExit:
+        s.attrs["closed_early"] = True
+        raise
+    except BaseException as e:
+        s.error = _error(e)
+        raise
+    finally:
+        gen.close()
+        s.duration_ms = (time.perf_counter() - t0) * 1000
+        _finish(s)
+
+
+def traced(name: str):
+    """Decorator form of span(); generator functions are timed until they are exhausted or closed."""
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                return _traced_generator(name, fn(*args, **kwargs))
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ====== Export ======
+def prometheus_text() -> str:
+    return REGISTRY.prometheus_text()
+
+def write_metrics(path: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Expose /metrics for a Prometheus scraper from a background thread (loopback unless `host` says otherwise)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -1,39 +1,1061 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-import faiss, numpy as np, json
+import numpy as np, json, os, re, shutil, threading, time, argparse
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from embeddings import get_embedding_service
+from tracing import traced
+from startup import LazyModule
+
+faiss = LazyModule("faiss")  # imported when the first index is built or read
+
+# all indexes use inner product over unit vectors, i.e. cosine similarity
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "sq_fp16")
+DEFAULT_INDEX_PARAMS = {
+    "hnsw_m": 32,          # graph degree
+    "ef_construction": 80,
+    "ef_search": 64,
+    "nlist": None,         # IVF lists; None = ~4*sqrt(rows) at build time
+    "nprobe": 8,
+    "pq_m": 48,            # PQ sub-quantizers (dim must be divisible)
+    "pq_bits": 8,
+}
+
+def normalize(vecs: np.ndarray) -> np.ndarray:
+    """Unit-length float32 copy, so inner product == cosine similarity."""
+    out = np.array(vecs, dtype="float32", copy=True, ndmin=2)
+    faiss.normalize_L2(out)
+    return out
+
+def build_index(index_type: str, dim: int, train: Optional[np.ndarray] = None, **params):
+    """A fresh, trained (if needed) cosine index of the given type. train must be normalized."""
+    p = {**DEFAULT_INDEX_PARAMS, **{k: v for k, v in params.items() if v is not None}}
+    ip = faiss.METRIC_INNER_PRODUCT
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, p["hnsw_m"], ip)
+        index.hnsw.efConstruction = p["ef_construction"]
+        index.hnsw.efSearch = p["ef_search"]
+        return index
+    if index_type in ("sq8", "sq_fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(dim, qtype, ip)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        rows = len(train) if train is not None else 0
+        # ~4*sqrt(n) lists, but never fewer than ~39 training points per list
+        nlist = p["nlist"] or max(1, min(65536, int(4 * np.sqrt(max(rows, 1))), rows // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, p["pq_m"], p["pq_bits"], ip)
+        index.nprobe = p["nprobe"]
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; choose one of {', '.join(INDEX_TYPES)}")
+    if not index.is_trained:
+        if train is None or len(train) < min_train_rows(index_type, p):
+            raise ValueError(f"{index_type} needs at least {min_train_rows(index_type, p)} vectors to train")
+        index.train(train)
+    return index
+
+def min_train_rows(index_type: str, params: Optional[dict] = None) -> int:
+    p = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == "ivf_flat":
+        return p["nlist"] or 64
+    if index_type == "ivf_pq":
+        return max(p["nlist"] or 64, 2 ** p["pq_bits"]) * 4
+    if index_type == "sq8":
+        return 1
+    return 0
 
 class VectorMemory:
-    def __init__(self, dim=384, persist_dir="memory_store"):
-        self.model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    """
+    Append-only store: vectors.f32 holds raw float32 rows and records.jsonl the
+    matching metadata, one line per row. Both are only ever appended to, so an add
+    costs the same regardless of store size. faiss.index is a snapshot covering the
+    first index.ntotal rows; it is refreshed by compact() in the background and
+    the rows after it are replayed from the memory-mapped vector log at startup.
+    Deleted rows are tombstoned in deleted.i64 and skipped by searches until
+    vacuum() rewrites the logs without them.
+    """
+
+    MAX_TRAIN_ROWS = 100_000
+
+    def __init__(self, dim=384, persist_dir="memory_store", embedder=None,
+                 compact_every: int = 1000, sync: bool = True,
+                 index_type: str = "flat", index_params: Optional[dict] = None):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}; choose one of {', '.join(INDEX_TYPES)}")
+        # shared embedding model; see get_vector_memory for sharing the index itself
+        self._embedder = embedder
         self.dim = dim
+        self.compact_every = compact_every
+        self.sync = sync
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
         self.persist_dir = Path(persist_dir)
         self.persist_dir.mkdir(exist_ok=True)
-        self.index_path = self.persist_dir / "faiss.index"
-        self.store_path = self.persist_dir / "store.json"
+        self.legacy_index_path = self.persist_dir / "faiss.index"
+        self.vectors_path = self.persist_dir / "vectors.f32"
+        self.records_path = self.persist_dir / "records.jsonl"
+        self.deleted_path = self.persist_dir / "deleted.i64"
+        # single writer: index, logs and store change together, and faiss must not be searched mid-add
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._rebuilding = False
+        self._snapshot_rows = 0
+        # the index actually in use; trained types stay on "flat" until there is enough data
+        self.active_index_type = "flat"
+        # store I/O counters for reports and the replay benchmark
+        self.io = {"searches": 0, "appends": 0, "bytes_written": 0, "fsyncs": 0, "snapshots": 0,
+                   "deletes": 0, "vacuums": 0}
+
+        self._migrate_legacy()
+        self._load()
+        self._open_logs()
+
+    def _open_logs(self):
+        self._vec_fh = open(self.vectors_path, "ab")
+        self._rec_fh = open(self.records_path, "ab")
+        self._del_fh = open(self.deleted_path, "ab")
+
+    # ---------- load / recovery ----------
+    def _row_bytes(self) -> int:
+        return self.dim * 4
+
+    def _read_records(self):
+        """Complete, parseable lines of the record log and the byte offset each one ends at."""
+        records, ends, end = [], [], 0
+        if not self.records_path.exists():
+            return records, ends
+        with open(self.records_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                end += len(line)
+                ends.append(end)
+        return records, ends
+
+    def _load(self):
+        records, ends = self._read_records()
+        vec_size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        rows = min(vec_size // self._row_bytes(), len(records))
+
+        # a crash can leave a torn tail on either log; cut both back to the last whole row
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * self._row_bytes())
+        with open(self.records_path, "ab") as f:
+            f.truncate(ends[rows - 1] if rows else 0)
+        self.store: List[dict] = records[:rows]
+        deleted = np.fromfile(self.deleted_path, dtype="<i8") if self.deleted_path.exists() else []
+        self.deleted: Set[int] = {int(i) for i in deleted if 0 <= i < rows}
+
+        self.index = None
+        for index_type in (self.index_type, "flat"):
+            path = self._snapshot_path(index_type)
+            if path.exists():
+                snap = faiss.read_index(str(path))
+                if snap.ntotal <= rows and snap.d == self.dim:
+                    self.index, self.active_index_type = snap, index_type
+                    break
+        if self.index is None:
+            self.index, self.active_index_type = self._fresh_index(rows)
+        self._snapshot_rows = self.index.ntotal
+        self._configure(self.index)
+
+        if rows > self.index.ntotal:
+            self.index.add(normalize(self._read_vectors(self.index.ntotal, rows)))
+        self._maybe_upgrade()
+
+    def _snapshot_path(self, index_type: str) -> Path:
+        return self.persist_dir / f"faiss-{index_type}.index"
+
+    def _read_vectors(self, start: int, stop: int) -> np.ndarray:
+        if stop <= start:
+            return np.zeros((0, self.dim), dtype="float32")
+        vecs = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(stop, self.dim))
+        out = np.array(vecs[start:stop])
+        del vecs
+        return out
+
+    def _fresh_index(self, rows: int):
+        """Requested index type trained on the first rows, or flat while there is too little data."""
+        need = min_train_rows(self.index_type, self.index_params)
+        if self.index_type != "flat" and rows >= need:
+            train = None
+            if need:
+                # a strided sample is plenty to train quantizers and keeps rebuilds fast
+                step = max(1, rows // self.MAX_TRAIN_ROWS)
+                train = normalize(self._read_vectors(0, rows)[::step])
+            return build_index(self.index_type, self.dim, train, **self.index_params), self.index_type
+        if self.index_type != "flat" and need == 0:
+            return build_index(self.index_type, self.dim, **self.index_params), self.index_type
+        return build_index("flat", self.dim), "flat"
+
+    def _configure(self, index):
+        p = {**DEFAULT_INDEX_PARAMS, **{k: v for k, v in self.index_params.items() if v is not None}}
+        if hasattr(index, "nprobe"):
+            index.nprobe = p["nprobe"]
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = p["ef_search"]
+
+    def _maybe_upgrade(self):
+        if self.active_index_type != self.index_type and \
+                self.index.ntotal >= min_train_rows(self.index_type, self.index_params):
+            self.rebuild(background=True)
+
+    def _migrate_legacy(self):
+        """Convert the old faiss.index + store.json pair into the append-only logs."""
+        legacy = self.persist_dir / "store.json"
+        if not legacy.exists() or self.records_path.exists():
+            return
+        store = json.loads(legacy.read_text(encoding="utf-8"))
+        index = faiss.read_index(str(self.legacy_index_path)) if self.legacy_index_path.exists() else None
+        if index is None or index.ntotal != len(store):
+            raise RuntimeError(f"Legacy store in {self.persist_dir} is inconsistent; cannot migrate")
+        vecs = index.reconstruct_n(0, index.ntotal).astype("float32") if index.ntotal else np.zeros((0, self.dim), "float32")
+        self.vectors_path.write_bytes(vecs.tobytes())
+        with open(self.records_path, "w", encoding="utf-8") as f:
+            for rec in store:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        legacy.rename(legacy.with_name("store.json.migrated"))
+        # the old snapshot is an unnormalized L2 index; the new ones are rebuilt from the log
+        self.legacy_index_path.rename(self.legacy_index_path.with_name("faiss.index.migrated"))
+
+    # ---------- append / compaction ----------
+    def _append(self, vecs: np.ndarray, records: List[dict]):
+        vec_bytes = vecs.tobytes()
+        rec_bytes = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        self._vec_fh.write(vec_bytes)
+        self._vec_fh.flush()
+        self._rec_fh.write(rec_bytes)
+        self._rec_fh.flush()
+        self.io["appends"] += 1
+        self.io["bytes_written"] += len(vec_bytes) + len(rec_bytes)
+        if self.sync:
+            os.fsync(self._vec_fh.fileno())
+            os.fsync(self._rec_fh.fileno())
+            self.io["fsyncs"] += 2
+
+    def compact(self, background: bool = True):
+        """Snapshot the in-memory index so startup only replays rows added afterwards."""
+        with self._lock:
+            if self._compacting or self.index.ntotal == self._snapshot_rows:
+                return
+            self._compacting = True
+            data = faiss.serialize_index(self.index)
+            rows = self.index.ntotal
+            path = self._snapshot_path(self.active_index_type)
 
-        if self.index_path.exists() and self.store_path.exists():
-            self.index = faiss.read_index(str(self.index_path))
-            self.store = json.loads(self.store_path.read_text(encoding="utf-8"))
+        def write():
+            try:
+                tmp = path.with_suffix(".index.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+                with self._lock:
+                    self._snapshot_rows = rows
+                    self.io["snapshots"] += 1
+                    self.io["bytes_written"] += data.nbytes
+            finally:
+                self._compacting = False
+
+        if background:
+            threading.Thread(target=write, name="vector-compaction", daemon=True).start()
+        else:
+            write()
+
+    def rebuild(self, index_type: Optional[str] = None, background: bool = False, **index_params):
+        """(Re)train and refill the index from the vector log, then swap it in and snapshot it."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            if index_type is not None:
+                self.index_type = index_type
+            self.index_params.update(index_params)
+
+        def run():
+            try:
+                with self._lock:
+                    rows = self.index.ntotal
+                index, active = self._fresh_index(rows)
+                self._configure(index)
+                index.add(normalize(self._read_vectors(0, rows)))
+                with self._lock:
+                    # catch up with rows appended while training
+                    index.add(normalize(self._read_vectors(rows, self.index.ntotal)))
+                    self.index, self.active_index_type = index, active
+                    self._snapshot_rows = 0
+            finally:
+                self._rebuilding = False
+            self.compact(background=False)
+
+        if background:
+            threading.Thread(target=run, name="vector-rebuild", daemon=True).start()
         else:
-            self.index = faiss.IndexFlatL2(dim)
-            self.store = []
+            run()
+
+    def close(self):
+        self.compact(background=False)
+        with self._lock:
+            self._vec_fh.close()
+            self._rec_fh.close()
+            self._del_fh.close()
 
-    def _save(self):
-        faiss.write_index(self.index, str(self.index_path))
-        self.store_path.write_text(json.dumps(self.store, ensure_ascii=False, indent=2), encoding="utf-8")
+    # ---------- deletes ----------
+    @property
+    def live_rows(self) -> int:
+        return len(self.store) - len(self.deleted)
 
-    def add_memory(self, text: str, incident: str = "unknown"):
-        vec = self.model.embed_query(text)
-        vec_np = np.array([vec]).astype("float32")
-        self.index.add(vec_np)
-        self.store.append({"text": text, "incident": incident})
-        self._save()
+    def delete(self, rows: Iterable[int]) -> int:
+        """Tombstone rows (positions in store); searches skip them from now on. Returns how many were new."""
+        with self._lock:
+            new = sorted({int(r) for r in rows if 0 <= r < len(self.store)} - self.deleted)
+            if not new:
+                return 0
+            data = np.asarray(new, dtype="<i8").tobytes()
+            self._del_fh.write(data)
+            self._del_fh.flush()
+            if self.sync:
+                os.fsync(self._del_fh.fileno())
+                self.io["fsyncs"] += 1
+            self.deleted.update(new)
+            self.io["deletes"] += len(new)
+            self.io["bytes_written"] += len(data)
+            return len(new)
 
+    def vacuum(self) -> bool:
+        """
+        Rewrite both logs without deleted rows and rebuild the index over what is left.
+        Row numbers change; returns False if a rebuild or snapshot is in flight.
+        """
+        with self._lock:
+            if not self.deleted or self._compacting or self._rebuilding:
+                return False
+            keep = np.asarray([i for i in range(len(self.store)) if i not in self.deleted], dtype="int64")
+            vecs = self._read_vectors(0, len(self.store))[keep] if len(keep) else np.zeros((0, self.dim), "float32")
+            records = [self.store[i] for i in keep]
+            self._vec_fh.close()
+            self._rec_fh.close()
+            self._del_fh.close()
+            for path, data in ((self.vectors_path, vecs.tobytes()),
+                               (self.records_path, "".join(json.dumps(r, ensure_ascii=False) + "\n"
+                                                           for r in records).encode("utf-8"))):
+                tmp = path.with_name(path.name + ".tmp")
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+                self.io["bytes_written"] += len(data)
+            self.deleted_path.unlink(missing_ok=True)
+            for index_type in INDEX_TYPES:
+                self._snapshot_path(index_type).unlink(missing_ok=True)
+            self.store, self.deleted = records, set()
+            self.index, self.active_index_type = self._fresh_index(len(records))
+            self._configure(self.index)
+            if len(records):
+                self.index.add(normalize(vecs))
+            self._snapshot_rows = 0
+            self._open_logs()
+            self.io["vacuums"] += 1
+        self.compact(background=False)
+        return True
+
+    # ---------- API ----------
+    @property
+    def model(self):
+        if self._embedder is None:
+            self._embedder = get_embedding_service()
+        return self._embedder
+
+    @traced("vector.add")
+    def add_memory(self, text: str, incident: str = "unknown", meta: Optional[dict] = None, vector=None):
+        vec_np = normalize(vector if vector is not None else self.model.embed_query(text))
+        record = {"text": text, "incident": incident, **(meta or {})}
+        with self._lock:
+            self._append(vec_np, [record])
+            self.index.add(vec_np)
+            self.store.append(record)
+            pending = self.index.ntotal - self._snapshot_rows
+        if pending >= self.compact_every:
+            self.compact()
+        self._maybe_upgrade()
+
+    @traced("vector.add_many")
+    def add_many(self, texts: List[str], incidents: List[str], vectors=None, meta: Optional[List[dict]] = None):
+        """
+        Bulk add: one log append, one fsync and one index insert for the whole batch.
+        vectors (rows aligned with texts) skip embedding; meta adds extra keys to each record.
+        No snapshot is written here; call compact() once the bulk load is done. Returns the rows stored.
+        """
+        if not texts:
+            return 0
+        if vectors is None:
+            vectors = self.model.embed_documents(texts, cache=False)
+        vec_np = normalize(np.asarray(vectors, dtype="float32"))
+        records = [{"text": t, "incident": inc, **(m or {})}
+                   for t, inc, m in zip(texts, incidents, meta or [None] * len(texts))]
+        with self._lock:
+            self._append(vec_np, records)
+            self.index.add(vec_np)
+            self.store.extend(records)
+        self._maybe_upgrade()
+        return len(records)
+
+    def search_vector(self, q_vec: np.ndarray, top_k: int = 3) -> List[Tuple[int, dict, float]]:
+        """(row, record, cosine similarity) of the top_k live rows for a normalized query vector."""
+        with self._lock:
+            if not self.store:
+                return []
+            self.io["searches"] += 1
+            # over-fetch past tombstones; vacuum() keeps their share small
+            k = min(self.index.ntotal, top_k + len(self.deleted))
+            scores, ids = self.index.search(q_vec, k)
+            hits = [(int(i), self.store[i], float(s)) for i, s in zip(ids[0], scores[0])
+                    if 0 <= i < len(self.store) and int(i) not in self.deleted]
+        return hits[:top_k]
+
+    @traced("vector.search")
     def search(self, query: str, top_k=3, return_distance=False):
-        if len(self.store) == 0:
+        """Top-k records; with return_distance, also their cosine similarities."""
+        if self.live_rows == 0:
             return ([], []) if return_distance else []
-        q_vec = np.array([self.model.embed_query(query)]).astype("float32")
-        distances, ids = self.index.search(q_vec, top_k)
-        results = [self.store[i] for i in ids[0] if i < len(self.store)]
-        sim = [1 - (d / 2) for d in distances[0]]
+        hits = self.search_vector(normalize(self.model.embed_query(query)), top_k)
+        results = [r for _, r, _ in hits]
+        sim = [s for _, _, s in hits]
         return (results, sim) if return_distance else results
+
+
+# ====== Retention and sharding ======
+DAY = 24 * 60 * 60
+# which incident shards a search for a given type reads; anything else reads them all
+RELATED_INCIDENTS = {"fire": ("fire", "both"), "medical": ("medical", "both"), "both": ("fire", "medical", "both")}
+
+
+@dataclass
+class RetentionPolicy:
+    ttl_days: Optional[float] = 365.0     # rows older than this are dropped; None keeps everything
+    max_rows: Optional[int] = 50_000      # live rows per shard; the oldest go first
+    bucket_days: int = 7                  # width of a shard's time bucket
+    half_life_days: float = 30.0          # recency weight halves (down to the floor) every half-life
+    recency_floor: float = 0.5            # a very old but exact match still beats a weak recent one
+    vacuum_ratio: float = 0.2             # rewrite a shard once this share of its rows is deleted
+
+    def weight(self, age_s: float) -> float:
+        decay = 0.5 ** (max(0.0, age_s) / (self.half_life_days * DAY))
+        return self.recency_floor + (1 - self.recency_floor) * decay
+
+    def expired(self, t: float, now: float) -> bool:
+        return self.ttl_days is not None and t < now - self.ttl_days * DAY
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        policy = cls()
+        ttl = os.getenv("RESCUEHUB_MEMORY_TTL_DAYS")
+        if ttl is not None:
+            policy.ttl_days = float(ttl) if float(ttl) > 0 else None
+        rows = os.getenv("RESCUEHUB_SHARD_MAX_ROWS")
+        if rows is not None:
+            policy.max_rows = int(rows) if int(rows) > 0 else None
+        return policy
+
+
+def record_time(record: dict, default: float) -> float:
+    """Epoch seconds of a record: its "t", else its ISO "ts", else default."""
+    if record.get("t") is not None:
+        return float(record["t"])
+    ts = record.get("ts")
+    if ts:
+        try:
+            dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        except ValueError:
+            return default
+        return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+    return default
+
+
+class ShardedVectorMemory:
+    """
+    VectorMemory split into shards by incident type and time bucket:
+    <persist_dir>/shards/<incident>/<YYYYMMDD>/ is a VectorMemory holding that incident's rows
+    from the bucket starting that day. manifest.json keeps each shard's row counts and time
+    range, so a search opens only the shards of the caller's incident that are still inside
+    the retention window, newest first, and stops once no older shard can make the top k.
+    Hits are ranked by similarity times a recency weight; the raw similarity is returned.
+    A search opens at most max_shards shards. Only max_open shards stay loaded; the least
+    recently used one is closed to make room, except during a search over more shards than
+    max_open, which reads the ones that are not open once instead of evicting the hot ones.
+    maintain() enforces the RetentionPolicy: expired shards are removed, expired and excess
+    rows are deleted, and shards with many deletes are vacuumed.
+    """
+
+    def __init__(self, persist_dir="memory_store", policy: Optional[RetentionPolicy] = None,
+                 dim: int = 384, embedder=None, max_open: int = 16, max_shards: int = 8,
+                 maintain_every: int = 1000, compact_every: int = 1000, sync: bool = True,
+                 index_type: Optional[str] = None, index_params: Optional[dict] = None, clock=time.time):
+        # index_type None: the type the store was last rebuilt as (kept in the manifest), else flat
+        if index_type is not None and index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}; choose one of {', '.join(INDEX_TYPES)}")
+        self.persist_dir = Path(persist_dir)
+        self.shards_dir = self.persist_dir / "shards"
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.shards_dir / "manifest.json"
+        self.policy = policy if policy is not None else RetentionPolicy()
+        self.dim = dim
+        self._embedder = embedder
+        self.max_open = max_open
+        self.max_shards = max_shards
+        self.maintain_every = maintain_every
+        self.compact_every = compact_every
+        self.sync = sync
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.clock = clock
+        # manifest and the open-shard table; each shard has its own lock for its index and logs
+        self._lock = threading.RLock()
+        self._open: "OrderedDict[str, VectorMemory]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._maintaining = False
+        self._since_maintain = 0
+        # counters of shards already closed (same keys as VectorMemory.io)
+        self._closed_io: Dict[str, int] = dict.fromkeys(
+            ("searches", "appends", "bytes_written", "fsyncs", "snapshots", "deletes", "vacuums"), 0)
+        self.stats = {"searches": 0, "shard_searches": 0, "shards_skipped": 0, "shard_loads": 0, "expired": 0,
+                      "shards_dropped": 0, "maintenance": 0}
+
+        self._load_manifest()
+        self._migrate_flat()
+
+    # ---------- manifest ----------
+    def _load_manifest(self):
+        state = json.loads(self.manifest_path.read_text(encoding="utf-8")) if self.manifest_path.exists() else {}
+        if self.index_type is None:
+            self.index_type = state.get("index_type", "flat")
+            self.index_params = {**state.get("index_params", {}), **self.index_params}
+        self.shards: Dict[str, dict] = state.get("shards", {})
+        # shards written after the last manifest save (a crash) have bigger logs than recorded
+        on_disk = {f"{d.parent.name}/{d.name}" for d in self.shards_dir.glob("*/*") if d.is_dir()}
+        for key in set(self.shards) - on_disk:
+            del self.shards[key]
+        stale = [key for key in on_disk if self.shards.get(key, {}).get("bytes") != self._disk_bytes(key)]
+        for key in stale:
+            shard = self._load_shard(key)
+            self._refresh(key, shard, full=True)
+            shard.close()
+        self._seq = max([state.get("seq", 0)] + [e["max_seq"] for e in self.shards.values()])
+        if stale:
+            self._save_manifest()
+
+    def _save_manifest(self):
+        with self._lock:
+            for key, shard in self._open.items():
+                self._refresh(key, shard)
+            data = json.dumps({"seq": self._seq, "index_type": self.index_type, "index_params": self.index_params,
+                               "shards": self.shards}, indent=1)
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    def _disk_bytes(self, key: str) -> int:
+        d = self.shards_dir / key
+        return sum((d / name).stat().st_size for name in ("records.jsonl", "deleted.i64") if (d / name).exists())
+
+    def _refresh(self, key: str, shard: VectorMemory, full: bool = False):
+        """Bring a shard's manifest entry up to date; full rescans its rows for the time range."""
+        entry = self.shards.setdefault(key, {"incident": key.split("/")[0], "rows": 0, "deleted": 0,
+                                             "min_t": None, "max_t": None, "max_seq": 0})
+        with shard._lock:
+            entry["rows"], entry["deleted"] = len(shard.store), len(shard.deleted)
+            if full:
+                live = [r for i, r in enumerate(shard.store) if i not in shard.deleted]
+                times = [r.get("t", 0.0) for r in live]
+                entry["min_t"], entry["max_t"] = (min(times), max(times)) if times else (None, None)
+                entry["max_seq"] = max([r.get("seq", 0) for r in shard.store] or [0])
+        entry["bytes"] = self._disk_bytes(key)
+
+    # ---------- open shards ----------
+    def _load_shard(self, key: str) -> VectorMemory:
+        (self.shards_dir / key).mkdir(parents=True, exist_ok=True)
+        return VectorMemory(dim=self.dim, persist_dir=self.shards_dir / key, embedder=self._embedder,
+                            compact_every=self.compact_every, sync=self.sync,
+                            index_type=self.index_type, index_params=self.index_params)
+
+    @contextmanager
+    def _use(self, key: str, keep: bool = True) -> Iterator[VectorMemory]:
+        """
+        The shard, loaded if needed and pinned so it is not closed while in use.
+        Without keep, a shard that is not open is not added to a full open table: it is
+        loaded for this use only, so a wide scan does not evict the shards in regular use.
+        """
+        with self._lock:
+            shard = self._open.get(key)
+            transient = False
+            if shard is None:
+                shard = self._load_shard(key)
+                self.stats["shard_loads"] += 1
+                transient = not keep and len(self._open) >= self.max_open
+                if not transient:
+                    self._open[key] = shard
+            if not transient:
+                self._open.move_to_end(key)
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict()
+        try:
+            yield shard
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if transient:
+                    if not self._pins[key]:
+                        del self._pins[key]
+                    shard.close()
+                    for name, value in shard.io.items():
+                        self._closed_io[name] = self._closed_io.get(name, 0) + value
+                else:
+                    self._evict()
+
+    def _evict(self):
+        for key in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            if self._pins.get(key):
+                continue
+            self._close_shard(key)
+
+    def _close_shard(self, key: str):
+        shard = self._open.pop(key)
+        self._pins.pop(key, None)
+        shard.close()
+        if key in self.shards:
+            self._refresh(key, shard)
+        for name, value in shard.io.items():
+            self._closed_io[name] = self._closed_io.get(name, 0) + value
+
+    # ---------- routing ----------
+    @staticmethod
+    def _incident_dir(incident: Optional[str]) -> str:
+        return re.sub(r"[^a-z0-9_-]+", "_", (incident or "unknown").lower()) or "unknown"
+
+    def _shard_key(self, incident: str, t: float) -> str:
+        width = self.policy.bucket_days * DAY
+        start = datetime.fromtimestamp(t // width * width, tz=timezone.utc)
+        return f"{self._incident_dir(incident)}/{start:%Y%m%d}"
+
+    def _relevant(self, incident: Optional[str], now: float,
+                  max_age_days: Optional[float]) -> List[Tuple[str, float]]:
+        """(shard, newest row time) of related incidents with rows inside the window, newest first."""
+        incidents = RELATED_INCIDENTS.get((incident or "").lower())
+        oldest = now - max_age_days * DAY if max_age_days is not None else None
+        keys = []
+        with self._lock:
+            for key, entry in self.shards.items():
+                if entry["max_t"] is None or entry["rows"] <= entry["deleted"]:
+                    continue
+                if incidents is not None and entry["incident"] not in incidents:
+                    continue
+                if self.policy.expired(entry["max_t"], now) or (oldest is not None and entry["max_t"] < oldest):
+                    continue
+                keys.append((key, entry["max_t"]))
+        return sorted(keys, key=lambda k: k[1], reverse=True)
+
+    # ---------- API ----------
+    @property
+    def model(self):
+        if self._embedder is None:
+            self._embedder = get_embedding_service()
+        return self._embedder
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the last row added; every row gets the next one as its "seq"."""
+        return self._seq
+
+    @traced("vector.add")
+    def add_memory(self, text: str, incident: str = "unknown", meta: Optional[dict] = None, vector=None):
+        if vector is None:
+            vector = self.model.embed_query(text)
+        self.add_many([text], [incident], vectors=np.asarray(vector, dtype="float32").reshape(1, -1),
+                      meta=[meta])
+
+    @traced("vector.add_many")
+    def add_many(self, texts: List[str], incidents: List[str], vectors=None, meta: Optional[List[dict]] = None):
+        """
+        Bulk add, one append per shard touched. Rows are timed by their "t" or ISO "ts" (else now)
+        and numbered with "seq"; rows already past the TTL are not stored. Returns the rows stored.
+        """
+        if not texts:
+            return 0
+        if vectors is None:
+            vectors = self.model.embed_documents(texts, cache=False)
+        vectors = np.asarray(vectors, dtype="float32")
+        now = self.clock()
+        groups: Dict[str, List[int]] = {}
+        records = []
+        with self._lock:
+            for i, (inc, m) in enumerate(zip(incidents, meta or [None] * len(texts))):
+                t = record_time(m or {}, now)
+                if self.policy.expired(t, now):
+                    self.stats["expired"] += 1
+                    records.append(None)
+                    continue
+                self._seq += 1
+                records.append({**(m or {}), "t": t, "seq": self._seq})
+                groups.setdefault(self._shard_key(inc, t), []).append(i)
+            new = [key for key in groups if key not in self.shards]
+        for key, rows in groups.items():
+            with self._use(key) as shard:
+                shard.add_many([texts[i] for i in rows], [incidents[i] for i in rows],
+                               vectors=vectors[rows], meta=[records[i] for i in rows])
+                with self._lock:
+                    entry = self.shards.setdefault(key, {"incident": key.split("/")[0], "rows": 0, "deleted": 0,
+                                                         "min_t": None, "max_t": None, "max_seq": 0})
+                    times = [records[i]["t"] for i in rows]
+                    entry["rows"] += len(rows)
+                    entry["min_t"] = min(times + ([entry["min_t"]] if entry["min_t"] is not None else []))
+                    entry["max_t"] = max(times + ([entry["max_t"]] if entry["max_t"] is not None else []))
+                    entry["max_seq"] = max(entry["max_seq"], records[rows[-1]]["seq"])
+        if new:
+            self._save_manifest()
+        self._since_maintain += len(texts)
+        if self.maintain_every and self._since_maintain >= self.maintain_every:
+            self._since_maintain = 0
+            threading.Thread(target=self.maintain, name="vector-retention", daemon=True).start()
+        return sum(len(rows) for rows in groups.values())
+
+    @traced("vector.search")
+    def search(self, query: str, top_k=3, return_distance=False, incident: Optional[str] = None,
+               max_age_days: Optional[float] = None, min_similarity: float = 0.0,
+               max_shards: Optional[int] = None):
+        """
+        Top-k records by similarity x recency; with return_distance, also their cosine similarities.
+        incident limits the search to that type's shards (plus "both"); max_age_days to recent ones.
+        Hits below min_similarity are dropped before ranking; at most max_shards (default
+        self.max_shards) shards are searched, newest first.
+        """
+        now = self.clock()
+        keys = self._relevant(incident, now, max_age_days)
+        self.stats["searches"] += 1
+        cap = self.max_shards if max_shards is None else max_shards
+        if cap is not None and len(keys) > cap:
+            self.stats["shards_skipped"] += len(keys) - cap
+            keys = keys[:cap]
+        if not keys:
+            return ([], []) if return_distance else []
+        q_vec = normalize(self.model.embed_query(query))
+        oldest = now - max_age_days * DAY if max_age_days is not None else None
+        ranked: List[Tuple[float, float, dict]] = []  # (score, similarity, record), best first
+        keep = len(keys) <= self.max_open
+        for n, (key, newest) in enumerate(keys):
+            # shards are newest first and similarity is at most 1, so an older shard scores at most
+            # its recency weight; once k hits beat that, nothing older can make the top k
+            if len(ranked) >= top_k and self.policy.weight(now - newest) * 1.0 <= ranked[top_k - 1][0]:
+                self.stats["shards_skipped"] += len(keys) - n
+                break
+            with self._use(key, keep=keep) as shard:
+                hits = shard.search_vector(q_vec, top_k)
+            self.stats["shard_searches"] += 1
+            for _, record, sim in hits:
+                t = record.get("t", now)
+                if sim < min_similarity or self.policy.expired(t, now) or (oldest is not None and t < oldest):
+                    continue
+                ranked.append((sim * self.policy.weight(now - t), sim, record))
+            ranked.sort(key=lambda h: h[0], reverse=True)
+            del ranked[top_k:]
+        results = [r for _, _, r in ranked]
+        sims = [s for _, s, _ in ranked]
+        return (results, sims) if return_distance else results
+
+    def records(self, since_seq: int = 0) -> Iterator[dict]:
+        """Stored rows numbered after since_seq, shard by shard."""
+        with self._lock:
+            keys = [k for k, e in self.shards.items() if e["max_seq"] > since_seq]
+        for key in keys:
+            with self._use(key) as shard:
+                with shard._lock:
+                    found = [r for i, r in enumerate(shard.store)
+                             if r.get("seq", 0) > since_seq and i not in shard.deleted]
+            yield from found
+
+    # ---------- retention ----------
+    def maintain(self) -> dict:
+        """Apply the retention policy now: drop expired shards, delete expired and excess rows, vacuum."""
+        with self._lock:
+            if self._maintaining:
+                return {}
+            self._maintaining = True
+        done = {"shards_dropped": 0, "deleted": 0, "vacuumed": 0}
+        try:
+            now = self.clock()
+            policy = self.policy
+            with self._lock:
+                entries = list(self.shards.items())
+            for key, entry in entries:
+                if entry["max_t"] is None or policy.expired(entry["max_t"], now):
+                    done["shards_dropped"] += self._drop(key)
+                    continue
+                over = policy.max_rows is not None and entry["rows"] - entry["deleted"] > policy.max_rows
+                if not over and not policy.expired(entry["min_t"], now):
+                    continue
+                with self._use(key) as shard:
+                    with shard._lock:
+                        live = sorted((r.get("t", now), i) for i, r in enumerate(shard.store)
+                                      if i not in shard.deleted)
+                    doomed = [i for t, i in live if policy.expired(t, now)]
+                    excess = len(live) - len(doomed) - (policy.max_rows or len(live))
+                    if excess > 0:
+                        doomed += [i for _, i in live[len(doomed):len(doomed) + excess]]
+                    done["deleted"] += shard.delete(doomed)
+                    if len(shard.deleted) >= policy.vacuum_ratio * max(1, len(shard.store)):
+                        done["vacuumed"] += shard.vacuum()
+                    with self._lock:
+                        self._refresh(key, shard, full=True)
+                with self._lock:
+                    entry = self.shards.get(key)
+                if entry is not None and entry["max_t"] is None:
+                    done["shards_dropped"] += self._drop(key)
+            self.stats["maintenance"] += 1
+            self._save_manifest()
+        finally:
+            self._maintaining = False
+        return done
+
+    def _drop(self, key: str) -> bool:
+        """Remove a shard and its files; False (and nothing done) while it is in use."""
+        with self._lock:
+            if self._pins.get(key):
+                return False  # in use; the next pass gets it
+            if key in self._open:
+                self._close_shard(key)
+            self.shards.pop(key, None)
+            self.stats["shards_dropped"] += 1
+        shutil.rmtree(self.shards_dir / key, ignore_errors=True)
+        return True
+
+    # ---------- maintenance ----------
+    def compact(self, background: bool = True):
+        with self._lock:
+            shards = list(self._open.values())
+        for shard in shards:
+            shard.compact(background=background)
+        self._save_manifest()
+
+    def rebuild(self, index_type: Optional[str] = None, background: bool = False, **index_params):
+        """Rebuild every shard's index (see VectorMemory.rebuild); new shards use the same type."""
+        if index_type is not None:
+            self.index_type = index_type
+        self.index_params.update(index_params)
+        with self._lock:
+            keys = list(self.shards)
+        for key in keys:
+            with self._use(key) as shard:
+                shard.rebuild(index_type, background=background, **index_params)
+
+    def close(self):
+        with self._lock:
+            for key in list(self._open):
+                self._close_shard(key)
+        self._save_manifest()
+
+    @property
+    def io(self) -> dict:
+        """Store I/O summed over all shards opened so far, plus the sharding counters."""
+        with self._lock:
+            total = dict(self._closed_io)
+            for shard in self._open.values():
+                for name, value in shard.io.items():
+                    total[name] = total.get(name, 0) + value
+        return {**total, **self.stats}
+
+    def report(self) -> dict:
+        now = self.clock()
+        with self._lock:
+            entries = list(self.shards.values())
+            opened = len(self._open)
+        oldest = min((e["min_t"] for e in entries if e["min_t"] is not None), default=None)
+        return {"shards": len(entries), "open": opened,
+                "rows": sum(e["rows"] - e["deleted"] for e in entries),
+                "deleted": sum(e["deleted"] for e in entries),
+                "oldest_days": None if oldest is None else round((now - oldest) / DAY, 1),
+                **{k: self.stats[k]
+                   for k in ("searches", "shard_searches", "shards_skipped", "shard_loads", "shards_dropped")}}
+
+    # ---------- migration ----------
+    def _migrate_flat(self):
+        """Move an unsharded store in persist_dir into shards, keeping its row order."""
+        if not ((self.persist_dir / "records.jsonl").exists() or (self.persist_dir / "store.json").exists()):
+            return
+        flat = VectorMemory(dim=self.dim, persist_dir=self.persist_dir, embedder=self._embedder, sync=False)
+        live = [i for i in range(len(flat.store)) if i not in flat.deleted]
+        vectors = flat._read_vectors(0, len(flat.store))
+        flat.close()
+        now = self.clock()
+        batch = 4096
+        for start in range(0, len(live), batch):
+            rows = live[start:start + batch]
+            # rows stored before timestamps existed count as new, rather than all expiring at once
+            self.add_many([flat.store[i].get("text", "") for i in rows],
+                          [flat.store[i].get("incident", "unknown") for i in rows],
+                          vectors=vectors[rows],
+                          meta=[{**flat.store[i], "t": record_time(flat.store[i], now)} for i in rows])
+        self.compact(background=False)
+        for path in [self.persist_dir / n for n in ("records.jsonl", "vectors.f32", "deleted.i64")] + \
+                list(self.persist_dir.glob("faiss-*.index")):
+            if path.exists():
+                path.rename(path.with_name(path.name + ".migrated"))
+        print(f"[Vector] migrated {len(live)} rows into {len(self.shards)} shards")
+
+
+_instances: Dict[Path, ShardedVectorMemory] = {}
+_instances_lock = threading.Lock()
+
+def get_vector_memory(persist_dir="memory_store", index_type: Optional[str] = None) -> ShardedVectorMemory:
+    """One store per directory, so components never clobber each other's files."""
+    key = Path(persist_dir).resolve()
+    with _instances_lock:
+        if key not in _instances:
+            # RESCUEHUB_VECTOR_INDEX overrides the type the store was rebuilt as
+            index_type = index_type or os.getenv("RESCUEHUB_VECTOR_INDEX")
+            _instances[key] = ShardedVectorMemory(persist_dir=persist_dir, policy=RetentionPolicy.from_env(),
+                                                  index_type=index_type)
+        return _instances[key]
+
+
+# ====== CLI: rebuild / benchmark ======
+def _percentile(values, q):
+    return float(np.percentile(np.asarray(values), q)) if len(values) else 0.0
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, index_types=INDEX_TYPES, k: int = 10, **params) -> List[dict]:
+    """Build every index type over the same vectors; report build time, latency, recall@k vs flat, size."""
+    vectors, queries = normalize(vectors), normalize(queries)
+    dim = vectors.shape[1]
+    exact = build_index("flat", dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    report = []
+    for index_type in index_types:
+        try:
+            t0 = time.perf_counter()
+            index = build_index(index_type, dim, vectors, **params)
+            index.add(vectors)
+            build_s = time.perf_counter() - t0
+        except ValueError as e:
+            report.append({"index": index_type, "error": str(e)})
+            continue
+        latencies = []
+        found = np.empty_like(truth)
+        for i in range(len(queries)):
+            t0 = time.perf_counter()
+            _, ids = index.search(queries[i:i + 1], k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            found[i] = ids[0]
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        report.append({
+            "index": index_type,
+            "build_s": round(build_s, 3),
+            "p50_ms": round(_percentile(latencies, 50), 4),
+            "p99_ms": round(_percentile(latencies, 99), 4),
+            f"recall@{k}": round(float(recall), 4),
+            "bytes": int(faiss.serialize_index(index).size),
+        })
+    return report
+
+def _synthetic(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # clustered data behaves more like sentence embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype("float32")
+    return centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Vector memory index and retention maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    rb = sub.add_parser("rebuild", help="train and rebuild the index of a store from its vector log")
+    rb.add_argument("--dir", default="memory_store")
+    rb.add_argument("--index", choices=INDEX_TYPES, required=True)
+    rb.add_argument("--nlist", type=int)
+    rb.add_argument("--nprobe", type=int)
+    rb.add_argument("--pq-m", type=int)
+    rb.add_argument("--ef-search", type=int)
+
+    rt = sub.add_parser("retain", help="apply the retention policy to a store now")
+    rt.add_argument("--dir", default="memory_store")
+    rt.add_argument("--ttl-days", type=float, help="override the TTL (0 keeps everything)")
+    rt.add_argument("--max-rows", type=int, help="override the per-shard row cap (0 = no cap)")
+
+    sh = sub.add_parser("shards", help="list a store's shards")
+    sh.add_argument("--dir", default="memory_store")
+
+    bm = sub.add_parser("bench", help="recall vs latency of every index type against exact search")
+    bm.add_argument("--dir", help="benchmark on this store's vectors instead of synthetic data")
+    bm.add_argument("--n", type=int, default=100_000)
+    bm.add_argument("--queries", type=int, default=500)
+    bm.add_argument("--k", type=int, default=10)
+    bm.add_argument("--dim", type=int, default=384)
+    bm.add_argument("--index", choices=INDEX_TYPES, nargs="*", default=list(INDEX_TYPES))
+    args = parser.parse_args()
+
+    if args.cmd == "rebuild":
+        params = {"nlist": args.nlist, "nprobe": args.nprobe, "pq_m": args.pq_m, "ef_search": args.ef_search}
+        vm = ShardedVectorMemory(persist_dir=args.dir, index_type="flat", max_open=1)
+        t0 = time.perf_counter()
+        kept_flat = 0
+        for key in list(vm.shards):
+            with vm._use(key) as shard:
+                shard.rebuild(args.index, **{k: v for k, v in params.items() if v is not None})
+                kept_flat += shard.active_index_type != args.index
+        # recorded in the manifest, so a normal start opens the shards as this type
+        vm.index_type = args.index
+        vm.index_params.update({k: v for k, v in params.items() if v is not None})
+        print(f"Rebuilt {len(vm.shards)} shards as {args.index} in {time.perf_counter() - t0:.2f}s")
+        if kept_flat:
+            print(f"{kept_flat} shards have too few vectors to train {args.index} "
+                  f"(need {min_train_rows(args.index, vm.index_params)}); kept flat.")
+        vm.close()
+        return
+
+    if args.cmd in ("retain", "shards"):
+        policy = RetentionPolicy.from_env()
+        if getattr(args, "ttl_days", None) is not None:
+            policy.ttl_days = args.ttl_days or None
+        if getattr(args, "max_rows", None) is not None:
+            policy.max_rows = args.max_rows or None
+        vm = ShardedVectorMemory(persist_dir=args.dir, policy=policy, maintain_every=0)
+        if args.cmd == "retain":
+            print(json.dumps(vm.maintain()))
+        else:
+            for key, entry in sorted(vm.shards.items()):
+                print(json.dumps({"shard": key, **{k: v for k, v in entry.items() if k != "incident"}}))
+        print(json.dumps(vm.report()))
+        vm.close()
+        return
+
+    if args.dir:
+        vm = ShardedVectorMemory(persist_dir=args.dir, maintain_every=0, max_open=1)
+        parts = []
+        for key in list(vm.shards):
+            with vm._use(key) as shard:
+                parts.append(shard._read_vectors(0, shard.index.ntotal))
+        vm.close()
+        vectors = np.concatenate(parts) if parts else np.zeros((0, vm.dim), "float32")
+    else:
+        vectors = _synthetic(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + \
+        0.05 * rng.standard_normal((args.queries, vectors.shape[1])).astype("float32")
+    for row in benchmark(vectors, queries, args.index, k=args.k):
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    _cli()